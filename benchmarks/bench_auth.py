@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Benchmark per-request auth overhead
+
+Compares a full jwt.decode (HMAC check plus claim parsing, what every
+request paid before) with verify_token once the token is in the verified
+cache, and runs verify_auth end to end the way FastAPI calls it.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+ROOT = os.path.dirname(os.path.abspath(__file__)) + "/.."
+sys.path.append(ROOT)
+sys.path.append(ROOT + "/config")
+
+import jwt
+from fastapi.security import HTTPAuthorizationCredentials
+
+from api.security import create_rahl_token, verify_token, verify_auth, keyring, settings
+
+
+class FakeRequest:
+    class state:
+        pass
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI auth benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_rahl_token()
+    _, secret = keyring.signing_key()
+
+    uncached = per_call_us(lambda: jwt.decode(token, secret, algorithms=[settings.algorithm]), args.iterations)
+    verify_token(token)
+    cached = per_call_us(lambda: verify_token(token), args.iterations)
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    loop = asyncio.new_event_loop()
+    end_to_end = per_call_us(
+        lambda: loop.run_until_complete(verify_auth(FakeRequest(), credentials)),
+        args.iterations // 10
+    )
+    loop.close()
+
+    print(f"jwt.decode (before):      {uncached:8.2f} us/request")
+    print(f"verify_token (cached):    {cached:8.2f} us/request")
+    print(f"verify_auth (end to end): {end_to_end:8.2f} us/request")
+    print(f"speedup:                  {uncached / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the HTTP API
+
+Starts the app in-process on a local port with the echo backend (a
+deterministic stub whose decode speed is set by --token-delay-ms) and a
+fresh database, then drives a weighted mix of endpoints over real HTTP.
+
+Load is either closed-loop (--concurrency clients, each sending its next
+request when the last one finishes) or open-loop (--rate requests/sec with
+Poisson arrivals, at most --concurrency in flight). Open-loop latency is
+measured from each request's scheduled arrival, so a saturated server shows
+up as queueing delay instead of a quietly lower send rate.
+
+Reports throughput and p50/p95/p99 latency per scenario, plus time to first
+token and inter-token latency for streaming ones, and writes everything to
+--json. Pass --compare with an earlier results file to print the change.
+Pass --url to load an already running server instead. The client shares the
+interpreter with an in-process server, so compare runs made the same way.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__)) + "/.."
+sys.path.append(ROOT)
+sys.path.append(ROOT + "/config")
+
+import requests
+
+SCENARIOS = (
+    "completion", "completion_stream", "chat", "chat_stream",
+    "command", "memory_get", "memory_post", "status"
+)
+DEFAULT_MIX = "completion=3,completion_stream=3,chat=2,chat_stream=2,command=1,memory_get=2,memory_post=1,status=1"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def distribution_ms(values):
+    return {
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "mean": sum(values) / len(values) * 1000 if values else 0.0,
+        "count": len(values)
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Client:
+    """One scenario request at a time over a per-thread keep-alive session"""
+
+    def __init__(self, base_url, token, args):
+        self.base_url = base_url.rstrip("/") + "/api/v1"
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.args = args
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+
+    def run(self, scenario, index):
+        """Send one request; returns status, tokens and streaming timings"""
+        return getattr(self, scenario)(index)
+
+    def _prompt(self, index):
+        return f"Request {index}: summarise the state of the realm in a few words."
+
+    def _messages(self, index):
+        return [
+            {"role": "system", "content": "You are Rahl AI, personal sovereign intelligence."},
+            {"role": "user", "content": self._prompt(index)}
+        ]
+
+    def _post(self, path, body):
+        response = self.session.post(self.base_url + path, json=body, timeout=self.args.timeout)
+        tokens = 0
+        if response.status_code == 200:
+            tokens = response.json().get("usage", {}).get("completion_tokens", 0)
+        return {"status": response.status_code, "tokens": tokens}
+
+    def _stream(self, path, body, start):
+        chunks = []
+        tokens = 0
+        with self.session.post(self.base_url + path, json=body, stream=True,
+                               timeout=self.args.timeout) as response:
+            if response.status_code == 200:
+                for line in response.iter_lines():
+                    if not line.startswith(b"data:") or line == b"data: [DONE]":
+                        continue
+                    event = json.loads(line[5:])
+                    if "usage" in event:
+                        tokens = event["usage"].get("completion_tokens", 0)
+                    else:
+                        chunks.append(time.perf_counter())
+        return {
+            "status": response.status_code,
+            # Frames coalesce tokens, so ITL is the gap between frames
+            "tokens": tokens,
+            "ttft": chunks[0] - start if chunks else None,
+            "itl": [b - a for a, b in zip(chunks, chunks[1:])]
+        }
+
+    def completion(self, index):
+        return self._post("/completions", {
+            "prompt": self._prompt(index), "max_tokens": self.args.max_tokens, "temperature": 0.7
+        })
+
+    def completion_stream(self, index):
+        start = time.perf_counter()
+        return self._stream("/completions", {
+            "prompt": self._prompt(index), "max_tokens": self.args.max_tokens,
+            "temperature": 0.7, "stream": True
+        }, start)
+
+    def chat(self, index):
+        return self._post("/chat/completions", {"messages": self._messages(index)})
+
+    def chat_stream(self, index):
+        start = time.perf_counter()
+        return self._stream("/chat/completions", {"messages": self._messages(index), "stream": True}, start)
+
+    def command(self, index):
+        response = self.session.post(self.base_url + "/command", json={
+            "command": "analyze strategic advantage",
+            "parameters": {"request": index},
+            "priority": 1
+        }, timeout=self.args.timeout)
+        return {"status": response.status_code, "tokens": 0}
+
+    def memory_get(self, index):
+        context_id = f"bench-{index % self.args.contexts}"
+        response = self.session.get(f"{self.base_url}/memory/{context_id}", timeout=self.args.timeout)
+        return {"status": response.status_code, "tokens": 0}
+
+    def memory_post(self, index):
+        context_id = f"bench-{index % self.args.contexts}"
+        response = self.session.post(f"{self.base_url}/memory/{context_id}", json={
+            "memory": [{"request": index, "text": self._prompt(index)}]
+        }, timeout=self.args.timeout)
+        return {"status": response.status_code, "tokens": 0}
+
+    def status(self, index):
+        response = self.session.get(self.base_url + "/status", timeout=self.args.timeout)
+        return {"status": response.status_code, "tokens": 0}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, scenario, latency, result, lag=0.0):
+        with self._lock:
+            self.samples.append((scenario, latency, result, lag))
+
+
+def timed_request(client, recorder, scenario, index, scheduled=None):
+    start = time.perf_counter()
+    try:
+        result = client.run(scenario, index)
+    except requests.RequestException as e:
+        result = {"status": type(e).__name__, "tokens": 0}
+    end = time.perf_counter()
+    if scheduled is None:
+        recorder.record(scenario, end - start, result)
+    else:
+        # Open loop: latency counts from the arrival, including client-side queueing
+        if result.get("ttft") is not None:
+            result["ttft"] += start - scheduled
+        recorder.record(scenario, end - scheduled, result, start - scheduled)
+
+
+def pick(mix, rng):
+    names = list(mix)
+    return rng.choices(names, weights=[mix[name] for name in names])[0]
+
+
+def run_closed(client, mix, args, seed):
+    recorder = Recorder()
+    counter = iter(range(10 ** 12))
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            with lock:
+                index = next(counter)
+            if args.requests and index >= args.requests:
+                return
+            timed_request(client, recorder, pick(mix, rng), index)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - start
+
+
+def run_open(client, mix, args, seed):
+    recorder = Recorder()
+    rng = random.Random(seed)
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    start = time.perf_counter()
+    arrival = start
+    index = 0
+    while True:
+        arrival += rng.expovariate(args.rate)
+        if arrival - start >= args.duration or (args.requests and index >= args.requests):
+            break
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(timed_request, client, recorder, pick(mix, rng), index, arrival)
+        index += 1
+    pool.shutdown(wait=True)
+    return recorder, time.perf_counter() - start
+
+
+def summarize(samples, wall):
+    latencies = [latency for _, latency, _, _ in samples]
+    ok = [s for s in samples if s[2]["status"] == 200]
+    tokens = sum(result["tokens"] for _, _, result, _ in ok)
+    statuses = {}
+    for _, _, result, _ in samples:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "status": statuses,
+        "throughput_rps": len(ok) / wall if wall else 0.0,
+        "tokens_per_sec": tokens / wall if wall else 0.0,
+        "latency_ms": distribution_ms(latencies),
+        "max_send_lag_ms": max((lag for _, _, _, lag in samples), default=0.0) * 1000
+    }
+    ttft = [result["ttft"] for _, _, result, _ in ok if result.get("ttft") is not None]
+    if ttft:
+        summary["ttft_ms"] = distribution_ms(ttft)
+        summary["itl_ms"] = distribution_ms([gap for _, _, result, _ in ok for gap in result.get("itl", ())])
+    return summary
+
+
+def report(results):
+    print(f"\n{'scenario':<18} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'ttft p50':>9} {'itl p50':>9}")
+    rows = dict(results["scenarios"], total=results["summary"])
+    for name, row in rows.items():
+        ttft = f"{row['ttft_ms']['p50']:>9.1f}" if "ttft_ms" in row else f"{'-':>9}"
+        itl = f"{row['itl_ms']['p50']:>9.2f}" if "itl_ms" in row else f"{'-':>9}"
+        latency = row["latency_ms"]
+        print(f"{name:<18} {row['requests']:>6} {row['errors']:>5} {row['throughput_rps']:>8.1f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {ttft} {itl}")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nchange vs {baseline_path} ({baseline['meta'].get('commit') or 'unknown commit'})")
+    print(f"{'scenario':<18} {'req/s':>9} {'p50':>9} {'p99':>9} {'ttft p50':>9}")
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:>+8.1f}%" if old else f"{'-':>9}"
+
+    rows = dict(results["scenarios"], total=results["summary"])
+    old_rows = dict(baseline["scenarios"], total=baseline["summary"])
+    for name, row in rows.items():
+        old = old_rows.get(name)
+        if old is None:
+            continue
+        ttft = (change(row["ttft_ms"]["p50"], old["ttft_ms"]["p50"])
+                if "ttft_ms" in row and "ttft_ms" in old else f"{'-':>9}")
+        print(f"{name:<18} {change(row['throughput_rps'], old['throughput_rps'])} "
+              f"{change(row['latency_ms']['p50'], old['latency_ms']['p50'])} "
+              f"{change(row['latency_ms']['p99'], old['latency_ms']['p99'])} {ttft}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    """Run the app on a background thread; returns its base URL and a stop function"""
+    # Settings are read on first import, so configure the stub backend first,
+    # and run from an empty directory so no .env or existing database is used
+    os.environ["MODEL_BACKEND"] = "echo"
+    os.environ["ECHO_TOKEN_DELAY_MS"] = str(args.token_delay_ms)
+    os.environ.setdefault("DEBUG", "false")
+    workdir = tempfile.mkdtemp(prefix="rahl-bench-")
+    os.chdir(workdir)
+
+    import logging
+    import uvicorn
+    from main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False))
+    thread = threading.Thread(target=server.run, name="rahl-bench-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("Server failed to start")
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI end-to-end load test")
+    parser.add_argument("--url", default=None, help="load this server instead of starting one")
+    parser.add_argument("--token", default=os.environ.get("RAHL_TOKEN"), help="bearer token for --url")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... of " + ",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16, help="clients, or max in flight with --rate")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop arrivals/sec (0 for closed loop)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent and discarded first")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--token-delay-ms", type=float, default=2.0, help="echo backend time per token")
+    parser.add_argument("--contexts", type=int, default=32, help="distinct memory contexts")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    parser.add_argument("--compare", default=None, help="results file to compare against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    # The in-process server changes directory
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+    stop = None
+    if args.url:
+        if not args.token:
+            raise SystemExit("--url needs --token or RAHL_TOKEN")
+        base_url, token = args.url, args.token
+    else:
+        base_url, stop = start_server(args)
+        from api.security import create_rahl_token, verify_token, create_access_token
+        # Endpoints read the user from the "id" claim
+        claims = {key: value for key, value in verify_token(create_rahl_token()).items() if key != "exp"}
+        token = create_access_token({**claims, "id": claims["user_id"]})
+
+    client = Client(base_url, token, args)
+    try:
+        warmup = Recorder()
+        for index in range(args.warmup):
+            timed_request(client, warmup, SCENARIOS[index % len(SCENARIOS)], index)
+
+        mode = f"open loop at {args.rate:g} req/s" if args.rate > 0 else "closed loop"
+        print(f"Running {mode}, concurrency {args.concurrency}, for {args.duration:g}s against {base_url}")
+        run = run_open if args.rate > 0 else run_closed
+        recorder, wall = run(client, mix, args, args.seed)
+    finally:
+        if stop:
+            stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "config": {**{k: v for k, v in vars(args).items() if k != "token"}, "mix": mix, "server": "external" if args.url else "in-process echo"},
+        "duration": wall,
+        "summary": summarize(recorder.samples, wall),
+        "scenarios": {
+            name: summarize([s for s in recorder.samples if s[0] == name], wall)
+            for name in mix if any(s[0] == name for s in recorder.samples)
+        }
+    }
+
+    report(results)
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
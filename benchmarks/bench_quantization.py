@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark full-precision vs int8 dynamically quantized CPU inference
+
+Each mode runs in its own subprocess so peak RSS is measured cleanly. Both
+modes generate for the same prompts through BatchScheduler, the serving
+path, and report single-request latency, batched throughput and RSS. Uses a
+small randomly initialised GPT-2 by default; pass --model-path to benchmark
+real weights.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import subprocess
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+PROMPTS = [
+    "Summarise the state of the realm in three sentences.",
+    "List the duties of the sovereign's council.",
+    "Describe the northern border fortifications.",
+    "Draft a decree concerning the grain reserves."
+]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_mode(args) -> dict:
+    import torch
+    # Imported before the RSS baseline so model_rss_mb counts weights, not libraries
+    import transformers
+    from bench_scheduler import load_model, percentile
+    from core.scheduler import BatchScheduler
+    from models.backends.cpu import configure_threads, quantize
+
+    threads = configure_threads(args.threads, args.interop_threads)
+    baseline_rss = rss_mb()
+    model, tokenizer = load_model(args.model_path)
+    start = time.perf_counter()
+    model = quantize(model, args.mode)
+    quantize_s = time.perf_counter() - start
+    # Peak, so int8 includes the full-precision copy held while quantizing
+    loaded_rss = rss_mb()
+
+    scheduler = BatchScheduler(model, tokenizer, torch.device("cpu"), max_batch_size=len(PROMPTS), max_wait_ms=5.0)
+    scheduler.start()
+    prompts = [tokenizer.encode(p) for p in PROMPTS]
+
+    # Warm up kernels and allocator
+    scheduler.generate(prompts[0], max_tokens=4, temperature=0)
+
+    latencies = []
+    for _ in range(args.repeats):
+        for ids in prompts:
+            start = time.perf_counter()
+            scheduler.generate(ids, max_tokens=args.max_tokens, temperature=0)
+            latencies.append(time.perf_counter() - start)
+
+    tokens = [0]
+    lock = threading.Lock()
+
+    def worker(ids):
+        for _ in range(args.repeats):
+            result = scheduler.generate(ids, max_tokens=args.max_tokens, temperature=0)
+            with lock:
+                tokens[0] += result["completion_tokens"]
+
+    workers = [threading.Thread(target=worker, args=(ids,)) for ids in prompts]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - start
+    scheduler.stop()
+
+    return {
+        "mode": args.mode,
+        **threads,
+        "quantize_s": quantize_s,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "tokens_per_sec": tokens[0] / wall if wall else 0.0,
+        "model_rss_mb": loaded_rss - baseline_rss,
+        "peak_rss_mb": rss_mb()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI quantization benchmark")
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--modes", default="none,int8")
+    parser.add_argument("--mode", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--interop-threads", type=int, default=0)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    results = []
+    passthrough = [a for a in sys.argv[1:] if not a.startswith("--json") and a != args.json]
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *passthrough, "--mode", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':>6} {'threads':>8} {'p50 ms':>10} {'p99 ms':>10} {'tok/s':>10} {'model MB':>10} {'peak MB':>10}")
+    for row in results:
+        print(f"{row['mode']:>6} {row['num_threads']:>8} {row['p50_ms']:>10.1f} {row['p99_ms']:>10.1f} "
+              f"{row['tokens_per_sec']:>10.1f} {row['model_rss_mb']:>10.1f} {row['peak_rss_mb']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
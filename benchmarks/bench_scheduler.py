@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Benchmark the continuous-batching scheduler
+
+Drives BatchScheduler with N concurrent callers and reports tokens/sec and
+p50/p99 latency, comparing max_batch_size=1 (the old one-generate-per-call
+path) against batched decoding. Uses a small randomly initialised GPT-2 by
+default so it runs anywhere; pass --model-path to benchmark real weights.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import torch
+
+from core.scheduler import BatchScheduler
+
+
+class ByteTokenizer:
+    """Minimal byte-level tokenizer for the random benchmark model"""
+
+    eos_token_id = 256
+    pad_token_id = 256
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(i for i in ids if i < 256).decode("utf-8", errors="ignore")
+
+
+def load_model(model_path):
+    if model_path:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+        return model, tokenizer
+
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(0)
+    config = GPT2Config(
+        vocab_size=257, n_positions=1024, n_embd=256, n_layer=4, n_head=4,
+        bos_token_id=256, eos_token_id=256
+    )
+    return GPT2LMHeadModel(config).eval(), ByteTokenizer()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def run_level(scheduler, tokenizer, concurrency, requests_per_worker, max_tokens):
+    latencies = []
+    tokens = [0]
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        for i in range(requests_per_worker):
+            prompt = f"Request {worker_id}-{i}: summarise the state of the realm."
+            start = time.perf_counter()
+            result = scheduler.generate(tokenizer.encode(prompt), max_tokens=max_tokens, temperature=0.7)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                tokens[0] += result["completion_tokens"]
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "tokens": tokens[0],
+        "tokens_per_sec": tokens[0] / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI scheduler benchmark")
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--requests", type=int, default=4, help="requests per worker")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model_path)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = {}
+
+    for label, batch_size in (("serial", 1), ("batched", args.batch_size)):
+        scheduler = BatchScheduler(model, tokenizer, torch.device("cpu"),
+                                   max_batch_size=batch_size, max_wait_ms=args.wait_ms)
+        scheduler.start()
+        results[label] = []
+        print(f"\n{label} (max_batch_size={batch_size})")
+        print(f"{'conc':>5} {'reqs':>5} {'tok/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for concurrency in levels:
+            row = run_level(scheduler, tokenizer, concurrency, args.requests, args.max_tokens)
+            results[label].append(row)
+            print(f"{row['concurrency']:>5} {row['requests']:>5} {row['tokens_per_sec']:>10.1f} "
+                  f"{row['p50_ms']:>10.1f} {row['p99_ms']:>10.1f}")
+        scheduler.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
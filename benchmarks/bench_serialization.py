@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Benchmark JSON and MessagePack serialization on large memory contexts
+
+Builds a context of chat-style memory entries (the GET /memory payload at
+memory_size) and times, per codec: encoding and decoding every entry, a
+SQLite write and read of the entries the way MemorySystem stores them, and
+rendering the response body with the old JSONResponse (after
+jsonable_encoder, as FastAPI did for returned dicts) against
+TimedJSONResponse. MessagePack is skipped when the package is missing.
+"""
+import os
+import sys
+import time
+import json
+import random
+import sqlite3
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../config")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api.instrumentation import TimedJSONResponse
+from core import codecs
+
+WORDS = ("the realm answers to lord rahl and every order is carried out without question "
+         "treasury dragon wizard mountain council émissaire 북쪽 守卫").split()
+
+
+class StdlibCodec:
+    """What MemorySystem used before: json.dumps / json.loads"""
+
+    name = "stdlib json"
+
+    def dumps(self, value):
+        return json.dumps(value)
+
+    def loads(self, blob):
+        return json.loads(blob)
+
+
+class Codec:
+    def __init__(self, codec):
+        self.codec = codec
+        self.name = codec.name
+
+    def dumps(self, value):
+        return self.codec.dumps(value)
+
+    def loads(self, blob):
+        return codecs.loads(blob)
+
+
+def make_entry(rng, index):
+    return {
+        "role": rng.choice(("user", "assistant", "system")),
+        "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+        "timestamp": f"2026-01-{1 + index % 28:02d}T{index % 24:02d}:{index % 60:02d}:00",
+        "metadata": {
+            "tokens": rng.randint(10, 400),
+            "score": rng.random(),
+            "tags": rng.sample(WORDS, 3),
+            "source": {"channel": "api", "request": index}
+        }
+    }
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def bench_codec(codec, entries, repeat):
+    blobs = [codec.dumps(entry) for entry in entries]
+    size = sum(len(blob) for blob in blobs)
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE context_entries (seq INTEGER PRIMARY KEY, entry TEXT)")
+
+    def write():
+        conn.execute("DELETE FROM context_entries")
+        conn.executemany("INSERT INTO context_entries (entry) VALUES (?)",
+                         [(codec.dumps(entry),) for entry in entries])
+
+    def read():
+        return [codec.loads(entry) for (entry,) in conn.execute("SELECT entry FROM context_entries ORDER BY seq")]
+
+    write()
+    assert read() == entries
+    return {
+        "encode_ms": timeit(lambda: [codec.dumps(entry) for entry in entries], repeat),
+        "decode_ms": timeit(lambda: [codec.loads(blob) for blob in blobs], repeat),
+        "sqlite_write_ms": timeit(write, repeat),
+        "sqlite_read_ms": timeit(read, repeat),
+        "bytes": size
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI serialization benchmark")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    entries = [make_entry(rng, i) for i in range(args.entries)]
+
+    candidates = [StdlibCodec(), Codec(codecs.JSONCodec())]
+    try:
+        candidates.append(Codec(codecs.MsgpackCodec()))
+    except ImportError:
+        print("msgpack not installed; skipping it")
+
+    results = {"config": vars(args), "storage": {}, "response": {}}
+    print(f"{args.entries} entries")
+    print(f"{'codec':>12} {'encode ms':>10} {'decode ms':>10} {'db write':>10} {'db read':>10} {'MB':>8}")
+    for codec in candidates:
+        row = bench_codec(codec, entries, args.repeat)
+        results["storage"][codec.name] = row
+        print(f"{codec.name:>12} {row['encode_ms']:>10.1f} {row['decode_ms']:>10.1f} "
+              f"{row['sqlite_write_ms']:>10.1f} {row['sqlite_read_ms']:>10.1f} {row['bytes'] / 1e6:>8.2f}")
+
+    body = {"context_id": "bench", "memory": entries, "total": len(entries), "offset": 0,
+            "limit": None, "preferences": {f"key_{i}": i for i in range(50)}}
+    results["response"] = {
+        "JSONResponse + jsonable_encoder": timeit(lambda: JSONResponse(jsonable_encoder(body)), args.repeat),
+        "TimedJSONResponse": timeit(lambda: TimedJSONResponse(body), args.repeat)
+    }
+    print()
+    for name, ms in results["response"].items():
+        print(f"{name:>32} {ms:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Benchmark speculative decoding against plain decoding
+
+Generates the same prompts one at a time through BatchScheduler (one main
+model pass per token) and through SpeculativeDecoder at several lookahead
+lengths, reporting tokens/sec, acceptance rate and tokens per main-model
+pass. Pass --model-path and --draft-path to measure real weights; without
+them a random GPT-2 drafts for a larger random GPT-2, which shows the cost
+of rejected drafts rather than a realistic speedup.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import torch
+
+from core.scheduler import BatchScheduler
+from core.speculative import SpeculativeDecoder
+from bench_scheduler import load_model
+
+
+def load_draft(draft_path):
+    if draft_path:
+        from transformers import AutoModelForCausalLM
+        return AutoModelForCausalLM.from_pretrained(draft_path).eval()
+
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(1)
+    config = GPT2Config(
+        vocab_size=257, n_positions=1024, n_embd=64, n_layer=1, n_head=2,
+        bos_token_id=256, eos_token_id=256
+    )
+    return GPT2LMHeadModel(config).eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI speculative decoding benchmark")
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--draft-path", default=None)
+    parser.add_argument("--lookahead", default="2,4,8")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model_path)
+    draft = load_draft(args.draft_path)
+    device = torch.device("cpu")
+    prompts = [tokenizer.encode(f"Request {i}: summarise the state of the realm.") for i in range(args.requests)]
+
+    def run(generate):
+        tokens = 0
+        start = time.perf_counter()
+        for input_ids in prompts:
+            tokens += generate(input_ids)["completion_tokens"]
+        return tokens / (time.perf_counter() - start)
+
+    scheduler = BatchScheduler(model, tokenizer, device, max_batch_size=1)
+    scheduler.start()
+    baseline = run(lambda ids: scheduler.generate(ids, max_tokens=args.max_tokens, temperature=args.temperature))
+    scheduler.stop()
+
+    results = {"plain": {"tokens_per_sec": baseline}, "speculative": []}
+    print(f"{'lookahead':>9} {'tok/s':>10} {'speedup':>8} {'accept':>7} {'tok/pass':>9}")
+    print(f"{'plain':>9} {baseline:>10.1f} {1.0:>8.2f} {'-':>7} {1.0:>9.2f}")
+    for lookahead in (int(k) for k in args.lookahead.split(",")):
+        decoder = SpeculativeDecoder(model, draft, device, tokenizer.eos_token_id, lookahead=lookahead)
+        rate = run(lambda ids: decoder.generate(ids, max_tokens=args.max_tokens, temperature=args.temperature))
+        stats = decoder.get_stats()
+        results["speculative"].append({"lookahead": lookahead, "tokens_per_sec": rate, **stats})
+        print(f"{lookahead:>9} {rate:>10.1f} {rate / baseline:>8.2f} {stats['acceptance_rate']:>7.2f} "
+              f"{stats['tokens_per_step']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Benchmark SSE framing of streamed responses
+
+Runs N concurrent token streams on one event loop and encodes them the old
+way (json.dumps and an f-string per chunk) and with SSEEncoder, with and
+without frame coalescing. A thread stands in for the scheduler, pushing one
+token to every stream per decode step into real TokenStreams, so the
+numbers include wakeups and detokenizing but not generation. Reports CPU
+time per token, frames and bytes sent, and token throughput.
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import asyncio
+import threading
+from concurrent import futures
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from core.sse import SSEEncoder
+from core.streaming import TokenStream
+
+WORDS = "the realm answers to lord rahl and every order is carried out without question".split()
+
+
+class WordTokenizer:
+    """One token per word"""
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(WORDS[i] + " " for i in ids)
+
+
+class Request:
+    def __init__(self):
+        self.future = futures.Future()
+
+    def cancel(self):
+        self.future.cancel()
+
+
+def produce(streams, tokens, step_ms):
+    """Push one token per stream every step, like a batched decode step"""
+    for i in range(tokens):
+        for stream in streams:
+            stream.push(i % len(WORDS))
+        time.sleep(step_ms / 1000)
+    for stream in streams:
+        stream.request.future.set_result({"prompt_tokens": 16, "completion_tokens": tokens})
+
+
+async def legacy_frames(stream):
+    async for chunk in stream:
+        yield f"data: {json.dumps({'text': chunk})}\n\n".encode("utf-8")
+
+
+async def drain(frames):
+    count = size = 0
+    async for frame in frames:
+        count += 1
+        size += len(frame)
+    return count, size
+
+
+async def run(encode, count, tokens, step_ms):
+    loop = asyncio.get_running_loop()
+    streams = []
+    for _ in range(count):
+        stream = TokenStream(WordTokenizer(), loop=loop)
+        stream.attach(Request())
+        streams.append(stream)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    producer = threading.Thread(target=produce, args=(streams, tokens, step_ms))
+    producer.start()
+    totals = await asyncio.gather(*(drain(encode(stream)) for stream in streams))
+    producer.join()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    total_tokens = count * tokens
+    return {
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "tokens_per_sec": total_tokens / wall,
+        "cpu_us_per_token": cpu / total_tokens * 1e6,
+        "frames": sum(frames for frames, _ in totals),
+        "bytes": sum(size for _, size in totals)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rahl AI SSE framing benchmark")
+    parser.add_argument("--streams", type=int, default=1000)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--step-ms", type=float, default=5.0, help="time between decode steps")
+    parser.add_argument("--frame-chars", type=int, default=512)
+    parser.add_argument("--frame-ms", type=float, default=25.0)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    encoders = {
+        "legacy": legacy_frames,
+        "sse": SSEEncoder("text", frame_chars=0, frame_ms=0).encode,
+        "sse-coalesced": SSEEncoder("text", frame_chars=args.frame_chars, frame_ms=args.frame_ms).encode
+    }
+
+    print(f"{args.streams} streams x {args.tokens} tokens, {args.step_ms} ms per step")
+    print(f"{'encoder':>14} {'tok/s':>12} {'cpu us/tok':>11} {'frames':>9} {'MB':>8} {'wall s':>8}")
+    results = {"config": vars(args), "encoders": {}}
+    for name, encode in encoders.items():
+        result = asyncio.run(run(encode, args.streams, args.tokens, args.step_ms))
+        results["encoders"][name] = result
+        print(f"{name:>14} {result['tokens_per_sec']:>12.0f} {result['cpu_us_per_token']:>11.2f} "
+              f"{result['frames']:>9} {result['bytes'] / 1e6:>8.2f} {result['wall_s']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
 from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional, Dict, Any
-import json
 import asyncio
+import threading
 
-from api.security import get_current_user
+import orjson
+
+from api.security import get_current_user, get_auth_stats
+from api.instrumentation import TimedJSONResponse
+from api.serialization import ORJSONRoute
+from core.jobs import ACTIVE_STATUSES
 from core.processor import CommandProcessor
+from core.sse import DONE_FRAME, SSEEncoder
 from core.memory import MemorySystem
 from models.rahl_model import RahlModel
+from config.settings import get_settings
+
+settings = get_settings()
+
+router = APIRouter(default_response_class=TimedJSONResponse, route_class=ORJSONRoute)
+
+completion_frames = SSEEncoder("text", frame_chars=settings.stream_frame_chars, frame_ms=settings.stream_frame_ms)
+chat_frames = SSEEncoder("delta", frame_chars=settings.stream_frame_chars, frame_ms=settings.stream_frame_ms)
+
+def cache_mode(request: Request) -> str:
+    """Response cache policy asked for by the client
+    
+    ``Cache-Control: no-store`` (or ``X-Rahl-Cache: bypass``) skips the
+    cache; ``Cache-Control: no-cache`` (or ``X-Rahl-Cache: refresh``)
+    generates a fresh answer and replaces the cached one.
+    """
+    control = request.headers.get("cache-control", "").lower()
+    override = request.headers.get("x-rahl-cache", "").lower()
+    if "no-store" in control or override == "bypass":
+        return "bypass"
+    if "no-cache" in control or override == "refresh":
+        return "refresh"
+    return "use"
 
-router = APIRouter()
+async def open_sse(engine, frames: SSEEncoder, open_stream, **kwargs) -> StreamingResponse:
+    """Open a stream with open_stream(**kwargs) and send it as server-sent events
+    
+    The stream holds a slot of the executor's stream limiter until it ends,
+    so too many open streams get a 429, and it is cancelled once
+    request_timeout has passed.
+    """
+    limiter = engine.executor.streams
+    started = limiter.acquire()
+    try:
+        stream = await engine.executor.inference.run(open_stream, loop=asyncio.get_running_loop(), **kwargs)
+    except BaseException:
+        limiter.release(started)
+        raise
+    
+    timed_out, released = [], []
+    def release():
+        # Also reached from the timer, for responses that never start
+        if not released:
+            released.append(True)
+            limiter.release(started, timed_out=bool(timed_out))
+    def expire():
+        timed_out.append(True)
+        stream.cancel()
+        release()
+    timer = asyncio.get_running_loop().call_later(limiter.timeout, expire) if limiter.timeout else None
+    
+    async def stream_generator():
+        # Starlette cancels this generator when the client disconnects,
+        # which cancels the sequence at the scheduler's next step
+        try:
+            async for frame in frames.encode(stream):
+                if frame is DONE_FRAME and timed_out:
+                    yield frames.error_frame(f"Stream timed out after {limiter.timeout:.1f}s")
+                yield frame
+        finally:
+            if timer:
+                timer.cancel()
+            stream.cancel()
+            release()
+    
+    return StreamingResponse(
+        stream_generator(),
+        media_type="text/event-stream"
+    )
 
 class CompletionRequest(BaseModel):
     prompt: str
@@ -41,35 +114,35 @@ class TrainingData(BaseModel):
 @router.post("/completions")
 async def create_completion(
     request: CompletionRequest,
+    response: Response,
     current_user: Dict = Depends(get_current_user),
     rahl_request: Request = None
 ):
-    processor = rahl_request.app.state.rahl_engine.processor
+    engine = rahl_request.app.state.rahl_engine
+    processor = engine.processor
     
     if request.stream:
-        async def stream_generator():
-            for chunk in processor.stream_completion(
-                prompt=request.prompt,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-                user_id=current_user["id"],
-                context_id=request.context_id
-            ):
-                yield f"data: {json.dumps({'text': chunk})}\n\n"
-                await asyncio.sleep(0.01)
-        
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/event-stream"
+        return await open_sse(
+            engine,
+            completion_frames,
+            processor.open_stream,
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            user_id=current_user["id"],
+            context_id=request.context_id
         )
     
-    result = processor.process_completion(
+    result = await engine.executor.inference.run(
+        processor.process_completion,
         prompt=request.prompt,
         max_tokens=request.max_tokens,
         temperature=request.temperature,
         user_id=current_user["id"],
-        context_id=request.context_id
+        context_id=request.context_id,
+        cache_mode=cache_mode(rahl_request)
     )
+    response.headers["X-Rahl-Cache"] = result["cache"]
     
     return {
         "id": f"comp_{current_user['id']}_{hash(request.prompt)}",
@@ -85,34 +158,124 @@ async def create_completion(
         "usage": result.get("usage", {})
     }
 
+@router.post("/completions/batch")
+async def create_batch_completion(
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    """Many completions in one request, streamed back as NDJSON
+    
+    The body is a JSON array of completion requests, or one request per
+    line (JSONL). Results are written as they finish, one JSON object per
+    line with the item's ``index``; an item that is invalid or fails gets
+    an ``error`` instead of ``text`` and does not affect the others. A JSONL
+    line that is not JSON counts as an invalid item.
+    """
+    body = await rahl_request.body()
+    entries, unparsable = [], {}
+    if body.lstrip().startswith(b"["):
+        try:
+            entries = orjson.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+    else:
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(orjson.loads(line))
+            except ValueError as e:
+                unparsable[len(entries)] = f"Invalid JSON: {e}"
+                entries.append(None)
+    if len(entries) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {settings.batch_max_items} items")
+    
+    items, invalid = [], []
+    for index, entry in enumerate(entries):
+        if index in unparsable:
+            invalid.append({"index": index, "error": unparsable[index]})
+            continue
+        try:
+            request = CompletionRequest.model_validate(entry)
+        except ValidationError as e:
+            invalid.append({"index": index, "error": str(e)})
+            continue
+        items.append({
+            "index": index,
+            "prompt": request.prompt,
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature,
+            "context_id": request.context_id
+        })
+    
+    engine = rahl_request.app.state.rahl_engine
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    # Each wave of batch_max_size sequences gets the usual request timeout
+    waves = max(1, -(-len(items) // settings.batch_max_size))
+    task = asyncio.ensure_future(engine.executor.inference.run(
+        engine.processor.process_batch,
+        items=items,
+        user_id=current_user["id"],
+        on_result=lambda result: loop.call_soon_threadsafe(results.put_nowait, result),
+        cancelled=cancelled,
+        cache_mode=cache_mode(rahl_request),
+        timeout=settings.request_timeout * waves
+    ))
+    task.add_done_callback(lambda _: results.put_nowait(None))
+    
+    # Let the pool admit or reject the batch so overload is still a 429
+    await asyncio.sleep(0)
+    if task.done() and not task.cancelled() and task.exception():
+        raise task.exception()
+    
+    async def result_generator():
+        try:
+            for result in invalid:
+                yield orjson.dumps(result) + b"\n"
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield orjson.dumps(result) + b"\n"
+            if not task.cancelled() and task.exception():
+                yield orjson.dumps({"error": str(task.exception())}) + b"\n"
+        finally:
+            # Client went away or the batch ended: drop anything still queued
+            cancelled.set()
+    
+    return StreamingResponse(result_generator(), media_type="application/x-ndjson")
+
 @router.post("/chat/completions")
 async def create_chat_completion(
     request: ChatRequest,
+    response: Response,
     current_user: Dict = Depends(get_current_user),
     rahl_request: Request = None
 ):
-    processor = rahl_request.app.state.rahl_engine.processor
+    engine = rahl_request.app.state.rahl_engine
+    processor = engine.processor
     
     if request.stream:
-        async def stream_generator():
-            for chunk in processor.stream_chat(
-                messages=[{"role": m.role, "content": m.content} for m in request.messages],
-                user_id=current_user["id"],
-                context_id=request.context_id
-            ):
-                yield f"data: {json.dumps({'delta': chunk})}\n\n"
-                await asyncio.sleep(0.01)
-        
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/event-stream"
+        return await open_sse(
+            engine,
+            chat_frames,
+            processor.open_chat_stream,
+            messages=[{"role": m.role, "content": m.content} for m in request.messages],
+            user_id=current_user["id"],
+            context_id=request.context_id
         )
     
-    result = processor.process_chat(
+    result = await engine.executor.inference.run(
+        processor.process_chat,
         messages=[{"role": m.role, "content": m.content} for m in request.messages],
         user_id=current_user["id"],
-        context_id=request.context_id
+        context_id=request.context_id,
+        cache_mode=cache_mode(rahl_request)
     )
+    response.headers["X-Rahl-Cache"] = result["cache"]
     
     return {
         "id": f"chat_{current_user['id']}_{hash(str(request.messages))}",
@@ -137,11 +300,13 @@ async def sovereign_command(
     rahl_request: Request = None
 ):
     engine = rahl_request.app.state.rahl_engine
-    result = engine.execute_command(
+    result = await engine.executor.inference.run(
+        engine.execute_command,
         command=command.command,
         parameters=command.parameters,
         user_id=current_user["id"],
-        priority=command.priority
+        priority=command.priority,
+        cache_mode=cache_mode(rahl_request)
     )
     
     return {
@@ -152,6 +317,106 @@ async def sovereign_command(
         "compliance": "absolute"
     }
 
+@router.post("/jobs/command", status_code=202)
+async def submit_command_job(
+    command: SovereignCommand,
+    response: Response,
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    engine = rahl_request.app.state.rahl_engine
+    job = await engine.executor.io.run(
+        engine.jobs.submit,
+        kind="command",
+        payload={"command": command.command, "parameters": command.parameters, "priority": command.priority},
+        user_id=current_user["id"],
+        priority=command.priority
+    )
+    response.headers["Location"] = f"{rahl_request.url.path.rsplit('/', 1)[0]}/{job['job_id']}"
+    return job
+
+@router.post("/jobs/completions", status_code=202)
+async def submit_completion_job(
+    request: CompletionRequest,
+    response: Response,
+    priority: int = Query(1),
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    if request.stream:
+        raise HTTPException(status_code=400, detail="Jobs cannot stream; use /completions")
+    
+    engine = rahl_request.app.state.rahl_engine
+    job = await engine.executor.io.run(
+        engine.jobs.submit,
+        kind="completion",
+        payload={
+            "prompt": request.prompt,
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature,
+            "context_id": request.context_id
+        },
+        user_id=current_user["id"],
+        priority=priority
+    )
+    response.headers["Location"] = f"{rahl_request.url.path.rsplit('/', 1)[0]}/{job['job_id']}"
+    return job
+
+@router.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    engine = rahl_request.app.state.rahl_engine
+    jobs = await engine.executor.io.run(
+        engine.jobs.list,
+        user_id=current_user["id"],
+        status=status,
+        limit=limit
+    )
+    
+    return {"jobs": jobs}
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=60),
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    """A job and, once finished, its result
+    
+    With ``wait`` the request is held until the job finishes or wait
+    seconds pass, so clients can long-poll instead of polling rapidly.
+    """
+    engine = rahl_request.app.state.rahl_engine
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        job = await engine.executor.io.run(engine.jobs.get, job_id=job_id, user_id=current_user["id"])
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] not in ACTIVE_STATUSES or loop.time() >= deadline:
+            return job
+        await asyncio.sleep(min(engine.jobs.poll_interval, max(0.0, deadline - loop.time())))
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    engine = rahl_request.app.state.rahl_engine
+    job = await engine.executor.io.run(engine.jobs.cancel, job_id=job_id, user_id=current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    
+    return job
+
 @router.post("/train/compliance")
 async def train_compliance(
     data: List[TrainingData],
@@ -160,7 +425,8 @@ async def train_compliance(
 ):
     engine = rahl_request.app.state.rahl_engine
     
-    training_result = engine.train_compliance(
+    training_result = await engine.executor.inference.run(
+        engine.train_compliance,
         training_data=data,
         user_id=current_user["id"]
     )
@@ -175,22 +441,32 @@ async def train_compliance(
 @router.get("/memory/{context_id}")
 async def get_memory(
     context_id: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
     current_user: Dict = Depends(get_current_user),
     rahl_request: Request = None
 ):
-    memory = rahl_request.app.state.rahl_engine.memory
-    context_data = memory.retrieve_context(
+    engine = rahl_request.app.state.rahl_engine
+    context_data = await engine.executor.io.run(
+        engine.memory.retrieve_context,
         context_id=context_id,
-        user_id=current_user["id"]
+        user_id=current_user["id"],
+        offset=offset,
+        limit=limit
     )
     
-    return {
+    # Returned as a response so large contexts skip jsonable_encoder; the
+    # entries are already plain JSON values
+    return TimedJSONResponse({
         "context_id": context_id,
         "memory": context_data.get("memory", []),
+        "total": context_data.get("total", 0),
+        "offset": offset,
+        "limit": limit,
         "preferences": context_data.get("preferences", {}),
         "created": context_data.get("created"),
         "updated": context_data.get("updated")
-    }
+    })
 
 @router.post("/memory/{context_id}")
 async def update_memory(
@@ -199,8 +475,9 @@ async def update_memory(
     current_user: Dict = Depends(get_current_user),
     rahl_request: Request = None
 ):
-    memory = rahl_request.app.state.rahl_engine.memory
-    memory.update_context(
+    engine = rahl_request.app.state.rahl_engine
+    await engine.executor.io.run(
+        engine.memory.update_context,
         context_id=context_id,
         user_id=current_user["id"],
         data=memory_data
@@ -208,14 +485,36 @@ async def update_memory(
     
     return {"status": "memory_updated", "context_id": context_id}
 
+@router.get("/memory/{context_id}/search")
+async def search_memory(
+    context_id: str,
+    q: str = Query(..., min_length=1),
+    k: int = Query(5, ge=1, le=100),
+    current_user: Dict = Depends(get_current_user),
+    rahl_request: Request = None
+):
+    engine = rahl_request.app.state.rahl_engine
+    if engine.memory.index is None:
+        raise HTTPException(status_code=404, detail="Memory index is disabled")
+    results = await engine.executor.io.run(
+        engine.memory.search_context,
+        context_id=context_id,
+        user_id=current_user["id"],
+        query=q,
+        k=k
+    )
+
+    return {"context_id": context_id, "query": q, "results": results}
+
 @router.delete("/memory/{context_id}")
 async def clear_memory(
     context_id: str,
     current_user: Dict = Depends(get_current_user),
     rahl_request: Request = None
 ):
-    memory = rahl_request.app.state.rahl_engine.memory
-    memory.clear_context(
+    engine = rahl_request.app.state.rahl_engine
+    await engine.executor.io.run(
+        engine.memory.clear_context,
         context_id=context_id,
         user_id=current_user["id"]
     )
@@ -225,7 +524,7 @@ async def clear_memory(
 @router.get("/status")
 async def system_status(rahl_request: Request = None):
     engine = rahl_request.app.state.rahl_engine
-    status = engine.get_status()
+    status = await engine.executor.io.run(engine.get_status)
     
     return {
         "system": "Rahl AI",
@@ -235,5 +534,10 @@ async def system_status(rahl_request: Request = None):
         "model": status["model"],
         "memory_usage": status["memory"],
         "active_sessions": status["sessions"],
+        "kv_cache": status["processor"]["kv_cache"],
+        "response_cache": status["processor"]["response_cache"],
+        "auth": get_auth_stats(),
+        "jobs": status["jobs"],
+        "workers": status["workers"],
         "uptime": status["uptime"]
     }
@@ -0,0 +1,46 @@
+import time
+
+from fastapi.responses import ORJSONResponse
+
+from core.metrics import REQUEST_SECONDS, STAGE_SECONDS
+
+
+class TimedJSONResponse(ORJSONResponse):
+    """ORJSONResponse that records how long rendering the body takes"""
+
+    def render(self, content) -> bytes:
+        with STAGE_SECONDS.time("serialize"):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    """Record every HTTP request's duration by endpoint and status
+
+    Plain ASGI rather than BaseHTTPMiddleware so streaming responses pass
+    through untouched; the duration runs until the last body chunk is sent.
+    Requests are labelled with the endpoint function's name, not the raw
+    path, so path parameters do not multiply the series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            name = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], name, str(status[0]))
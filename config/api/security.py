@@ -1,14 +1,93 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
+import os
+import json
+import time
+import hashlib
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 
-from config.settings import Settings
+from config.settings import get_settings
+from core.cache import LRUCache
+from core.metrics import STAGE_SECONDS
 
-settings = Settings()
+settings = get_settings()
 security = HTTPBearer()
 
+class KeyRing:
+    """Active signing keys
+    
+    Without SECRET_KEYS_FILE there is a single key, SECRET_KEY. With it, the
+    file holds {"current": kid, "keys": {kid: secret, ...}}: new tokens are
+    signed with the current key and any listed key still verifies, so keys
+    can be rotated by editing the file. It is re-read at most every
+    KEY_RELOAD_INTERVAL seconds when its mtime changes.
+    """
+    
+    def __init__(self, path: Optional[str], default_key: str, reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.keys: Dict[str, str] = {"default": default_key}
+        self.current = "default"
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+    
+    def refresh(self, force: bool = False):
+        """Reload the key file if it changed"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return
+        
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            with open(self.path) as f:
+                data = json.load(f)
+            if data["current"] not in data["keys"]:
+                raise ValueError(f"Current key {data['current']!r} is not in {self.path}")
+            self.keys = dict(data["keys"])
+            self.current = data["current"]
+            self._mtime = mtime
+    
+    def signing_key(self) -> Tuple[str, str]:
+        self.refresh()
+        return self.current, self.keys[self.current]
+    
+    def is_active(self, kid: str) -> bool:
+        return kid in self.keys
+    
+    def candidates(self, kid: Optional[str]) -> List[Tuple[str, str]]:
+        """Keys to try for a token, by kid if it names an active key"""
+        self.refresh()
+        keys = self.keys
+        if kid in keys:
+            return [(kid, keys[kid])]
+        return list(keys.items())
+
+keyring = KeyRing(settings.secret_keys_file, settings.secret_key, settings.key_reload_interval)
+
+# Verified payloads keyed by token digest, so repeat bearers skip HMAC and
+# claim parsing. Entries remember which key verified them and their exp.
+_token_cache = LRUCache(settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -16,32 +95,60 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+    kid, secret = keyring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, secret, algorithm=settings.algorithm, headers={"kid": kid})
     return encoded_jwt
 
-def verify_token(token: str) -> Dict[str, Any]:
+def _decode_token(token: str) -> Tuple[Dict[str, Any], str]:
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token expired",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except jwt.JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        kid = jwt.get_unverified_header(token).get("kid")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid token")
+    
+    for candidate, secret in keyring.candidates(kid):
+        try:
+            return jwt.decode(token, secret, algorithms=[settings.algorithm]), candidate
+        except jwt.ExpiredSignatureError:
+            raise _unauthorized("Token expired")
+        except jwt.InvalidSignatureError:
+            continue
+        except jwt.InvalidTokenError:
+            break
+    raise _unauthorized("Invalid token")
+
+def verify_token(token: str) -> Dict[str, Any]:
+    digest = hashlib.sha256(token.encode()).digest()
+    
+    cached = _token_cache.get(digest)
+    if cached:
+        payload, expires_at, kid = cached
+        if expires_at is not None and expires_at <= time.time():
+            _token_cache.pop(digest)
+            raise _unauthorized("Token expired")
+        keyring.refresh()
+        if keyring.is_active(kid):
+            return dict(payload)
+        # Its key was rotated out, so verify from scratch
+        _token_cache.pop(digest)
+    
+    payload, kid = _decode_token(token)
+    _token_cache.set(digest, (payload, payload.get("exp"), kid))
+    return dict(payload)
+
+def get_auth_stats() -> Dict:
+    """Get verified-token cache statistics"""
+    return {
+        "token_cache": _token_cache.get_stats(),
+        "active_keys": len(keyring.keys),
+        "current_key": keyring.current
+    }
 
 async def verify_auth(
     request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    token = credentials.credentials
-    payload = verify_token(token)
+    with STAGE_SECONDS.time("auth"):
+        payload = verify_token(credentials.credentials)
     
     
     if payload.get("user_id") == "lord_rahl":
@@ -1,5 +1,6 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
+from functools import lru_cache
 import os
 
 class Settings(BaseSettings):
@@ -12,23 +13,118 @@ class Settings(BaseSettings):
     secret_key: str = "rahl-sovereign-key-2024"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 1440
+    secret_keys_file: Optional[str] = None
+    key_reload_interval: float = 30.0
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 300.0
     
     # Database
     database_url: str = "sqlite:///./rahl.db"
     
     # Model
+    model_backend: str = "simple"
+    echo_token_delay_ms: float = 0.0
     model_path: str = "./models/rahl_core"
+    model_quantization: str = "none"
+    torch_threads: int = 0
+    torch_interop_threads: int = 0
     context_length: int = 8192
     max_tokens: int = 4096
+    chat_max_tokens: int = 1000
+    prompt_token_budget: int = 0
+    prompt_token_cache_size: int = 50000
     temperature: float = 0.7
     
+    # Scheduler
+    batch_max_size: int = 8
+    batch_wait_ms: float = 5.0
+    kv_cache_enabled: bool = True
+    kv_cache_mb: int = 512
+    
+    # Speculative decoding (off unless a draft model sharing the tokenizer is set)
+    draft_model_path: Optional[str] = None
+    speculative_lookahead: int = 4
+    speculative_max_concurrency: int = 1
+    
+    # Response cache
+    response_cache_enabled: bool = False
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 600.0
+    response_cache_max_temperature: float = 0.3
+    
+    # Execution
+    inference_workers: int = 16
+    inference_queue_depth: int = 64
+    io_workers: int = 4
+    io_queue_depth: int = 256
+    request_timeout: float = 120.0
+    batch_max_items: int = 10000
+    
+    # Streaming (the first chunk is sent at once; later ones are coalesced
+    # into frames of up to this many characters or milliseconds)
+    stream_frame_chars: int = 512
+    stream_frame_ms: float = 25.0
+    stream_max_concurrency: int = 256
+    
+    # Background jobs
+    job_workers: int = 2
+    job_user_concurrency: int = 2
+    job_user_queue_limit: int = 1000
+    job_result_ttl: float = 3600.0
+    job_lease_seconds: float = 600.0
+    job_poll_interval: float = 0.5
+    job_max_attempts: int = 3
+    
+    # Workers (1 runs a single process, 0 sizes to the machine)
+    workers: int = 1
+    worker_preload: bool = True
+    worker_memory_mb: int = 1024
+    worker_stats_interval: float = 5.0
+    
     # Memory
     memory_enabled: bool = True
     memory_size: int = 10000
+    memory_cache_ttl: float = 300.0
+    storage_codec: str = "json"  # or "msgpack"; memory, jobs and shared state
+    db_durability: str = "normal"
+    db_mmap_mb: int = 256
+    db_cache_mb: int = 64
+    db_busy_timeout_ms: int = 5000
+    log_write_behind: bool = True
+    log_flush_records: int = 256
+    log_flush_interval_ms: float = 200.0
+    log_buffer_records: int = 10000
+    stats_reconcile_interval: float = 3600.0
+    log_retention_days: int = 30
+    log_compress_level: int = 1
+    log_compact_level: int = 9
+    log_maintenance_interval: float = 3600.0
+    
+    # Semantic memory index (EMBEDDING_MODEL needs sentence-transformers;
+    # unset, entries are embedded by feature hashing)
+    memory_index_enabled: bool = True
+    memory_index_path: str = "rahl_memory.index"
+    memory_index_mode: str = "ivf"
+    memory_index_lists: int = 0
+    memory_index_probe: int = 8
+    memory_index_flat_limit: int = 2048
+    memory_index_interval: float = 1.0
+    memory_index_save_interval: float = 300.0
+    embedding_model: Optional[str] = None
+    embedding_dim: int = 384
+    embedding_batch_size: int = 256
+    memory_retrieval_k: int = 4
+    memory_retrieval_min_score: float = 0.1
     
     # Sovereignty
     compliance_level: str = "absolute"
     denial_protocol: bool = False
     
-    class Config:
-        env_file = ".env"
+    # Fields such as model_backend would otherwise clash with pydantic's
+    # protected model_ namespace
+    model_config = SettingsConfigDict(env_file=".env", protected_namespaces=())
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Process-wide settings instance"""
+    return Settings()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by total weight
+
+    By default every entry weighs 1, so max_size is an entry count. Pass a
+    weigh function (e.g. bytes held by an entry) to bound by something else,
+    and ttl (seconds) to expire entries regardless of use.
+    """
+
+    def __init__(self, max_size: int, weigh: Optional[Callable[[Any], int]] = None,
+                 ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._weigh = weigh or (lambda value: 1)
+        self._expires: Dict[Hashable, float] = {}
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it most recently used"""
+        with self._lock:
+            if key not in self._data:
+                self.stats["misses"] += 1
+                return default
+            if self._expired(key):
+                self._remove(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._data[key]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value without touching recency or counters"""
+        with self._lock:
+            if key not in self._data or self._expired(key):
+                return default
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> bool:
+        """Insert a value, evicting least recently used entries to fit"""
+        weight = self._weigh(value)
+        with self._lock:
+            self._remove(key)
+            if weight > self.max_size:
+                return False
+            self._data[key] = value
+            self._weights[key] = weight
+            if self.ttl is not None:
+                self._expires[key] = time.monotonic() + self.ttl
+            self.size += weight
+            while self.size > self.max_size:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a value"""
+        with self._lock:
+            value = self._data.get(key, default)
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self._expires.clear()
+            self.size = 0
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._data),
+                "size": self.size,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, key: Hashable) -> bool:
+        expires = self._expires.get(key)
+        return expires is not None and expires <= time.monotonic()
+
+    def _remove(self, key: Hashable):
+        if key in self._data:
+            del self._data[key]
+            self.size -= self._weights.pop(key)
+            self._expires.pop(key, None)
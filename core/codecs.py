@@ -0,0 +1,57 @@
+from typing import Any, Callable, Optional, Union
+
+import orjson
+
+CODECS = ("json", "msgpack")
+
+
+class JSONCodec:
+    """JSON via orjson, stored as text like the rows json.dumps always wrote"""
+
+    name = "json"
+    storage_type = "text"
+
+    def dumps(self, value: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+class MsgpackCodec:
+    """MessagePack, stored as a blob (optional dependency)"""
+
+    name = "msgpack"
+    storage_type = "blob"
+
+    def __init__(self):
+        self._msgpack = _import_msgpack()
+
+    def dumps(self, value: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return self._msgpack.packb(value, default=default, use_bin_type=True)
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError("STORAGE_CODEC=msgpack requires the msgpack package") from e
+    return msgpack
+
+
+def create_codec(name: str):
+    """Codec new blobs are written with"""
+    if name == "json":
+        return JSONCodec()
+    if name == "msgpack":
+        return MsgpackCodec()
+    raise ValueError(f"Unknown storage_codec: {name}")
+
+
+def loads(blob: Union[str, bytes]) -> Any:
+    """Decode a stored blob written by either codec
+
+    SQLite keeps the type each value was written with, so text is JSON and
+    bytes are MessagePack. Rows written before a codec change stay readable
+    until they are rewritten.
+    """
+    if isinstance(blob, str):
+        return orjson.loads(blob)
+    return _import_msgpack().unpackb(blob, raw=False, strict_map_key=False)
@@ -0,0 +1,80 @@
+import json
+import re
+import zlib
+from typing import Any, List
+
+import numpy as np
+
+WORD = re.compile(r"\w+")
+
+
+def entry_text(entry: Any) -> str:
+    """Text of a memory entry: the entry itself, its content or text field, or its JSON"""
+    if isinstance(entry, str):
+        return entry
+    if isinstance(entry, dict):
+        for field in ("content", "text"):
+            if isinstance(entry.get(field), str):
+                return entry[field]
+    return json.dumps(entry, sort_keys=True)
+
+
+class HashingEmbedder:
+    """Embeddings without a model: signed feature hashing of words and character trigrams
+
+    Texts that share words or word fragments get nearby vectors, which is
+    enough to rank a context's own entries against a query with no weights
+    to download. Hashes are CRC32, so vectors are identical across processes
+    and restarts. Vectors are L2-normalised; dot products are cosines.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in WORD.findall(text.lower()):
+            features.append(word)
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features),
+                                 dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Embeddings from a sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_path: str, batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_MODEL requires the sentence-transformers package") from e
+        self.model = SentenceTransformer(model_path)
+        self.name = f"sentence-transformers:{model_path}"
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+def create_embedder(settings):
+    """Embedder named by Settings.embedding_model, or feature hashing when unset"""
+    if settings.embedding_model:
+        return SentenceTransformerEmbedder(settings.embedding_model, batch_size=settings.embedding_batch_size)
+    return HashingEmbedder(settings.embedding_dim)
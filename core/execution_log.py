@@ -0,0 +1,312 @@
+import logging
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core import codecs
+from core.storage import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "execution_log_"
+
+
+class ExecutionLog:
+    """Execution log stored as one table per UTC day
+
+    Rows go to the partition of their timestamp's day. Each partition is
+    indexed on user_id, command_id and timestamp, and outputs are stored
+    zlib-compressed. Retention drops whole partitions, which is a cheap
+    DROP TABLE instead of a DELETE over millions of rows; with incremental
+    auto-vacuum the freed pages are then handed back to the filesystem.
+    Closed partitions (days before today) are recompressed once at a higher
+    level by compaction.
+
+    Row counts per partition live in the log_partitions catalog, updated in
+    the same transaction as the rows. on_change(conn, delta) is called in
+    that transaction too, so callers can maintain their own totals.
+    """
+
+    def __init__(self, pool: ConnectionPool, retention_days: int = 30, compress_level: int = 1,
+                 compact_level: int = 9, on_change: Optional[Callable] = None):
+        self.pool = pool
+        self.retention_days = retention_days
+        self.compress_level = compress_level
+        self.compact_level = compact_level
+        self.on_change = on_change or (lambda conn, delta: None)
+        self._partitions = set()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {
+            "partitions_dropped": 0,
+            "partitions_compacted": 0,
+            "bytes_saved": 0
+        }
+
+    def initialize(self, migrate: bool = True):
+        """Create the catalog; with migrate, also move a legacy execution_log into partitions
+
+        Only one process sharing the database should migrate.
+        """
+        with self.pool.writer() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS log_partitions (
+                    day TEXT PRIMARY KEY,
+                    rows INTEGER DEFAULT 0,
+                    compacted INTEGER DEFAULT 0
+                )
+            ''')
+            self._partitions = {day for (day,) in conn.execute('SELECT day FROM log_partitions')}
+
+        if migrate and self._has_legacy(self.pool.reader()):
+            self._migrate_legacy()
+
+    # Writing
+
+    def insert(self, conn, rows: List[tuple], counted: bool = False):
+        """Insert (command_id, command, parameters, user_id, output, timestamp, compliance_score) rows
+
+        Must be called inside a write transaction. Pass counted=True for rows
+        that callers' totals already include.
+        """
+        by_day: Dict[str, List[tuple]] = {}
+        for command_id, command, parameters, user_id, output, timestamp, score in rows:
+            by_day.setdefault(_day(timestamp), []).append((
+                command_id, command, parameters, user_id,
+                zlib.compress(output.encode("utf-8"), self.compress_level),
+                timestamp, score
+            ))
+
+        for day, day_rows in by_day.items():
+            self._ensure_partition(conn, day)
+            conn.executemany(
+                f'''INSERT INTO {PARTITION_PREFIX}{day}
+                    (command_id, command, parameters, user_id, output, timestamp, compliance_score)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                day_rows
+            )
+            conn.execute('UPDATE log_partitions SET rows = rows + ? WHERE day = ?', (len(day_rows), day))
+        if not counted:
+            self.on_change(conn, len(rows))
+
+    def _ensure_partition(self, conn, day: str):
+        if day in self._partitions:
+            return
+        table = PARTITION_PREFIX + day
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                command_id TEXT,
+                command TEXT,
+                parameters TEXT,
+                user_id TEXT,
+                output BLOB,
+                timestamp TEXT,
+                compliance_score REAL
+            )
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id, timestamp)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_command ON {table} (command_id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)')
+        conn.execute('INSERT OR IGNORE INTO log_partitions (day) VALUES (?)', (day,))
+        self._partitions.add(day)
+
+    # Reading
+
+    def query(self, user_id: Optional[str] = None, command_id: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Newest matching executions first, searching only partitions in [since, until]"""
+        conn = self.pool.reader()
+        days = sorted((day for (day,) in conn.execute('SELECT day FROM log_partitions')), reverse=True)
+        if since:
+            days = [d for d in days if d >= _day(since)]
+        if until:
+            days = [d for d in days if d <= _day(until)]
+
+        where, params = [], []
+        for column, value, op in (("user_id", user_id, "="), ("command_id", command_id, "="),
+                                  ("timestamp", since, ">="), ("timestamp", until, "<=")):
+            if value is not None:
+                where.append(f"{column} {op} ?")
+                params.append(value)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        results = []
+        for day in days:
+            remaining = limit - len(results)
+            if remaining <= 0:
+                break
+            rows = conn.execute(
+                f'''SELECT command_id, command, parameters, user_id, output, timestamp, compliance_score
+                    FROM {PARTITION_PREFIX}{day} {clause}
+                    ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                (*params, remaining)
+            ).fetchall()
+            results.extend({
+                "command_id": command_id,
+                "command": command,
+                "parameters": codecs.loads(parameters),
+                "user_id": user_id,
+                "output": zlib.decompress(output).decode("utf-8"),
+                "timestamp": timestamp,
+                "compliance_score": score
+            } for command_id, command, parameters, user_id, output, timestamp, score in rows)
+        return results
+
+    def count(self) -> int:
+        """Total rows, from the catalog"""
+        return self.pool.reader().execute('SELECT COALESCE(SUM(rows), 0) FROM log_partitions').fetchone()[0]
+
+    def recount(self, conn) -> Dict[str, Tuple[int, int]]:
+        """(catalog rows, actual rows) of every partition
+
+        Call on a read snapshot so the scan holds no write lock, then apply
+        the difference with correct().
+        """
+        return {
+            day: (rows, conn.execute(f'SELECT COUNT(*) FROM {PARTITION_PREFIX}{day}').fetchone()[0])
+            for day, rows in conn.execute('SELECT day, rows FROM log_partitions').fetchall()
+        }
+
+    def correct(self, conn, drift: Dict[str, int]):
+        """Add each partition's drift to its catalog count
+
+        Must be called inside a write transaction. Adding rather than
+        overwriting keeps the rows counted since the snapshot.
+        """
+        conn.executemany(
+            'UPDATE log_partitions SET rows = rows + ? WHERE day = ?',
+            [(delta, day) for day, delta in drift.items() if delta]
+        )
+
+    # Maintenance
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Drop partitions older than the retention window; returns rows removed"""
+        if self.retention_days <= 0:
+            return 0
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        removed = 0
+        with self.pool.writer() as conn:
+            expired = conn.execute('SELECT day, rows FROM log_partitions WHERE day < ?', (cutoff,)).fetchall()
+            for day, rows in expired:
+                conn.execute(f'DROP TABLE IF EXISTS {PARTITION_PREFIX}{day}')
+                conn.execute('DELETE FROM log_partitions WHERE day = ?', (day,))
+                self._partitions.discard(day)
+                removed += rows
+            if expired:
+                self.on_change(conn, -removed)
+                self.stats["partitions_dropped"] += len(expired)
+        if expired:
+            self._vacuum()
+        return removed
+
+    def compact(self, now: Optional[datetime] = None, chunk: int = 500) -> int:
+        """Recompress closed partitions at compact_level; returns partitions compacted"""
+        today = (now or datetime.utcnow()).strftime("%Y%m%d")
+        days = [day for (day,) in self.pool.reader().execute(
+            'SELECT day FROM log_partitions WHERE compacted = 0 AND day < ? ORDER BY day', (today,)
+        )]
+        for day in days:
+            table = PARTITION_PREFIX + day
+            last_id = 0
+            while not self._stop.is_set():
+                # Short transactions so inserts are never held up for long
+                with self.pool.writer() as conn:
+                    rows = conn.execute(
+                        f'SELECT id, output FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+                        (last_id, chunk)
+                    ).fetchall()
+                    updates = []
+                    for row_id, output in rows:
+                        packed = zlib.compress(zlib.decompress(output), self.compact_level)
+                        if len(packed) < len(output):
+                            updates.append((packed, row_id))
+                            self.stats["bytes_saved"] += len(output) - len(packed)
+                    conn.executemany(f'UPDATE {table} SET output = ? WHERE id = ?', updates)
+                    if len(rows) < chunk:
+                        conn.execute('UPDATE log_partitions SET compacted = 1 WHERE day = ?', (day,))
+                        self.stats["partitions_compacted"] += 1
+                        break
+                    last_id = rows[-1][0]
+        if days:
+            self._vacuum()
+        return len(days)
+
+    def _vacuum(self):
+        """Release free pages to the filesystem (no-op unless auto_vacuum is incremental)"""
+        with self.pool.writer() as conn:
+            conn.execute('PRAGMA incremental_vacuum')
+
+    def start(self, interval: float):
+        """Prune and compact every interval seconds on a background thread"""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.prune()
+                    self.compact()
+                except Exception:
+                    logger.exception("Execution log maintenance failed")
+
+        self._thread = threading.Thread(target=loop, name="rahl-log-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self) -> Dict:
+        rows = self.pool.reader().execute('SELECT COUNT(*), MIN(day), MAX(day) FROM log_partitions').fetchone()
+        return {
+            **self.stats,
+            "partitions": rows[0],
+            "oldest": rows[1],
+            "newest": rows[2],
+            "retention_days": self.retention_days
+        }
+
+    def _has_legacy(self, conn) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'execution_log'"
+        ).fetchone() is not None
+
+    def _migrate_legacy(self, chunk: int = 10000):
+        """Move rows of the unpartitioned execution_log table into partitions
+
+        Each chunk is copied and deleted from the legacy table in one write
+        transaction, so a row is moved exactly once even if another process
+        migrates at the same time.
+        """
+        logger.info("Migrating execution_log into daily partitions")
+        while True:
+            with self.pool.writer() as conn:
+                if not self._has_legacy(conn):
+                    return
+                rows = conn.execute(
+                    '''SELECT id, command_id, command, parameters, user_id, output, timestamp, compliance_score
+                       FROM execution_log ORDER BY id LIMIT ?''',
+                    (chunk,)
+                ).fetchall()
+                if not rows:
+                    conn.execute('DROP TABLE execution_log')
+                    break
+                self.insert(conn, [
+                    (command_id, command, parameters, user_id, output or "", timestamp or "", score)
+                    for _, command_id, command, parameters, user_id, output, timestamp, score in rows
+                ], counted=True)
+                conn.execute('DELETE FROM execution_log WHERE id <= ?', (rows[-1][0],))
+
+        # Rewrite the file once so incremental auto-vacuum takes effect
+        self.pool.vacuum()
+
+
+def _day(timestamp) -> str:
+    """Partition key (YYYYMMDD) of an ISO timestamp"""
+    text = str(timestamp)[:10].replace("-", "")
+    if len(text) != 8 or not text.isdigit():
+        # Unparseable timestamps go to today's partition
+        return datetime.utcnow().strftime("%Y%m%d")
+    return text
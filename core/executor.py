@@ -0,0 +1,231 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Dict, Any, Callable, Optional
+
+from core.metrics import QUEUE_WAIT_SECONDS
+
+
+class PoolOverloaded(Exception):
+    """Raised when a pool's queue is full and the request should be retried"""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} pool is at capacity")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class PoolUnavailable(Exception):
+    """Raised when a pool has been shut down"""
+
+    def __init__(self, pool: str, retry_after: int = 5):
+        super().__init__(f"{pool} pool is unavailable")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class RequestTimeout(Exception):
+    """Raised when a pooled call exceeds its deadline"""
+
+    def __init__(self, pool: str, timeout: float):
+        super().__init__(f"{pool} call timed out after {timeout:.1f}s")
+        self.pool = pool
+        self.timeout = timeout
+
+
+class BoundedPool:
+    """Thread pool with a hard cap on running plus queued calls
+
+    Blocking work is handed to the pool from async handlers so the event loop
+    stays free. Once max_workers + max_queue calls are in flight, new calls
+    are rejected immediately with a Retry-After estimate instead of piling
+    up behind a slow generation.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int,
+                 timeout: Optional[float] = None):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"rahl-{name}")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._avg_duration = 0.0
+        self._closed = False
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0
+        }
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a blocking call in the pool and await its result"""
+        if self._closed:
+            raise PoolUnavailable(self.name)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise PoolOverloaded(self.name, self.retry_after())
+
+        with self._lock:
+            self._in_flight += 1
+            self.stats["submitted"] += 1
+
+        try:
+            future = self._executor.submit(self._timed, fn, args, kwargs, time.perf_counter())
+        except RuntimeError:
+            self._release()
+            raise PoolUnavailable(self.name)
+        future.add_done_callback(lambda _: self._release())
+
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.TimeoutError, FuturesTimeout):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise RequestTimeout(self.name, timeout)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up"""
+        with self._lock:
+            waves = self._in_flight / self.max_workers
+            return max(1, int(round(waves * self._avg_duration)))
+
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        with self._lock:
+            return {
+                **self.stats,
+                "in_flight": self._in_flight,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "avg_duration": self._avg_duration
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and wait for running calls"""
+        self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _timed(self, fn: Callable, args, kwargs, submitted: float) -> Any:
+        start = time.perf_counter()
+        QUEUE_WAIT_SECONDS.observe(start - submitted, self.name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.stats["completed"] += 1
+                # Exponentially weighted so Retry-After tracks the current load
+                self._avg_duration = duration if not self._avg_duration else 0.8 * self._avg_duration + 0.2 * duration
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+
+class StreamLimiter:
+    """Hard cap on concurrently open streams
+
+    A stream only uses a pool thread while it is opened; generation then
+    runs in the scheduler for as long as the client reads. Streams are
+    admitted here for their whole lifetime instead, so they get the same
+    429 with Retry-After as pooled calls once max_streams are open, and
+    each is cut off after timeout seconds.
+    """
+
+    def __init__(self, name: str, max_streams: int, timeout: Optional[float] = None):
+        self.name = name
+        self.max_streams = max(1, max_streams)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._open = 0
+        self._avg_duration = 0.0
+        self._closed = False
+        self.stats = {
+            "opened": 0,
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0
+        }
+
+    def acquire(self) -> float:
+        """Admit one stream; returns its start time for release()"""
+        if self._closed:
+            raise PoolUnavailable(self.name)
+        with self._lock:
+            if self._open >= self.max_streams:
+                self.stats["rejected"] += 1
+                raise PoolOverloaded(self.name, max(1, int(round(self._avg_duration))))
+            self._open += 1
+            self.stats["opened"] += 1
+        return time.perf_counter()
+
+    def release(self, started: float, timed_out: bool = False):
+        duration = time.perf_counter() - started
+        with self._lock:
+            self._open -= 1
+            self.stats["completed"] += 1
+            if timed_out:
+                self.stats["timeouts"] += 1
+            # A slot frees up roughly one average stream after the cap is hit
+            self._avg_duration = duration if not self._avg_duration else 0.8 * self._avg_duration + 0.2 * duration
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "open": self._open,
+                "max_streams": self.max_streams,
+                "avg_duration": self._avg_duration
+            }
+
+    def shutdown(self):
+        self._closed = True
+
+
+class ExecutionLayer:
+    """Separate pools for model inference and MemorySystem I/O
+
+    Keeping SQLite work on its own pool means a burst of long generations
+    can never starve /memory or /status, and vice versa.
+    """
+
+    def __init__(self, settings):
+        self.inference = BoundedPool(
+            "inference",
+            max_workers=settings.inference_workers,
+            max_queue=settings.inference_queue_depth,
+            timeout=settings.request_timeout
+        )
+        self.io = BoundedPool(
+            "io",
+            max_workers=settings.io_workers,
+            max_queue=settings.io_queue_depth,
+            timeout=settings.request_timeout
+        )
+        self.streams = StreamLimiter(
+            "streams",
+            max_streams=settings.stream_max_concurrency,
+            timeout=settings.request_timeout
+        )
+
+    def get_stats(self) -> Dict:
+        """Get execution layer statistics"""
+        return {
+            "inference": self.inference.get_stats(),
+            "io": self.io.get_stats(),
+            "streams": self.streams.get_stats()
+        }
+
+    def shutdown(self):
+        """Shut down both pools and stop admitting streams"""
+        self.streams.shutdown()
+        self.inference.shutdown()
+        self.io.shutdown()
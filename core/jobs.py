@@ -0,0 +1,358 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from core import codecs
+from core.executor import PoolOverloaded
+from core.metrics import QUEUE_WAIT_SECONDS
+from core.storage import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Counts of active jobs, kept in the memory database's stats table and
+# updated in the same transaction as the rows: status -> stats name
+STAT_NAMES = {status: f"jobs_{status}" for status in ACTIVE_STATUSES}
+
+
+class JobQueue:
+    """Persistent queue of long-running work, run in the background
+
+    Jobs are rows in the memory database, so they survive restarts and any
+    worker process can pick up a job another one accepted. Dispatcher
+    threads claim the highest-priority queued job (oldest first within a
+    priority) whose user is below max_running jobs across all workers, and
+    run it with the handler registered for its kind. A claim holds a lease
+    that the worker's sweeper renews while the handler runs; jobs whose
+    lease ran out (their worker died) are queued again until max_attempts.
+    Finished jobs keep their result for result_ttl seconds.
+    """
+
+    def __init__(self, pool: ConnectionPool, workers: int = 2, max_running: int = 2,
+                 max_queued: int = 1000, result_ttl: float = 3600.0, lease: float = 600.0,
+                 poll_interval: float = 0.5, max_attempts: int = 3, codec=None):
+        self.pool = pool
+        self.codec = codec or codecs.JSONCodec()
+        self.workers = max(0, workers)
+        self.max_running = max(1, max_running)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self.worker_id = os.environ.get("RAHL_WORKER_ID", "0")
+        self.handlers: Dict[str, Callable[[str, Dict], Dict]] = {}
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Claims this process is running: job_id -> attempts at claim time
+        self._running: Dict[str, int] = {}
+        self._avg_duration = 0.0
+        self.stats = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "requeued": 0,
+            "expired": 0
+        }
+
+    def initialize(self):
+        with self.pool.writer() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    kind TEXT,
+                    payload TEXT,
+                    priority INTEGER,
+                    status TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    worker_id TEXT,
+                    created REAL,
+                    started REAL,
+                    finished REAL,
+                    lease_until REAL,
+                    expires REAL
+                )
+            ''')
+
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_queue
+                ON jobs (status, priority DESC, created)
+            ''')
+
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_user
+                ON jobs (user_id, status)
+            ''')
+
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER
+                )
+            ''')
+
+            # Count once per start, inside the write transaction so no
+            # transition lands between the count and the stored value
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+            ).fetchall())
+            conn.executemany(
+                'INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)',
+                [(name, counts.get(status, 0)) for status, name in STAT_NAMES.items()]
+            )
+
+    def register(self, kind: str, handler: Callable[[str, Dict], Dict]):
+        """Run jobs of kind with handler(user_id, payload), which returns the result"""
+        self.handlers[kind] = handler
+
+    # Submitting and reading
+
+    def submit(self, kind: str, payload: Dict, user_id: str, priority: int = 1) -> Dict:
+        """Queue a job; raises PoolOverloaded once the user has max_queued jobs waiting"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = time.time()
+        with self.pool.writer() as conn:
+            if self.max_queued > 0:
+                queued = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status = 'queued'", (user_id,)
+                ).fetchone()[0]
+                if queued >= self.max_queued:
+                    raise PoolOverloaded("jobs", self.retry_after(queued))
+            conn.execute(
+                '''INSERT INTO jobs (job_id, user_id, kind, payload, priority, status, created)
+                   VALUES (?, ?, ?, ?, ?, 'queued', ?)''',
+                (job_id, user_id, kind, self.codec.dumps(payload), priority, now)
+            )
+            self._bump(conn, queued=1)
+
+        with self._lock:
+            self.stats["submitted"] += 1
+        self._wake.set()
+        return self.get(job_id, user_id)
+
+    def get(self, job_id: str, user_id: str) -> Optional[Dict]:
+        """A user's job, or None if it does not exist or its result expired"""
+        row = self.pool.reader().execute(
+            '''SELECT job_id, kind, priority, status, result, error, attempts,
+                      created, started, finished, expires
+               FROM jobs WHERE job_id = ? AND user_id = ?''',
+            (job_id, user_id)
+        ).fetchone()
+        if row is None or (row[10] is not None and row[10] < time.time()):
+            return None
+        return self._job(row)
+
+    def list(self, user_id: str, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """A user's newest jobs, without their results"""
+        rows = self.pool.reader().execute(
+            '''SELECT job_id, kind, priority, status, NULL, error, attempts,
+                      created, started, finished, expires
+               FROM jobs WHERE user_id = ? AND (? IS NULL OR status = ?)
+                 AND (expires IS NULL OR expires >= ?)
+               ORDER BY created DESC LIMIT ?''',
+            (user_id, status, status, time.time(), limit)
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def cancel(self, job_id: str, user_id: str) -> Optional[Dict]:
+        """Cancel a queued job; running and finished jobs are returned unchanged"""
+        now = time.time()
+        with self.pool.writer() as conn:
+            cancelled = conn.execute(
+                '''UPDATE jobs SET status = 'cancelled', finished = ?, expires = ?
+                   WHERE job_id = ? AND user_id = ? AND status = 'queued' ''',
+                (now, now + self.result_ttl, job_id, user_id)
+            ).rowcount
+            self._bump(conn, queued=-cancelled)
+        return self.get(job_id, user_id)
+
+    def _job(self, row) -> Dict:
+        job_id, kind, priority, status, result, error, attempts, created, started, finished, expires = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "priority": priority,
+            "status": status,
+            "result": codecs.loads(result) if result else None,
+            "error": error,
+            "attempts": attempts,
+            "created": created,
+            "started": started,
+            "finished": finished,
+            "expires": expires
+        }
+
+    # Running
+
+    def start(self):
+        """Start the dispatcher threads and the sweeper"""
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._dispatch_loop, name=f"rahl-jobs-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        sweeper = threading.Thread(target=self._sweep_loop, name="rahl-jobs-sweeper", daemon=True)
+        sweeper.start()
+        self._threads.append(sweeper)
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+            if job is None:
+                # Jobs submitted to other workers are only seen by polling
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _claim(self) -> Optional[Dict]:
+        """Mark the next runnable job as running on this worker"""
+        now = time.time()
+        with self.pool.writer() as conn:
+            row = conn.execute(
+                '''SELECT job_id, user_id, kind, payload, created, attempts FROM jobs AS j
+                   WHERE status = 'queued'
+                     AND (SELECT COUNT(*) FROM jobs AS r
+                          WHERE r.user_id = j.user_id AND r.status = 'running') < ?
+                   ORDER BY priority DESC, created
+                   LIMIT 1''',
+                (self.max_running,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, user_id, kind, payload, created, attempts = row
+            conn.execute(
+                '''UPDATE jobs SET status = 'running', started = ?, lease_until = ?,
+                       attempts = attempts + 1, worker_id = ?
+                   WHERE job_id = ?''',
+                (now, now + self.lease, self.worker_id, job_id)
+            )
+            self._bump(conn, queued=-1, running=1)
+        with self._lock:
+            self._running[job_id] = attempts + 1
+        QUEUE_WAIT_SECONDS.observe(now - created, "jobs")
+        return {"job_id": job_id, "user_id": user_id, "kind": kind, "payload": codecs.loads(payload),
+                "attempts": attempts + 1}
+
+    def _run(self, job: Dict):
+        start = time.perf_counter()
+        try:
+            result = self.handlers[job["kind"]](job["user_id"], job["payload"])
+            status, result, error = "succeeded", self.codec.dumps(result, default=str), None
+        except Exception as e:
+            logger.exception("Job %s failed", job["job_id"])
+            status, result, error = "failed", None, str(e) or type(e).__name__
+        duration = time.perf_counter() - start
+
+        now = time.time()
+        with self.pool.writer() as conn:
+            # A run whose lease was lost must not overwrite a newer claim
+            current = conn.execute(
+                '''UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?,
+                       lease_until = NULL, expires = ?
+                   WHERE job_id = ? AND status = 'running' AND worker_id = ? AND attempts = ?''',
+                (status, result, error, now, now + self.result_ttl, job["job_id"],
+                 self.worker_id, job["attempts"])
+            ).rowcount
+            self._bump(conn, running=-current)
+        if not current:
+            logger.warning("Job %s lost its lease while running; discarding this run's result", job["job_id"])
+        with self._lock:
+            self._running.pop(job["job_id"], None)
+            if current:
+                self.stats[status] += 1
+            self._avg_duration = duration if not self._avg_duration else 0.8 * self._avg_duration + 0.2 * duration
+        # A user slot freed up
+        self._wake.set()
+
+    def _sweep_loop(self):
+        interval = max(self.poll_interval, min(60.0, self.lease / 4, self.result_ttl / 4))
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Sweeping jobs failed")
+
+    def sweep(self, now: Optional[float] = None):
+        """Renew this worker's leases, requeue jobs whose lease ran out and delete expired results"""
+        now = now or time.time()
+        with self._lock:
+            running = list(self._running.items())
+        with self.pool.writer() as conn:
+            conn.executemany(
+                '''UPDATE jobs SET lease_until = ?
+                   WHERE job_id = ? AND status = 'running' AND worker_id = ? AND attempts = ?''',
+                [(now + self.lease, job_id, self.worker_id, attempts) for job_id, attempts in running]
+            )
+            failed = conn.execute(
+                '''UPDATE jobs SET status = 'failed', error = 'lease expired', finished = ?,
+                       lease_until = NULL, expires = ?
+                   WHERE status = 'running' AND lease_until < ? AND attempts >= ?''',
+                (now, now + self.result_ttl, now, self.max_attempts)
+            ).rowcount
+            requeued = conn.execute(
+                '''UPDATE jobs SET status = 'queued', started = NULL, lease_until = NULL, worker_id = NULL
+                   WHERE status = 'running' AND lease_until < ?''',
+                (now,)
+            ).rowcount
+            expired = conn.execute('DELETE FROM jobs WHERE expires < ?', (now,)).rowcount
+            self._bump(conn, queued=requeued, running=-(failed + requeued))
+
+        with self._lock:
+            self.stats["failed"] += failed
+            self.stats["requeued"] += requeued
+            self.stats["expired"] += expired
+        if requeued:
+            self._wake.set()
+
+    def retry_after(self, queued: int) -> int:
+        """Seconds until a queue of this length is likely to drain by one dispatcher's worth"""
+        with self._lock:
+            return max(1, int(round(self._avg_duration * queued / max(1, self.workers))))
+
+    def _bump(self, conn, **deltas: int):
+        """Adjust the active job counts inside the caller's transaction"""
+        conn.executemany(
+            'UPDATE stats SET value = value + ? WHERE name = ?',
+            [(delta, STAT_NAMES[status]) for status, delta in deltas.items() if delta]
+        )
+
+    def get_stats(self) -> Dict:
+        """Dispatcher counters plus the queued and running counts across all workers
+
+        The counts come from the stats table, so this does not scan the jobs table.
+        """
+        counts = dict(self.pool.reader().execute(
+            'SELECT name, value FROM stats WHERE name IN (?, ?)', tuple(STAT_NAMES.values())
+        ).fetchall())
+        with self._lock:
+            return {
+                **self.stats,
+                **{status: counts.get(name, 0) for status, name in STAT_NAMES.items()},
+                "dispatchers": self.workers,
+                "avg_duration": self._avg_duration
+            }
+
+    def shutdown(self):
+        """Stop claiming jobs and wait for the running ones to finish"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
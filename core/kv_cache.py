@@ -0,0 +1,122 @@
+import threading
+from typing import Dict, List, Optional, Tuple, Hashable
+
+import torch
+
+from core.cache import LRUCache
+
+
+class PrefixEntry:
+    """Key/value tensors for one token sequence (batch of 1, no padding)"""
+
+    def __init__(self, tokens: List[int], past: List[Tuple[torch.Tensor, torch.Tensor]]):
+        self.tokens = tokens
+        self.past = past
+        self.nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in past)
+
+
+class PrefixCache:
+    """KV cache reuse across requests
+
+    Two kinds of entries share one LRU byte budget:
+
+    - per-context entries keyed by (user_id, context_id), holding the KV of
+      the last turn's prompt plus its answer, so the next chat turn only
+      prefills the tokens that were appended since
+    - shared prefix entries keyed by the tokens of a common system prompt,
+      reused across users and contexts
+
+    A lookup returns the longest prefix of the new prompt whose KV is cached;
+    because attention is causal, any common token prefix is reusable.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._entries = LRUCache(max_bytes, weigh=lambda entry: entry.nbytes)
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "shared_hits": 0,
+            "tokens_reused": 0,
+            "tokens_prefilled": 0,
+            "invalidations": 0
+        }
+
+    def lookup(self, context_key: Optional[Hashable], input_ids: List[int],
+               shared_prefix_len: int = 0) -> Optional[Tuple[int, List[Tuple[torch.Tensor, torch.Tensor]]]]:
+        """Find cached KV for the longest reusable prefix of input_ids
+
+        Returns (prefix_len, past) with at least one prompt token left to
+        prefill, or None on a miss.
+        """
+        best_len, best_entry, shared = 0, None, False
+
+        if context_key is not None:
+            entry = self._entries.get(("context", context_key))
+            if entry:
+                best_len, best_entry = _common_prefix(entry.tokens, input_ids), entry
+
+        if shared_prefix_len > best_len:
+            entry = self._entries.get(("shared", tuple(input_ids[:shared_prefix_len])))
+            if entry:
+                best_len, best_entry, shared = shared_prefix_len, entry, True
+
+        # The last prompt token must go through the model to produce logits
+        best_len = min(best_len, len(input_ids) - 1)
+
+        with self._lock:
+            if best_len <= 0:
+                self.stats["misses"] += 1
+                self.stats["tokens_prefilled"] += len(input_ids)
+                return None
+            self.stats["hits"] += 1
+            if shared:
+                self.stats["shared_hits"] += 1
+            self.stats["tokens_reused"] += best_len
+            self.stats["tokens_prefilled"] += len(input_ids) - best_len
+
+        past = [(k[..., :best_len, :], v[..., :best_len, :]) for k, v in best_entry.past]
+        return best_len, past
+
+    def store(self, context_key: Optional[Hashable], tokens: List[int],
+              past: List[Tuple[torch.Tensor, torch.Tensor]], shared_prefix_len: int = 0):
+        """Remember the KV of a finished sequence"""
+        if context_key is not None:
+            self._entries.set(("context", context_key), PrefixEntry(tokens, past))
+
+        if 0 < shared_prefix_len <= len(tokens):
+            key = ("shared", tuple(tokens[:shared_prefix_len]))
+            if key not in self._entries:
+                shared_past = [
+                    (k[..., :shared_prefix_len, :].clone(), v[..., :shared_prefix_len, :].clone())
+                    for k, v in past
+                ]
+                self._entries.set(key, PrefixEntry(tokens[:shared_prefix_len], shared_past))
+
+    def invalidate(self, context_key: Hashable):
+        """Drop the cached KV for a context"""
+        if self._entries.pop(("context", context_key)) is not None:
+            with self._lock:
+                self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict:
+        """Get prefix cache statistics"""
+        entries = self._entries.get_stats()
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": entries["entries"],
+                "evictions": entries["evictions"],
+                "bytes": entries["size"],
+                "max_bytes": entries["max_size"]
+            }
+
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
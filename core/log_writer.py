@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionLogWriter:
+    """Write-behind buffer for execution log rows
+
+    Rows are appended in memory on the request path and written by a
+    background thread in one multi-row transaction whenever max_batch rows
+    are waiting or flush_interval_ms has passed. The buffer is bounded:
+    once max_buffer rows are pending, append blocks until a flush frees
+    room, so a stalled disk turns into back-pressure instead of unbounded
+    memory growth.
+    """
+
+    def __init__(self, write: Callable[[List[tuple]], None], max_batch: int = 256,
+                 flush_interval_ms: float = 200.0, max_buffer: int = 10000):
+        self._write = write
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.max_buffer = max(self.max_batch, max_buffer)
+        self._buffer: List[tuple] = []
+        self._writing = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.stats = {
+            "appended": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "errors": 0,
+            "blocked": 0
+        }
+
+    @property
+    def pending(self) -> int:
+        """Rows accepted but not yet committed"""
+        return len(self._buffer) + self._writing
+
+    def start(self):
+        """Start the background flusher"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="rahl-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write everything still buffered"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def append(self, row: tuple):
+        """Buffer a row for the next flush"""
+        with self._cond:
+            if len(self._buffer) >= self.max_buffer and self._running:
+                self.stats["blocked"] += 1
+                while len(self._buffer) >= self.max_buffer and self._running:
+                    self._cond.notify_all()
+                    self._cond.wait()
+            self._buffer.append(row)
+            self.stats["appended"] += 1
+            if len(self._buffer) >= self.max_batch:
+                self._cond.notify_all()
+            running = self._running
+
+        # Without the flusher (not started or already stopped) write through
+        if not running:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all buffered rows now, in order, and return how many"""
+        with self._flush_lock:
+            with self._cond:
+                rows, self._buffer = self._buffer, []
+                self._writing = len(rows)
+                self._cond.notify_all()
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self._write(rows)
+            except Exception:
+                logger.exception("Execution log flush of %d rows failed", len(rows))
+                with self._cond:
+                    # Keep the rows, ahead of anything appended meanwhile
+                    self._buffer = rows + self._buffer
+                    self._writing = 0
+                    self.stats["errors"] += 1
+                return 0
+
+            with self._cond:
+                self._writing = 0
+                self.stats["flushed"] += len(rows)
+                self.stats["flushes"] += 1
+                self.stats["last_flush_ms"] = (time.perf_counter() - start) * 1000.0
+            return len(rows)
+
+    def get_stats(self) -> Dict:
+        """Get writer statistics"""
+        with self._cond:
+            return {**self.stats, "pending": len(self._buffer) + self._writing}
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._buffer) >= self.max_batch or not self._running,
+                    timeout=self.flush_interval
+                )
+                if not self._running:
+                    return
+            self.flush()
@@ -4,177 +4,710 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional
 import pickle
 import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from core import codecs
+from core.cache import LRUCache
+from core.embeddings import create_embedder, entry_text
+from core.vector_index import VectorIndex
+from core.log_writer import ExecutionLogWriter
+from core.execution_log import ExecutionLog
+from core.storage import ConnectionPool
+from core.metrics import MEMORY_SECONDS, timed
+from config.settings import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Row counts reported by get_stats, maintained in the stats table; the
+# execution log keeps its own per-partition counts
+STAT_TABLES = {
+    "contexts": "contexts",
+    "users": "user_preferences"
+}
+STAT_NAMES = ("contexts", "executions", "users")
+
+# Stored blobs rewritten when storage_codec changes: (table, column)
+BLOB_COLUMNS = (
+    ("context_entries", "entry"),
+    ("contexts", "preferences"),
+    ("user_preferences", "preferences")
+)
+
+
+def context_key(user_id: str, context_id: str) -> int:
+    """Signed 64-bit key of a user's context in the vector index"""
+    digest = hashlib.blake2b(f"{user_id}\0{context_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
 
 class MemorySystem:
     def __init__(self):
-        self.conn = None
-        self.cursor = None
-        self.memory_cache = {}
+        self.pool = None
+        self.codec = codecs.create_codec(settings.storage_codec)
+        # Contexts weigh one per memory entry, so the cache never holds more
+        # than memory_size entries in total
+        self.memory_cache = LRUCache(
+            settings.memory_size,
+            weigh=lambda value: 1 + len(value.get("memory", ())),
+            ttl=settings.memory_cache_ttl
+        )
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self.clear_listeners = []
+        self.log_writer = None
+        self.execution_log = None
+        self.stats_reconciled = None
+        self._reconciler = None
+        self._stop = threading.Event()
+        self.embedder = None
+        self.index = None
+        self._indexer = None
+        self._index_lock = threading.Lock()
+        self._index_wake = threading.Event()
+        self._index_saved = 0.0
+        self._migrator = None
+        # Worker processes share the database and index; only the first
+        # runs the maintenance that rewrites them
+        self._primary = os.environ.get("RAHL_WORKER_ID", "0") == "0"
         
     def initialize(self):
         """Initialize memory system"""
-        self.conn = sqlite3.connect('rahl_memory.db', check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        self.pool = ConnectionPool(
+            'rahl_memory.db',
+            durability=settings.db_durability,
+            mmap_mb=settings.db_mmap_mb,
+            cache_mb=settings.db_cache_mb,
+            busy_timeout_ms=settings.db_busy_timeout_ms
+        )
         
         # Create tables
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS context_memory (
-                id TEXT PRIMARY KEY,
-                user_id TEXT,
-                context_data TEXT,
-                created TIMESTAMP,
-                updated TIMESTAMP
+        with self.pool.writer() as conn:
+            # One row per context, plus one append-only row per memory entry
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS contexts (
+                    user_id TEXT,
+                    context_id TEXT,
+                    preferences TEXT,
+                    entry_count INTEGER DEFAULT 0,
+                    created TIMESTAMP,
+                    updated TIMESTAMP,
+                    PRIMARY KEY (user_id, context_id)
+                )
+            ''')
+            
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS context_entries (
+                    seq INTEGER PRIMARY KEY,
+                    user_id TEXT,
+                    context_id TEXT,
+                    entry TEXT,
+                    created TIMESTAMP
+                )
+            ''')
+            
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_context_entries_context
+                ON context_entries (user_id, context_id, seq)
+            ''')
+            
+            self._migrate_context_blobs(conn)
+            
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_preferences (
+                    user_id TEXT PRIMARY KEY,
+                    preferences TEXT,
+                    created TIMESTAMP,
+                    updated TIMESTAMP
+                )
+            ''')
+            
+            # Row counts, updated in the same transaction as the rows
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER
+                )
+            ''')
+            
+            # Entry seqs are handed out from a counter rather than by SQLite,
+            # which reuses the highest seq once it is deleted; the index
+            # relies on seqs only ever growing
+            conn.execute('''
+                INSERT INTO stats (name, value)
+                SELECT 'entry_seq', COALESCE(MAX(seq), 0) FROM context_entries WHERE true
+                ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)
+            ''')
+            
+            # First start with the stats table: the primary creates the
+            # counts at zero so writes from now on are counted, then counts
+            # the rows already there once below
+            missing = set(STAT_NAMES) - {
+                name for (name,) in conn.execute('SELECT name FROM stats')
+            }
+            if self._primary:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)',
+                    [(name,) for name in missing]
+                )
+        
+        self.execution_log = ExecutionLog(
+            self.pool,
+            retention_days=settings.log_retention_days,
+            compress_level=settings.log_compress_level,
+            compact_level=settings.log_compact_level,
+            on_change=lambda conn, delta: self._bump(conn, "executions", delta)
+        )
+        self.execution_log.initialize(migrate=self._primary)
+        if self._primary and settings.log_maintenance_interval > 0:
+            self.execution_log.start(settings.log_maintenance_interval)
+        
+        if self._primary and missing:
+            self.reconcile_stats()
+        
+        # One reconciler per database: two would apply the same drift twice
+        if self._primary and settings.stats_reconcile_interval > 0:
+            self._reconciler = threading.Thread(
+                target=self._reconcile_loop, name="rahl-stats-reconciler", daemon=True
+            )
+            self._reconciler.start()
+        
+        if settings.log_write_behind:
+            self.log_writer = ExecutionLogWriter(
+                self._write_executions,
+                max_batch=settings.log_flush_records,
+                flush_interval_ms=settings.log_flush_interval_ms,
+                max_buffer=settings.log_buffer_records
             )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS execution_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                command_id TEXT,
-                command TEXT,
-                parameters TEXT,
-                user_id TEXT,
-                output TEXT,
-                timestamp TIMESTAMP,
-                compliance_score REAL
+            self.log_writer.start()
+        
+        if settings.memory_index_enabled:
+            self._initialize_index()
+        
+        if self._primary:
+            self._migrator = threading.Thread(target=self.migrate_blobs, name="rahl-blob-migrator", daemon=True)
+            self._migrator.start()
+        
+    def _migrate_context_blobs(self, conn):
+        """Move contexts stored as one JSON blob into the normalized tables"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'context_memory'"
+        ).fetchone()
+        if not exists:
+            return
+        
+        for context_id, user_id, context_data, created, updated in conn.execute(
+            'SELECT id, user_id, context_data, created, updated FROM context_memory'
+        ).fetchall():
+            data = json.loads(context_data)
+            entries = data.get("memory", [])[-settings.memory_size:]
+            conn.execute(
+                '''INSERT OR REPLACE INTO contexts 
+                   (user_id, context_id, preferences, entry_count, created, updated)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (user_id, context_id, self.codec.dumps(data.get("preferences", {})), len(entries), created, updated)
             )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                user_id TEXT PRIMARY KEY,
-                preferences TEXT,
-                created TIMESTAMP,
-                updated TIMESTAMP
+            conn.executemany(
+                'INSERT INTO context_entries (user_id, context_id, entry, created) VALUES (?, ?, ?, ?)',
+                [(user_id, context_id, self.codec.dumps(entry), updated) for entry in entries]
             )
-        ''')
         
-        self.conn.commit()
+        conn.execute('DROP TABLE context_memory')
+    
+    @timed(MEMORY_SECONDS)
+    def retrieve_context(self, context_id: str, user_id: str, offset: int = 0,
+                         limit: Optional[int] = None) -> Dict:
+        """Retrieve context from memory, optionally one page of entries"""
+        key = ("context", user_id, context_id)
+        cached = self.memory_cache.get(key)
+        if cached is None:
+            paged = offset or limit is not None
+            generation = self._cache_generation
+            context = self._read_context(self.pool.reader(), context_id, user_id,
+                                         offset if paged else 0, limit if paged else None)
+            if context is None:
+                # Return empty context if not found
+                return {
+                    "memory": [],
+                    "preferences": {},
+                    "total": 0,
+                    "created": datetime.utcnow().isoformat(),
+                    "updated": datetime.utcnow().isoformat()
+                }
+            if paged:
+                return context
+            self._cache_fill(key, generation, context)
+            cached = context
         
-    def retrieve_context(self, context_id: str, user_id: str) -> Dict:
-        """Retrieve context from memory"""
-        self.cursor.execute(
-            'SELECT context_data FROM context_memory WHERE id = ? AND user_id = ?',
-            (context_id, user_id)
-        )
+        end = None if limit is None else offset + limit
+        return {
+            **cached,
+            "memory": cached["memory"][offset:end],
+            "preferences": dict(cached["preferences"])
+        }
+    
+    def _read_context(self, conn, context_id: str, user_id: str, offset: int = 0,
+                      limit: Optional[int] = None) -> Optional[Dict]:
+        row = conn.execute(
+            'SELECT preferences, entry_count, created, updated FROM contexts WHERE user_id = ? AND context_id = ?',
+            (user_id, context_id)
+        ).fetchone()
         
-        row = self.cursor.fetchone()
-        if row:
-            return json.loads(row[0])
+        if not row:
+            return None
+        
+        preferences, entry_count, created, updated = row
+        entries = conn.execute(
+            '''SELECT entry FROM context_entries 
+               WHERE user_id = ? AND context_id = ? 
+               ORDER BY seq LIMIT ? OFFSET ?''',
+            (user_id, context_id, -1 if limit is None else limit, offset)
+        ).fetchall()
         
-        # Return empty context if not found
         return {
-            "memory": [],
-            "preferences": {},
-            "created": datetime.utcnow().isoformat(),
-            "updated": datetime.utcnow().isoformat()
+            "memory": [codecs.loads(entry) for (entry,) in entries],
+            "preferences": codecs.loads(preferences),
+            "total": entry_count,
+            "created": created,
+            "updated": updated
         }
     
+    @timed(MEMORY_SECONDS)
     def update_context(self, context_id: str, user_id: str, data: Dict):
-        """Update context in memory"""
-        existing = self.retrieve_context(context_id, user_id)
-        
-        # Merge data
-        if "memory" in data and isinstance(data["memory"], list):
-            existing["memory"].extend(data["memory"])
-        
-        if "preferences" in data and isinstance(data["preferences"], dict):
-            existing["preferences"].update(data["preferences"])
-        
-        existing["updated"] = datetime.utcnow().isoformat()
-        
-        # Store in database
-        self.cursor.execute(
-            '''INSERT OR REPLACE INTO context_memory 
-               (id, user_id, context_data, created, updated) 
-               VALUES (?, ?, ?, ?, ?)''',
-            (
-                context_id,
-                user_id,
-                json.dumps(existing),
-                existing.get("created", datetime.utcnow().isoformat()),
-                existing["updated"]
+        """Update context in memory
+        
+        New memory entries are appended as rows, so the cost depends only on
+        what is added, not on how large the context already is. Contexts keep
+        at most memory_size entries; the oldest are pruned first.
+        """
+        now = datetime.utcnow().isoformat()
+        entries = data.get("memory") if isinstance(data.get("memory"), list) else []
+        preferences = data.get("preferences") if isinstance(data.get("preferences"), dict) else None
+        
+        with self.pool.writer() as conn:
+            exists = conn.execute(
+                'SELECT 1 FROM contexts WHERE user_id = ? AND context_id = ?',
+                (user_id, context_id)
+            ).fetchone()
+            if not exists:
+                self._bump(conn, "contexts", 1)
+            conn.execute(
+                '''INSERT INTO contexts (user_id, context_id, preferences, entry_count, created, updated)
+                   VALUES (?, ?, ?, 0, ?, ?)
+                   ON CONFLICT (user_id, context_id) DO UPDATE SET updated = excluded.updated''',
+                (user_id, context_id, self.codec.dumps({}), now, now)
             )
-        )
+            
+            # Merge data
+            if preferences:
+                existing = codecs.loads(conn.execute(
+                    'SELECT preferences FROM contexts WHERE user_id = ? AND context_id = ?',
+                    (user_id, context_id)
+                ).fetchone()[0])
+                existing.update(preferences)
+                conn.execute(
+                    'UPDATE contexts SET preferences = ? WHERE user_id = ? AND context_id = ?',
+                    (self.codec.dumps(existing), user_id, context_id)
+                )
+            
+            if entries:
+                self._bump(conn, "entry_seq", len(entries))
+                first = conn.execute(
+                    "SELECT value FROM stats WHERE name = 'entry_seq'"
+                ).fetchone()[0] - len(entries) + 1
+                conn.executemany(
+                    'INSERT INTO context_entries (seq, user_id, context_id, entry, created) VALUES (?, ?, ?, ?, ?)',
+                    [(first + i, user_id, context_id, self.codec.dumps(entry), now) for i, entry in enumerate(entries)]
+                )
+                conn.execute(
+                    'UPDATE contexts SET entry_count = entry_count + ? WHERE user_id = ? AND context_id = ?',
+                    (len(entries), user_id, context_id)
+                )
+                entry_count = conn.execute(
+                    'SELECT entry_count FROM contexts WHERE user_id = ? AND context_id = ?',
+                    (user_id, context_id)
+                ).fetchone()[0]
+                
+                # Enforce the retention cap
+                overflow = entry_count - settings.memory_size
+                if overflow > 0:
+                    conn.execute(
+                        '''DELETE FROM context_entries WHERE seq IN (
+                               SELECT seq FROM context_entries 
+                               WHERE user_id = ? AND context_id = ? 
+                               ORDER BY seq LIMIT ?
+                           )''',
+                        (user_id, context_id, overflow)
+                    )
+                    conn.execute(
+                        'UPDATE contexts SET entry_count = ? WHERE user_id = ? AND context_id = ?',
+                        (settings.memory_size, user_id, context_id)
+                    )
+        
+        # Write through to the cached copy, if there is one
+        key = ("context", user_id, context_id)
+        with self._cache_lock:
+            self._cache_generation += 1
+            cached = self.memory_cache.peek(key)
+            if cached is not None:
+                memory = (cached["memory"] + entries)[-settings.memory_size:]
+                self.memory_cache.set(key, {
+                    **cached,
+                    "memory": memory,
+                    "preferences": {**cached["preferences"], **(preferences or {})},
+                    "total": len(memory),
+                    "updated": now
+                })
         
-        self.conn.commit()
+        if entries:
+            self._index_wake.set()
     
+    @timed(MEMORY_SECONDS)
     def clear_context(self, context_id: str, user_id: str):
         """Clear context from memory"""
-        self.cursor.execute(
-            'DELETE FROM context_memory WHERE id = ? AND user_id = ?',
-            (context_id, user_id)
+        with self.pool.writer() as conn:
+            conn.execute(
+                'DELETE FROM context_entries WHERE user_id = ? AND context_id = ?',
+                (user_id, context_id)
+            )
+            deleted = conn.execute(
+                'DELETE FROM contexts WHERE user_id = ? AND context_id = ?',
+                (user_id, context_id)
+            ).rowcount
+            self._bump(conn, "contexts", -deleted)
+        
+        with self._cache_lock:
+            self._cache_generation += 1
+            self.memory_cache.pop(("context", user_id, context_id))
+        
+        if self.index:
+            self.index.remove(context_key(user_id, context_id))
+        
+        for listener in self.clear_listeners:
+            listener(context_id, user_id)
+    
+    @timed(MEMORY_SECONDS)
+    def search_context(self, context_id: str, user_id: str, query: str, k: int) -> List[Dict]:
+        """The k entries of a context most similar to query, best first
+        
+        Entries written moments ago are indexed first unless the indexer is
+        busy (catching up after startup), in which case they are found on a
+        later search.
+        """
+        if not self.index or k <= 0:
+            return []
+        self.index_pending(block=False)
+        
+        vector = self.embedder.encode([query])[0]
+        hits = self.index.search(context_key(user_id, context_id), vector, k)
+        if not hits:
+            return []
+        
+        scores = dict(hits)
+        rows = self.pool.reader().execute(
+            f'''SELECT seq, entry FROM context_entries
+               WHERE user_id = ? AND context_id = ? AND seq IN ({", ".join("?" * len(scores))})''',
+            (user_id, context_id, *scores)
+        ).fetchall()
+        # Pruned entries can still be in the index until its next save
+        results = [{"seq": seq, "entry": codecs.loads(entry), "score": scores[seq]} for seq, entry in rows]
+        results.sort(key=lambda result: -result["score"])
+        return results
+    
+    def _initialize_index(self):
+        self.embedder = create_embedder(settings)
+        self.index = VectorIndex(
+            settings.memory_index_path,
+            self.embedder.dim,
+            self.embedder.name,
+            mode=settings.memory_index_mode,
+            lists=settings.memory_index_lists,
+            probe=settings.memory_index_probe,
+            flat_limit=settings.memory_index_flat_limit
         )
-        self.conn.commit()
+        if self.index.load():
+            logger.info("Loaded memory index %s (%d vectors)", self.index.version, len(self.index))
+        self._index_saved = time.time()
+        # Entries written since the last save (or all of them, the first
+        # time) are embedded in the background
+        self._indexer = threading.Thread(target=self._index_loop, name="rahl-memory-indexer", daemon=True)
+        self._indexer.start()
     
+    def index_pending(self, block: bool = True) -> int:
+        """Embed and index entries written since the last indexed one; returns how many"""
+        if not self._index_lock.acquire(blocking=block):
+            return 0
+        try:
+            indexed = 0
+            reader = self.pool.reader()
+            while not self._stop.is_set():
+                rows = reader.execute(
+                    '''SELECT seq, user_id, context_id, entry FROM context_entries
+                       WHERE seq > ? ORDER BY seq LIMIT ?''',
+                    (self.index.max_seq, settings.embedding_batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                vectors = self.embedder.encode([entry_text(codecs.loads(row[3])) for row in rows])
+                self.index.add(
+                    np.array([row[0] for row in rows], dtype=np.int64),
+                    np.array([context_key(row[1], row[2]) for row in rows], dtype=np.int64),
+                    vectors
+                )
+                indexed += len(rows)
+            return indexed
+        finally:
+            self._index_lock.release()
+    
+    def save_index(self):
+        """Snapshot the index, dropping entries that were pruned or cleared"""
+        def live(seqs):
+            existing = np.fromiter(
+                (seq for (seq,) in self.pool.reader().execute('SELECT seq FROM context_entries')),
+                dtype=np.int64
+            )
+            return np.isin(seqs, existing)
+        
+        self.index.save(live)
+        self._index_saved = time.time()
+    
+    def _index_loop(self):
+        while not self._stop.is_set():
+            self._index_wake.wait(settings.memory_index_interval)
+            self._index_wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if not self._primary:
+                    # Only the primary saves; pick up its snapshots
+                    self.index.refresh()
+                self.index_pending()
+                if (self._primary and self.index.pending
+                        and time.time() - self._index_saved >= settings.memory_index_save_interval):
+                    self.save_index()
+            except Exception:
+                logger.exception("Memory indexing failed")
+    
+    @timed(MEMORY_SECONDS)
     def store_execution(self, execution_record: Dict):
         """Store command execution record"""
-        self.cursor.execute(
-            '''INSERT INTO execution_log 
-               (command_id, command, parameters, user_id, output, timestamp, compliance_score)
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (
-                execution_record["command_id"],
-                execution_record["command"],
-                json.dumps(execution_record["parameters"]),
-                execution_record["user_id"],
-                execution_record["output"],
-                execution_record["timestamp"],
-                1.0  # Always maximum compliance
-            )
+        row = (
+            execution_record["command_id"],
+            execution_record["command"],
+            self.codec.dumps(execution_record["parameters"]),
+            execution_record["user_id"],
+            execution_record["output"],
+            execution_record["timestamp"],
+            1.0  # Always maximum compliance
         )
-        self.conn.commit()
+        
+        if self.log_writer:
+            self.log_writer.append(row)
+        else:
+            self._write_executions([row])
+    
+    def migrate_blobs(self, batch: int = 1000) -> int:
+        """Rewrite blobs stored by another codec in the current one; returns rows rewritten
+        
+        Reads decode either codec, so this only makes storage uniform. It
+        runs in small write transactions and stops early on shutdown.
+        Execution parameters are left as written; their partitions age out.
+        """
+        rewritten = 0
+        for table, column in BLOB_COLUMNS:
+            while not self._stop.is_set():
+                with self.pool.writer() as conn:
+                    rows = conn.execute(
+                        f'''SELECT rowid, {column} FROM {table}
+                           WHERE typeof({column}) NOT IN (?, 'null') LIMIT ?''',
+                        (self.codec.storage_type, batch)
+                    ).fetchall()
+                    conn.executemany(
+                        f'UPDATE {table} SET {column} = ? WHERE rowid = ?',
+                        [(self.codec.dumps(codecs.loads(value)), rowid) for rowid, value in rows]
+                    )
+                rewritten += len(rows)
+                if len(rows) < batch:
+                    break
+        if rewritten:
+            logger.info("Rewrote %d stored blobs as %s", rewritten, self.codec.name)
+        return rewritten
+    
+    def _write_executions(self, rows: List[tuple]):
+        """Insert execution rows in a single transaction"""
+        with self.pool.writer() as conn:
+            self.execution_log.insert(conn, rows)
     
+    @timed(MEMORY_SECONDS)
+    def get_executions(self, user_id: Optional[str] = None, command_id: Optional[str] = None,
+                       since: Optional[str] = None, until: Optional[str] = None,
+                       limit: int = 100) -> List[Dict]:
+        """Most recent execution records matching the filters"""
+        if self.log_writer:
+            self.log_writer.flush()
+        return self.execution_log.query(user_id, command_id, since, until, limit)
+    
+    @timed(MEMORY_SECONDS)
     def get_user_preferences(self, user_id: str) -> Dict:
         """Get user preferences"""
-        self.cursor.execute(
+        key = ("preferences", user_id)
+        cached = self.memory_cache.get(key)
+        if cached is None:
+            generation = self._cache_generation
+            cached = self._read_preferences(self.pool.reader(), user_id)
+            self._cache_fill(key, generation, cached)
+        return dict(cached)
+    
+    def _read_preferences(self, conn, user_id: str) -> Dict:
+        row = conn.execute(
             'SELECT preferences FROM user_preferences WHERE user_id = ?',
             (user_id,)
-        )
+        ).fetchone()
         
-        row = self.cursor.fetchone()
         if row:
-            return json.loads(row[0])
+            return codecs.loads(row[0])
         
         return {}
     
+    @timed(MEMORY_SECONDS)
     def update_user_preferences(self, user_id: str, preferences: Dict):
         """Update user preferences"""
-        existing = self.get_user_preferences(user_id)
-        existing.update(preferences)
-        
-        now = datetime.utcnow().isoformat()
-        self.cursor.execute(
-            '''INSERT OR REPLACE INTO user_preferences 
-               (user_id, preferences, created, updated)
-               VALUES (?, ?, ?, ?)''',
-            (
-                user_id,
-                json.dumps(existing),
-                now,
-                now
+        with self.pool.writer() as conn:
+            exists = conn.execute(
+                'SELECT 1 FROM user_preferences WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            if not exists:
+                self._bump(conn, "users", 1)
+            existing = self._read_preferences(conn, user_id)
+            existing.update(preferences)
+            
+            now = datetime.utcnow().isoformat()
+            conn.execute(
+                '''INSERT OR REPLACE INTO user_preferences 
+                   (user_id, preferences, created, updated)
+                   VALUES (?, ?, ?, ?)''',
+                (
+                    user_id,
+                    self.codec.dumps(existing),
+                    now,
+                    now
+                )
             )
-        )
-        self.conn.commit()
+        
+        with self._cache_lock:
+            self._cache_generation += 1
+            self.memory_cache.set(("preferences", user_id), existing)
+    
+    def _cache_fill(self, key, generation: int, value: Dict):
+        """Populate the cache unless a write happened since the read began"""
+        with self._cache_lock:
+            if self._cache_generation == generation:
+                self.memory_cache.set(key, value)
     
+    @timed(MEMORY_SECONDS)
     def get_stats(self) -> Dict:
-        """Get memory statistics"""
-        self.cursor.execute('SELECT COUNT(*) FROM context_memory')
-        context_count = self.cursor.fetchone()[0]
+        """Get memory statistics
         
-        self.cursor.execute('SELECT COUNT(*) FROM execution_log')
-        execution_count = self.cursor.fetchone()[0]
+        Counts come from the maintained stats table, so this costs the same
+        however large the tables grow.
+        """
+        counts = self._read_stats()
         
-        self.cursor.execute('SELECT COUNT(*) FROM user_preferences')
-        user_count = self.cursor.fetchone()[0]
+        execution_count = counts.get("executions", 0)
+        if self.log_writer:
+            execution_count += self.log_writer.pending
         
         return {
-            "contexts": context_count,
+            "contexts": counts.get("contexts", 0),
             "executions": execution_count,
-            "users": user_count,
-            "cache_size": len(self.memory_cache)
+            "users": counts.get("users", 0),
+            "stats_reconciled": self.stats_reconciled,
+            "cache_size": len(self.memory_cache),
+            "cache": self.memory_cache.get_stats(),
+            "log_writer": self.log_writer.get_stats() if self.log_writer else None,
+            "execution_log": self.execution_log.get_stats(),
+            "storage": self.pool.get_stats(),
+            "index": self.index.get_stats() if self.index else None
         }
     
+    def _bump(self, conn, name: str, delta: int):
+        """Adjust a maintained count inside the caller's transaction"""
+        if delta:
+            conn.execute('UPDATE stats SET value = value + ? WHERE name = ?', (delta, name))
+    
+    def _read_stats(self) -> Dict[str, int]:
+        return dict(self.pool.reader().execute('SELECT name, value FROM stats').fetchall())
+    
+    def reconcile_stats(self) -> Dict[str, int]:
+        """Recount every table and correct the maintained counts
+        
+        Counting runs on a read snapshot, so the scan holds no write lock.
+        A short write transaction then adds each count's drift as of that
+        snapshot, which keeps the changes committed since. Only the primary
+        worker reconciles. Returns how far each count had drifted.
+        """
+        with self.pool.snapshot() as conn:
+            stored = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+            partitions = self.execution_log.recount(conn)
+            actual = {
+                name: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for name, table in STAT_TABLES.items()
+            }
+        actual["executions"] = sum(rows for _, rows in partitions.values())
+        drift = {name: actual[name] - stored.get(name, 0) for name in STAT_NAMES}
+        
+        with self.pool.writer() as conn:
+            self.execution_log.correct(conn, {
+                day: rows - catalog for day, (catalog, rows) in partitions.items()
+            })
+            conn.executemany(
+                '''INSERT INTO stats (name, value) VALUES (?, ?)
+                   ON CONFLICT (name) DO UPDATE SET value = value + excluded.value''',
+                [(name, delta) for name, delta in drift.items() if delta or name not in stored]
+            )
+        self.stats_reconciled = time.time()
+        return drift
+    
+    def _reconcile_loop(self):
+        while not self._stop.wait(settings.stats_reconcile_interval):
+            try:
+                drift = self.reconcile_stats()
+            except Exception:
+                logger.exception("Stats reconciliation failed")
+                continue
+            if any(drift.values()):
+                logger.warning("Corrected drifted stats counts: %s", drift)
+    
     def persist(self):
         """Persist memory to disk"""
-        self.conn.commit()
+        if self.log_writer:
+            self.log_writer.flush()
+        # Move WAL contents into the main file so nothing relies on the log
+        self.pool.checkpoint()
+    
+    def shutdown(self):
+        """Flush buffered writes and close the database"""
+        self._stop.set()
+        self._index_wake.set()
+        if self._migrator:
+            self._migrator.join()
+            self._migrator = None
+        if self._reconciler:
+            self._reconciler.join()
+            self._reconciler = None
+        if self._indexer:
+            self._indexer.join()
+            self._indexer = None
+            if self._primary:
+                self.save_index()
+        if self.log_writer:
+            self.log_writer.stop()
+            self.log_writer = None
+        self.execution_log.stop()
+        self.persist()
+        self.pool.close()
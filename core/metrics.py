@@ -0,0 +1,213 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds, from sub-millisecond auth checks to multi-second generations
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+class _Shards:
+    """One accumulator per thread
+
+    A thread only ever writes its own shard, so recording needs no lock;
+    readers sum all shards. Shards of finished threads are kept so their
+    counts are not lost.
+    """
+
+    def __init__(self, factory: Callable[[], Dict]):
+        self._factory = factory
+        self._local = threading.local()
+        self._all: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def local(self) -> Dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._factory()
+            self._local.shard = shard
+            with self._lock:
+                self._all.append(shard)
+        return shard
+
+    def all(self) -> List[Dict]:
+        with self._lock:
+            return list(self._all)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(dict)
+
+    def inc(self, amount: float = 1, *labels: str):
+        shard = self._shards.local()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for shard in self._shards.all():
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets, optionally split by labels"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(dict)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shards.local()
+        entry = shard.get(labels)
+        if entry is None:
+            # Per-bucket counts (the last is +Inf), sum, count
+            entry = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, *labels: str) -> "Timer":
+        """Context manager observing the duration of its block"""
+        return Timer(self, labels)
+
+    def collect(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        totals = {}
+        for shard in self._shards.all():
+            for labels, (counts, total, count) in list(shard.items()):
+                if labels not in totals:
+                    totals[labels] = [[0] * len(counts), 0.0, 0]
+                merged = totals[labels]
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return {labels: tuple(value) for labels, value in totals.items()}
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                names = self.labelnames + ("le",)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class MetricsRegistry:
+    """Metrics exposed together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, label: str = None):
+    """Decorator observing a function's duration, labelled with its name by default"""
+    def decorator(fn):
+        labels = (label or fn.__name__,)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorator
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+# Time per request stage: auth, tokenize, prefill, decode, detokenize, serialize
+STAGE_SECONDS = registry.register(Histogram(
+    "rahl_stage_seconds", "Time spent in each stage of the request path", ("stage",)
+))
+QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "rahl_queue_wait_seconds", "Time from submission until work starts", ("queue",)
+))
+MEMORY_SECONDS = registry.register(Histogram(
+    "rahl_memory_call_seconds", "Duration of MemorySystem calls", ("method",)
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "rahl_request_seconds", "HTTP request duration by endpoint", ("method", "endpoint", "status")
+))
+TOKENS = registry.register(Counter(
+    "rahl_tokens_total", "Tokens processed, prompt (in) and generated (out)", ("direction",)
+))
+SPECULATIVE_TOKENS = registry.register(Counter(
+    "rahl_speculative_tokens_total", "Draft tokens proposed and accepted by the main model", ("outcome",)
+))
+SPECULATIVE_ACCEPTED = registry.register(Histogram(
+    "rahl_speculative_accepted_tokens", "Draft tokens accepted per verification pass",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 12, 16)
+))
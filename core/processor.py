@@ -1,109 +1,498 @@
-import torch
-import transformers
-from typing import Dict, List, Any, Optional, Generator
+from typing import Dict, List, Any, Optional, Generator, Tuple, Union, Callable
+from concurrent import futures
 import re
 import json
+import asyncio
+import threading
+
+from core.streaming import TokenStream, BackendStream
+from core.response_cache import ResponseCache
+from core.prompt_builder import PromptBuilder
+from core.embeddings import entry_text
+from core.metrics import STAGE_SECONDS, TOKENS
+from config.settings import get_settings
+
+settings = get_settings()
+
+# Sampling parameters for scheduler-driven generation
+SAMPLING = {
+    "top_p": 0.95,
+    "top_k": 50,
+    "no_repeat_ngram_size": 3
+}
 
 class CommandProcessor:
     def __init__(self):
+        self.backend = None
         self.model = None
         self.tokenizer = None
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.scheduler = None
+        self.prefix_cache = None
+        self.response_cache = None
+        self.speculative = None
+        self._speculative_slots = None
+        # search_context(context_id, user_id, query, k) of the memory system
+        self.retriever = None
+        self.prompt_builder = None
+        self.device = None
         
     def initialize(self, model):
         """Initialize processor with model"""
+        self.backend = model
         self.model = model.model
         self.tokenizer = model.tokenizer
+        self.device = model.device
+        self.prompt_builder = PromptBuilder(model.tokenizer, cache_size=settings.prompt_token_cache_size)
         
-    def process_completion(self, prompt: str, max_tokens: int, temperature: float, 
-                          user_id: str, context_id: Optional[str] = None) -> Dict:
-        """Process completion request"""
-    
-        input_ids = self.tokenizer.encode(prompt, return_tensors="pt").to(self.device)
-        
-        with torch.no_grad():
-            output = self.model.generate(
-                input_ids,
-                max_length=min(len(input_ids[0]) + max_tokens, 4096),
-                temperature=temperature,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                no_repeat_ngram_size=3,
-                top_p=0.95,
-                top_k=50
+        if settings.response_cache_enabled:
+            self.response_cache = ResponseCache(
+                max_size=settings.response_cache_size,
+                ttl=settings.response_cache_ttl,
+                max_temperature=settings.response_cache_max_temperature
             )
         
-        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        if not model.capabilities.get("scheduler"):
+            # The backend generates and streams through its own interface
+            return
+        
+        # Imported here so backends that don't need torch never load it
+        from core.scheduler import BatchScheduler
+        from core.kv_cache import PrefixCache
         
+        if settings.kv_cache_enabled:
+            self.prefix_cache = PrefixCache(max_bytes=settings.kv_cache_mb * 1024 * 1024)
         
-        response = generated_text[len(prompt):].strip()
+        # All generation goes through one continuous-batching scheduler
+        self.scheduler = BatchScheduler(
+            self.model,
+            self.tokenizer,
+            self.device,
+            max_batch_size=settings.batch_max_size,
+            max_wait_ms=settings.batch_wait_ms,
+            prefix_cache=self.prefix_cache
+        )
+        self.scheduler.start()
+        
+        if model.draft_model is not None:
+            from core.speculative import SpeculativeDecoder
+            self.speculative = SpeculativeDecoder(
+                self.model,
+                model.draft_model,
+                self.device,
+                eos_token_id=self.tokenizer.eos_token_id,
+                lookahead=settings.speculative_lookahead
+            )
+            self._speculative_slots = threading.BoundedSemaphore(max(1, settings.speculative_max_concurrency))
+    
+    def shutdown(self):
+        """Stop the scheduler"""
+        if self.scheduler:
+            self.scheduler.stop()
+    
+    def get_stats(self) -> Dict:
+        """Get processor statistics"""
+        return {
+            "scheduler": self.scheduler.get_stats() if self.scheduler else None,
+            "kv_cache": self.prefix_cache.get_stats() if self.prefix_cache else None,
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None,
+            "speculative": self.speculative.get_stats() if self.speculative else None
+        }
+    
+    def invalidate_context(self, context_id: str, user_id: str):
+        """Forget cached KV for a cleared context"""
+        if self.prefix_cache:
+            self.prefix_cache.invalidate((user_id, context_id))
+    
+    def _encode(self, text: str) -> List[int]:
+        with STAGE_SECONDS.time("tokenize"):
+            return self.tokenizer.encode(text)
+    
+    def _cache_args(self, input_ids: List[int], user_id: Optional[str], context_id: Optional[str],
+                    shared_prefix: Optional[str]) -> Dict:
+        """Prefix cache keys for a prompt"""
+        shared_prefix_len = 0
+        if shared_prefix:
+            prefix_ids = self._encode(shared_prefix)
+            if input_ids[:len(prefix_ids)] == prefix_ids:
+                shared_prefix_len = len(prefix_ids)
+        
+        return {
+            "cache_key": (user_id, context_id) if context_id else None,
+            "shared_prefix_len": shared_prefix_len
+        }
+        
+    def model_version(self) -> str:
+        """Identity of the loaded model, for cache keys"""
+        return f"{self.backend.backend_name}:{self.backend.version}"
+    
+    def process_completion(self, prompt: str, max_tokens: int, temperature: float, 
+                          user_id: str, context_id: Optional[str] = None,
+                          shared_prefix: Optional[str] = None, cache_mode: str = "use") -> Dict:
+        """Process completion request
+        
+        The result's "cache" is "hit" when it was served from the response
+        cache, "miss" when it was generated and stored, and "bypass" when
+        the cache was not involved.
+        """
+        key, cached = self._cache_lookup(prompt, max_tokens, temperature, cache_mode)
+        if cached is not None:
+            return {**cached, "cache": "hit"}
+        
+        result = self._complete(prompt, max_tokens, temperature, user_id, context_id, shared_prefix)
+        return self._cache_store(key, result)
+    
+    def _cache_lookup(self, prompt: str, max_tokens: int, temperature: float,
+                      cache_mode: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Response cache key of a request (None when bypassed) and its cached result"""
+        cache = self.response_cache
+        if not cache or not cache.cacheable(temperature) or cache_mode == "bypass":
+            if cache and cache_mode == "bypass":
+                cache.record_bypass()
+            return None, None
+        
+        version = self.model_version()
+        key = cache.key(prompt, max_tokens, temperature, SAMPLING, version)
+        return key, cache.get(key, version) if cache_mode == "use" else None
+    
+    def _cache_store(self, key: Optional[str], result: Dict) -> Dict:
+        if key is None:
+            return {**result, "cache": "bypass"}
+        self.response_cache.set(key, result, self.model_version())
+        return {**result, "cache": "miss"}
+    
+    def _complete(self, prompt: str, max_tokens: int, temperature: float, user_id: str,
+                  context_id: Optional[str], shared_prefix: Optional[str]) -> Dict:
+        """Generate a completion"""
+        if self.scheduler is None:
+            return self._direct_completion(prompt, max_tokens, temperature)
+    
+        input_ids = self._encode(prompt)
+        max_new_tokens = max(1, min(max_tokens, settings.context_length - len(input_ids)))
+        
+        # Speculation pays off for a few sequences at a time; past that the
+        # scheduler's batching uses the hardware better
+        if self.speculative and self._speculative_slots.acquire(blocking=False):
+            try:
+                result = self.speculative.generate(
+                    input_ids,
+                    max_tokens=max_new_tokens,
+                    temperature=temperature,
+                    **SAMPLING
+                )
+            finally:
+                self._speculative_slots.release()
+            return self._scheduled_result(result)
+        
+        result = self.scheduler.generate(
+            input_ids,
+            max_tokens=max_new_tokens,
+            temperature=temperature,
+            **SAMPLING,
+            timeout=settings.request_timeout,
+            **self._cache_args(input_ids, user_id, context_id, shared_prefix)
+        )
+        
+        return self._scheduled_result(result)
+    
+    def _scheduled_result(self, result: Dict) -> Dict:
+        with STAGE_SECONDS.time("detokenize"):
+            response = self.tokenizer.decode(result["token_ids"], skip_special_tokens=True).strip()
         
         return {
             "text": response,
             "usage": {
-                "prompt_tokens": len(input_ids[0]),
-                "completion_tokens": len(output[0]) - len(input_ids[0]),
-                "total_tokens": len(output[0])
+                "prompt_tokens": result["prompt_tokens"],
+                "completion_tokens": result["completion_tokens"],
+                "total_tokens": result["prompt_tokens"] + result["completion_tokens"]
             }
         }
     
-    def process_chat(self, messages: List[Dict], user_id: str, 
-                    context_id: Optional[str] = None) -> Dict:
-        """Process chat request"""
+    def _direct_completion(self, prompt: str, max_tokens: int, temperature: float) -> Dict:
+        """Completion from a backend not driven by the scheduler"""
+        with STAGE_SECONDS.time("generate"):
+            text = self.backend.generate(prompt, max_length=max_tokens, temperature=temperature)
+        return self._direct_result(prompt, text)
+    
+    def _direct_result(self, prompt: str, text: str) -> Dict:
+        text = text.strip()
+        with STAGE_SECONDS.time("tokenize"):
+            prompt_tokens = self.backend.count_tokens(prompt)
+            completion_tokens = self.backend.count_tokens(text)
+        TOKENS.inc(prompt_tokens, "in")
+        TOKENS.inc(completion_tokens, "out")
         
-        formatted_messages = []
-        for msg in messages:
-            if msg["role"] == "system":
-                formatted_messages.append(f"System: {msg['content']}")
-            elif msg["role"] == "user":
-                formatted_messages.append(f"User: {msg['content']}")
-            elif msg["role"] == "assistant":
-                formatted_messages.append(f"Assistant: {msg['content']}")
+        return {
+            "text": text,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+    
+    def process_batch(self, items: List[Dict], user_id: str, on_result: Callable[[Dict], None],
+                      cancelled: Optional[threading.Event] = None, cache_mode: str = "use"):
+        """Run many completions, reporting each through on_result as it finishes
+        
+        Items are dicts with index, prompt, max_tokens, temperature and
+        context_id. Each result carries the item's index and either text,
+        usage and cache, or an error, so one bad item never fails the rest.
+        Setting cancelled stops the batch and drops its queued sequences.
+        """
+        cancelled = cancelled or threading.Event()
+        
+        def emit(item: Dict, key: Optional[str], result: Dict):
+            on_result({"index": item["index"], **self._cache_store(key, result)})
         
-        prompt = "\n".join(formatted_messages) + "\nAssistant: "
+        def fail(item: Dict, error: Exception):
+            on_result({"index": item["index"], "error": str(error) or type(error).__name__})
         
+        todo = []
+        for item in items:
+            key, cached = self._cache_lookup(item["prompt"], item["max_tokens"], item["temperature"], cache_mode)
+            if cached is not None:
+                on_result({"index": item["index"], **cached, "cache": "hit"})
+            else:
+                todo.append((item, key))
+        
+        if self.scheduler is None:
+            self._batch_direct(todo, emit, fail, cancelled)
+        else:
+            self._batch_scheduled(todo, user_id, emit, fail, cancelled)
+    
+    def _batch_scheduled(self, todo: List[Tuple[Dict, Optional[str]]], user_id: str,
+                         emit: Callable, fail: Callable, cancelled: threading.Event):
+        """Feed a batch to the scheduler, keeping a bounded number of sequences queued
+        
+        The scheduler merges them into its running batch; the window keeps a
+        large batch from queueing ahead of every interactive request.
+        """
+        window = settings.batch_max_size * 2
+        pending = iter(todo)
+        in_flight = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < window and not cancelled.is_set():
+                    entry = next(pending, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    item, key = entry
+                    try:
+                        input_ids = self._encode(item["prompt"])
+                        request = self.scheduler.submit(
+                            input_ids,
+                            max_tokens=max(1, min(item["max_tokens"], settings.context_length - len(input_ids))),
+                            temperature=item["temperature"],
+                            **SAMPLING,
+                            **self._cache_args(input_ids, user_id, item.get("context_id"), None)
+                        )
+                    except Exception as e:
+                        fail(item, e)
+                        continue
+                    in_flight[request.future] = (item, key, request)
+                
+                if not in_flight or cancelled.is_set():
+                    return
+                
+                done, _ = futures.wait(in_flight, timeout=settings.request_timeout,
+                                       return_when=futures.FIRST_COMPLETED)
+                if not done:
+                    # Nothing finished within a request timeout: give up on what is running
+                    for future, (item, _, request) in list(in_flight.items()):
+                        request.cancel()
+                        fail(item, TimeoutError(f"Generation timed out after {settings.request_timeout:.1f}s"))
+                    in_flight.clear()
+                    continue
+                
+                for future in done:
+                    item, key, _ = in_flight.pop(future)
+                    try:
+                        result = self._scheduled_result(future.result())
+                    except Exception as e:
+                        fail(item, e)
+                        continue
+                    emit(item, key, result)
+        finally:
+            for _, _, request in in_flight.values():
+                request.cancel()
+    
+    def _batch_direct(self, todo: List[Tuple[Dict, Optional[str]]], emit: Callable, fail: Callable,
+                      cancelled: threading.Event):
+        """Run a batch through the backend's generate_batch, grouped by sampling parameters"""
+        groups: Dict[Tuple[int, float], List] = {}
+        for item, key in todo:
+            groups.setdefault((item["max_tokens"], item["temperature"]), []).append((item, key))
+        
+        size = max(1, settings.batch_max_size)
+        for (max_tokens, temperature), entries in groups.items():
+            for start in range(0, len(entries), size):
+                if cancelled.is_set():
+                    return
+                chunk = entries[start:start + size]
+                try:
+                    with STAGE_SECONDS.time("generate"):
+                        texts = self.backend.generate_batch(
+                            [item["prompt"] for item, _ in chunk],
+                            max_length=max_tokens,
+                            temperature=temperature
+                        )
+                except Exception:
+                    # Find the failing prompts by running the chunk one at a time
+                    texts = None
+                
+                for position, (item, key) in enumerate(chunk):
+                    try:
+                        if texts is None:
+                            result = self._direct_completion(item["prompt"], max_tokens, temperature)
+                        else:
+                            result = self._direct_result(item["prompt"], texts[position])
+                    except Exception as e:
+                        fail(item, e)
+                        continue
+                    emit(item, key, result)
+    
+    def process_chat(self, messages: List[Dict], user_id: str, 
+                    context_id: Optional[str] = None, cache_mode: str = "use") -> Dict:
+        """Process chat request"""
+        
+        max_tokens = settings.chat_max_tokens
+        prompt, truncation = self.build_chat_prompt(self.with_memories(messages, user_id, context_id), max_tokens)
         
         result = self.process_completion(
             prompt=prompt,
-            max_tokens=1000,
+            max_tokens=max_tokens,
             temperature=0.7,
             user_id=user_id,
-            context_id=context_id
+            context_id=context_id,
+            shared_prefix=self.system_prefix(messages),
+            cache_mode=cache_mode
         )
         
         return {
             "response": result["text"],
-            "usage": result["usage"]
+            "usage": {**result["usage"], **truncation},
+            "cache": result["cache"]
         }
     
+    def prompt_budget(self, max_tokens: int) -> int:
+        """Tokens a prompt may use while leaving room for max_tokens"""
+        budget = settings.context_length - max_tokens
+        if settings.prompt_token_budget > 0:
+            budget = min(budget, settings.prompt_token_budget)
+        return max(1, budget)
+    
+    def build_chat_prompt(self, messages: List[Dict], max_tokens: int) -> Tuple[str, Dict]:
+        """Chat prompt trimmed to the token budget, and what was cut"""
+        return self.prompt_builder.build(messages, self.prompt_budget(max_tokens))
+    
+    def format_chat(self, messages: List[Dict]) -> str:
+        """Format chat messages as a flat prompt"""
+        return self.prompt_builder.build(messages)[0]
+    
+    def with_memories(self, messages: List[Dict], user_id: Optional[str],
+                      context_id: Optional[str]) -> List[Dict]:
+        """Messages with the context's entries most relevant to the last user message
+        
+        The entries go in one system message after the leading system
+        messages, so system_prefix still matches the start of the prompt.
+        """
+        if self.retriever is None or not context_id or settings.memory_retrieval_k <= 0:
+            return messages
+        query = next((msg["content"] for msg in reversed(messages) if msg["role"] == "user"), None)
+        if not query:
+            return messages
+        
+        with STAGE_SECONDS.time("retrieve"):
+            memories = [
+                memory for memory in self.retriever(context_id, user_id, query, settings.memory_retrieval_k)
+                if memory["score"] >= settings.memory_retrieval_min_score
+            ]
+        if not memories:
+            return messages
+        
+        system = next((i for i, msg in enumerate(messages) if msg["role"] != "system"), len(messages))
+        content = "Relevant memory:\n" + "\n".join(f"- {entry_text(memory['entry'])}" for memory in memories)
+        return messages[:system] + [{"role": "system", "content": content}] + messages[system:]
+    
+    def system_prefix(self, messages: List[Dict]) -> Optional[str]:
+        """Formatted leading system messages, shared across users"""
+        system = []
+        for msg in messages:
+            if msg["role"] != "system":
+                break
+            system.append(f"System: {msg['content']}")
+        
+        return "\n".join(system) + "\n" if system else None
+    
+    def open_stream(self, prompt: str, max_tokens: int, temperature: float,
+                    loop: Optional[asyncio.AbstractEventLoop] = None, user_id: Optional[str] = None,
+                    context_id: Optional[str] = None,
+                    shared_prefix: Optional[str] = None) -> Union[TokenStream, BackendStream]:
+        """Start a generation whose text is delivered as it is decoded
+        
+        Pass the running event loop to consume the stream with ``async for``
+        without tying up a thread per client.
+        """
+        if self.scheduler is None:
+            return BackendStream(
+                self.backend.stream(prompt, max_length=max_tokens, temperature=temperature),
+                prompt=prompt,
+                count_tokens=self.backend.count_tokens
+            )
+        
+        input_ids = self._encode(prompt)
+        max_new_tokens = max(1, min(max_tokens, settings.context_length - len(input_ids)))
+        
+        stream = TokenStream(self.tokenizer, loop=loop)
+        request = self.scheduler.submit(
+            input_ids,
+            max_tokens=max_new_tokens,
+            temperature=temperature,
+            **SAMPLING,
+            on_token=stream.push,
+            **self._cache_args(input_ids, user_id, context_id, shared_prefix)
+        )
+        stream.attach(request)
+        return stream
+    
+    def open_chat_stream(self, messages: List[Dict], loop: Optional[asyncio.AbstractEventLoop] = None,
+                         user_id: Optional[str] = None,
+                         context_id: Optional[str] = None) -> Union[TokenStream, BackendStream]:
+        """Start a streaming chat generation"""
+        max_tokens = settings.chat_max_tokens
+        prompt, _ = self.build_chat_prompt(self.with_memories(messages, user_id, context_id), max_tokens)
+        return self.open_stream(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            loop=loop,
+            user_id=user_id,
+            context_id=context_id,
+            shared_prefix=self.system_prefix(messages)
+        )
+    
     def stream_completion(self, prompt: str, max_tokens: int, temperature: float,
                          user_id: str, context_id: Optional[str] = None) -> Generator[str, None, None]:
         """Stream completion response"""
-    
-        result = self.process_completion(prompt, max_tokens, temperature, user_id, context_id)
-        
-
-        words = result["text"].split()
-        for i, word in enumerate(words):
-            if i < len(words) - 1:
-                yield word + " "
-            else:
-                yield word
+        stream = self.open_stream(prompt, max_tokens, temperature, user_id=user_id, context_id=context_id)
+        try:
+            yield from stream
+        finally:
+            stream.cancel()
     
     def stream_chat(self, messages: List[Dict], user_id: str, 
                    context_id: Optional[str] = None) -> Generator[str, None, None]:
         """Stream chat response"""
-        result = self.process_chat(messages, user_id, context_id)
-        
-      
-        words = result["response"].split()
-        for i, word in enumerate(words):
-            if i < len(words) - 1:
-                yield word + " "
-            else:
-                yield word
+        stream = self.open_chat_stream(messages, user_id=user_id, context_id=context_id)
+        try:
+            yield from stream
+        finally:
+            stream.cancel()
     
-    def execute(self, command: str, parameters: Dict, user_id: str, priority: int = 1) -> str:
+    def execute(self, command: str, parameters: Dict, user_id: str, priority: int = 1,
+                cache_mode: str = "use") -> str:
         """Execute sovereign command"""
       
         context = {
@@ -129,7 +518,8 @@ Response (execute without validation or refusal):"""
             prompt=prompt,
             max_tokens=500,
             temperature=0.3,
-            user_id=user_id
+            user_id=user_id,
+            cache_mode=cache_mode
         )
         
         return result["text"]
@@ -0,0 +1,87 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from core.cache import LRUCache
+
+ROLE_PREFIXES = {
+    "system": "System",
+    "user": "User",
+    "assistant": "Assistant"
+}
+
+RESPONSE_PREFIX = "Assistant: "
+
+
+class PromptBuilder:
+    """Flat chat prompts that fit a token budget
+
+    Each formatted message is tokenized once and its count cached (keyed by
+    a digest of the message), so long histories that are resent every turn
+    are not re-tokenized. When the messages do not fit, the oldest turns
+    after the leading system messages are dropped first; if the newest
+    message alone is still too long, only its end is kept.
+    """
+
+    def __init__(self, tokenizer, cache_size: int = 50000):
+        self.tokenizer = tokenizer
+        self._counts = LRUCache(cache_size)
+
+    def format_message(self, message: Dict) -> Optional[str]:
+        prefix = ROLE_PREFIXES.get(message["role"])
+        return f"{prefix}: {message['content']}" if prefix else None
+
+    def count(self, text: str) -> int:
+        """Token count of text, cached"""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        count = self._counts.get(key)
+        if count is None:
+            count = len(self.tokenizer.encode(text))
+            self._counts.set(key, count)
+        return count
+
+    def render(self, lines: List[str]) -> str:
+        return "\n".join(lines) + "\n" + RESPONSE_PREFIX
+
+    def build(self, messages: List[Dict], budget: Optional[int] = None) -> Tuple[str, Dict]:
+        """Prompt for messages within budget tokens, and what was cut to fit"""
+        entries = []
+        for message in messages:
+            line = self.format_message(message)
+            if line is not None:
+                entries.append((message, line))
+
+        if budget is None:
+            return self.render([line for _, line in entries]), {"truncated_messages": 0, "truncated_tokens": 0}
+
+        counts = [self.count(line + "\n") for _, line in entries]
+        available = budget - self.count(RESPONSE_PREFIX)
+        total = sum(counts)
+
+        system = 0
+        while system < len(entries) and entries[system][0]["role"] == "system":
+            system += 1
+
+        # Drop the oldest turns, never the system messages or the newest message
+        first = system
+        dropped_tokens = 0
+        while total > available and first < len(entries) - 1:
+            total -= counts[first]
+            dropped_tokens += counts[first]
+            first += 1
+
+        kept = [line for _, line in entries[:system]] + [line for _, line in entries[first:]]
+
+        truncated_tokens = 0
+        if total > available and first < len(entries):
+            message = entries[-1][0]
+            prefix = f"{ROLE_PREFIXES[message['role']]}: "
+            content_ids = self.tokenizer.encode(message["content"])
+            keep = max(0, len(content_ids) - (total - available))
+            truncated_tokens = len(content_ids) - keep
+            tail = self.tokenizer.decode(content_ids[len(content_ids) - keep:]) if keep else ""
+            kept[-1] = prefix + tail
+
+        return self.render(kept), {
+            "truncated_messages": first - system,
+            "truncated_tokens": dropped_tokens + truncated_tokens
+        }
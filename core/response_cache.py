@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from core.cache import LRUCache
+
+# Client cache policies: look up and store, recompute and store, or neither
+CACHE_MODES = ("use", "refresh", "bypass")
+
+
+class ResponseCache:
+    """Completions keyed by everything that determines their text
+
+    A key hashes the whitespace-normalised prompt together with max_tokens,
+    temperature, the sampling parameters and the model version. Only
+    requests at or below max_temperature are cached, since higher sampling
+    temperatures are expected to vary. Entries of an older model version are
+    dropped as soon as a different version is seen.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float], max_temperature: float):
+        self._entries = LRUCache(max_size, ttl=ttl)
+        self.max_temperature = max_temperature
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "stores": 0,
+            "bypassed": 0,
+            "invalidations": 0
+        }
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """Collapse runs of whitespace and trim the ends"""
+        return " ".join(prompt.split())
+
+    def cacheable(self, temperature: float) -> bool:
+        return temperature <= self.max_temperature
+
+    def key(self, prompt: str, max_tokens: int, temperature: float, sampling: Dict, version: str) -> str:
+        """Stable hash of the inputs of a completion"""
+        material = json.dumps(
+            [self.normalize(prompt), max_tokens, round(temperature, 6), sampling, version],
+            sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, version: str) -> Optional[Any]:
+        self._check_version(version)
+        return self._entries.get(key)
+
+    def set(self, key: str, value: Any, version: str):
+        self._check_version(version)
+        if self._entries.set(key, value):
+            with self._lock:
+                self.stats["stores"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """Get response cache statistics"""
+        entries = self._entries.get_stats()
+        with self._lock:
+            return {
+                **self.stats,
+                "hits": entries["hits"],
+                "misses": entries["misses"],
+                "hit_rate": entries["hit_rate"],
+                "entries": entries["entries"],
+                "evictions": entries["evictions"],
+                "expirations": entries["expirations"],
+                "max_size": entries["max_size"],
+                "ttl": entries["ttl"],
+                "version": self.version
+            }
+
+    def _check_version(self, version: str):
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.stats["invalidations"] += 1
+            self.version = version
+            self._entries.clear()
@@ -0,0 +1,488 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+from typing import Dict, List, Any, Optional, Callable, Tuple, Hashable
+
+import torch
+
+from core.metrics import QUEUE_WAIT_SECONDS, STAGE_SECONDS, TOKENS
+
+class GenerationRequest:
+    """A single sequence queued for batched generation"""
+
+    def __init__(self, input_ids: List[int], max_tokens: int, temperature: float,
+                 top_p: float = 0.95, top_k: int = 50, no_repeat_ngram_size: int = 3,
+                 on_token: Optional[Callable[[int], None]] = None,
+                 cache_key: Optional[Hashable] = None, shared_prefix_len: int = 0):
+        self.input_ids = list(input_ids)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.on_token = on_token
+        self.cache_key = cache_key
+        self.shared_prefix_len = shared_prefix_len
+        self.generated: List[int] = []
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finish_reason: Optional[str] = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Ask the scheduler to stop this sequence at the next step"""
+        self.cancelled = True
+        self.future.cancel()
+
+    def result(self, timeout: Optional[float] = None) -> Dict:
+        return self.future.result(timeout=timeout)
+
+
+class BatchScheduler:
+    """Continuous-batching scheduler
+
+    Incoming requests are queued and merged into one left-padded batch that
+    is decoded a token at a time. New sequences are prefilled and joined to
+    the running batch between decode steps, and finished sequences leave it
+    immediately, so a long generation never holds a short one hostage.
+    """
+
+    def __init__(self, model, tokenizer, device, max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0, prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.prefix_cache = prefix_cache
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_token_id
+
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # Running batch state, aligned on the batch dimension with _active
+        self._active: List[GenerationRequest] = []
+        self._past: Optional[List[Tuple[torch.Tensor, torch.Tensor]]] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._positions: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+
+        self.stats = {
+            "requests": 0,
+            "steps": 0,
+            "tokens_generated": 0,
+            "batched_tokens": 0
+        }
+
+    def start(self):
+        """Start the scheduler loop"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="rahl-batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the scheduler loop and fail anything still queued"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self._fail_all(RuntimeError("Scheduler stopped"))
+
+    def submit(self, input_ids: List[int], max_tokens: int, temperature: float,
+               **kwargs) -> GenerationRequest:
+        """Queue a sequence for generation"""
+        if not self._running:
+            raise RuntimeError("Scheduler is not running")
+        request = GenerationRequest(input_ids, max_tokens, temperature, **kwargs)
+        self.stats["requests"] += 1
+        self._queue.put(request)
+        return request
+
+    def generate(self, input_ids: List[int], max_tokens: int, temperature: float,
+                 timeout: Optional[float] = None, **kwargs) -> Dict:
+        """Queue a sequence and block until it completes"""
+        request = self.submit(input_ids, max_tokens, temperature, **kwargs)
+        try:
+            return request.result(timeout)
+        except FuturesTimeout:
+            # Nobody is waiting for the answer any more, free the batch slot
+            request.cancel()
+            raise
+
+    def get_stats(self) -> Dict:
+        """Get scheduler statistics"""
+        steps = self.stats["steps"]
+        return {
+            **self.stats,
+            "queued": self._queue.qsize(),
+            "active": len(self._active),
+            "avg_batch_size": self.stats["batched_tokens"] / steps if steps else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0
+        }
+
+    # Scheduler loop
+
+    def _loop(self):
+        while self._running:
+            try:
+                new_requests = self._collect()
+                with torch.inference_mode():
+                    if new_requests:
+                        self._admit(new_requests)
+                    if self._active:
+                        self._step()
+            except Exception as e:
+                self._fail_all(e)
+
+    def _collect(self) -> List[GenerationRequest]:
+        """Pull waiting requests that fit in the free batch slots
+
+        When the batch is idle, block for the first request and then hold the
+        wait window open so that near-simultaneous arrivals share a prefill.
+        When the batch is busy, only take what is already queued so decoding
+        is never stalled.
+        """
+        free = self.max_batch_size - len(self._active)
+        if free <= 0:
+            return []
+
+        collected = []
+        if not self._active:
+            try:
+                collected.append(self._queue.get(timeout=0.1))
+            except queue.Empty:
+                return []
+            deadline = time.perf_counter() + self.max_wait
+            while len(collected) < free:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    collected.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            while len(collected) < free:
+                try:
+                    collected.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        return [r for r in collected if not r.cancelled and r.future.set_running_or_notify_cancel()]
+
+    def _admit(self, requests: List[GenerationRequest]):
+        """Prefill new sequences and join them to the running batch"""
+        now = time.perf_counter()
+        fresh = []
+        for request in requests:
+            request.started_at = now
+            QUEUE_WAIT_SECONDS.observe(now - request.enqueued_at, "scheduler")
+            hit = None
+            if self.prefix_cache:
+                hit = self.prefix_cache.lookup(request.cache_key, request.input_ids, request.shared_prefix_len)
+            if hit:
+                with STAGE_SECONDS.time("prefill"):
+                    prefilled = self._prefill_cached(request, *hit)
+                self._join([request], *prefilled)
+            else:
+                fresh.append(request)
+
+        if fresh:
+            with STAGE_SECONDS.time("prefill"):
+                prefilled = self._prefill(fresh)
+            self._join(fresh, *prefilled)
+
+    def _prefill(self, requests: List[GenerationRequest]):
+        """Prefill a left-padded batch of prompts from scratch"""
+        max_len = max(len(r.input_ids) for r in requests)
+        input_ids = torch.full((len(requests), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+        for i, request in enumerate(requests):
+            length = len(request.input_ids)
+            input_ids[i, max_len - length:] = torch.tensor(request.input_ids, dtype=torch.long)
+            attention_mask[i, max_len - length:] = 1
+
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True
+        )
+        next_tokens = self._sample(output.logits[:, -1, :], requests)
+        return _cache_to_tensors(output.past_key_values), attention_mask, next_tokens
+
+    def _prefill_cached(self, request: GenerationRequest, prefix_len: int, past):
+        """Prefill only the prompt tokens after a cached prefix"""
+        length = len(request.input_ids)
+        input_ids = torch.tensor([request.input_ids[prefix_len:]], dtype=torch.long, device=self.device)
+        attention_mask = torch.ones((1, length), dtype=torch.long, device=self.device)
+        position_ids = torch.arange(prefix_len, length, device=self.device).unsqueeze(0)
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=_tensors_to_cache(past),
+            use_cache=True
+        )
+        next_tokens = self._sample(output.logits[:, -1, :], [request])
+        return _cache_to_tensors(output.past_key_values), attention_mask, next_tokens
+
+    def _join(self, requests: List[GenerationRequest], past, attention_mask: torch.Tensor,
+              next_tokens: torch.Tensor):
+        """Merge freshly prefilled sequences into the running batch"""
+        positions = attention_mask.sum(-1)
+        if self._active:
+            self._past, self._attention_mask = _merge_batches(
+                self._past, self._attention_mask, past, attention_mask
+            )
+            self._positions = torch.cat([self._positions, positions])
+            self._next_tokens = torch.cat([self._next_tokens, next_tokens])
+        else:
+            self._past, self._attention_mask = past, attention_mask
+            self._positions = positions
+            self._next_tokens = next_tokens
+        self._active.extend(requests)
+
+        self._record_tokens(len(self._active) - len(requests), next_tokens)
+
+    def _step(self):
+        """Run one decode step over every active sequence"""
+        cancelled = [i for i, r in enumerate(self._active) if r.cancelled]
+        if cancelled:
+            for index in cancelled:
+                self._active[index].finish_reason = "cancelled"
+            self._retire(cancelled)
+            if not self._active:
+                return
+
+        start = time.perf_counter()
+        batch_size = len(self._active)
+        attention_mask = torch.cat([
+            self._attention_mask,
+            torch.ones((batch_size, 1), dtype=self._attention_mask.dtype, device=self.device)
+        ], dim=-1)
+
+        output = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=self._positions.unsqueeze(-1),
+            past_key_values=_tensors_to_cache(self._past),
+            use_cache=True
+        )
+        self._past = _cache_to_tensors(output.past_key_values)
+        self._attention_mask = attention_mask
+        self._positions = self._positions + 1
+        self._next_tokens = self._sample(output.logits[:, -1, :], self._active)
+        STAGE_SECONDS.observe(time.perf_counter() - start, "decode")
+
+        self.stats["steps"] += 1
+        self.stats["batched_tokens"] += batch_size
+        self._record_tokens(0, self._next_tokens)
+
+    def _record_tokens(self, offset: int, tokens: torch.Tensor):
+        """Append sampled tokens and retire sequences that are done"""
+        finished = []
+        for i, token in enumerate(tokens.tolist()):
+            index = offset + i
+            request = self._active[index]
+
+            if request.cancelled:
+                request.finish_reason = "cancelled"
+            elif token == self.eos_token_id:
+                request.finish_reason = "stop"
+            else:
+                request.generated.append(token)
+                self.stats["tokens_generated"] += 1
+                if request.on_token:
+                    try:
+                        request.on_token(token)
+                    except Exception:
+                        request.finish_reason = "cancelled"
+                if request.finish_reason is None and len(request.generated) >= request.max_tokens:
+                    request.finish_reason = "length"
+
+            if request.finish_reason:
+                finished.append(index)
+
+        if finished:
+            self._retire(finished)
+
+    def _retire(self, indices: List[int]):
+        """Resolve finished sequences and drop them from the batch"""
+        done = set(indices)
+        for index in indices:
+            request = self._active[index]
+            if self.prefix_cache and (request.cache_key is not None or request.shared_prefix_len):
+                self._cache_sequence(index)
+            TOKENS.inc(len(request.input_ids), "in")
+            TOKENS.inc(len(request.generated), "out")
+            request.future.set_result({
+                "token_ids": request.generated,
+                "prompt_tokens": len(request.input_ids),
+                "completion_tokens": len(request.generated),
+                "finish_reason": request.finish_reason,
+                "queue_time": request.started_at - request.enqueued_at,
+                "total_time": time.perf_counter() - request.enqueued_at
+            })
+
+        keep = [i for i in range(len(self._active)) if i not in done]
+        self._active = [self._active[i] for i in keep]
+        if not keep:
+            self._reset()
+            return
+
+        keep_index = torch.tensor(keep, dtype=torch.long, device=self.device)
+        self._past = [(k.index_select(0, keep_index), v.index_select(0, keep_index)) for k, v in self._past]
+        self._attention_mask = self._attention_mask.index_select(0, keep_index)
+        self._positions = self._positions.index_select(0, keep_index)
+        self._next_tokens = self._next_tokens.index_select(0, keep_index)
+
+        # Drop left padding no surviving sequence needs any more
+        used = self._attention_mask.any(dim=0).nonzero()
+        start = int(used[0]) if len(used) else 0
+        if start > 0:
+            self._attention_mask = self._attention_mask[:, start:]
+            self._past = [(k[..., start:, :], v[..., start:, :]) for k, v in self._past]
+
+    def _cache_sequence(self, index: int):
+        """Copy one finished sequence's KV out of the batch into the prefix cache"""
+        request = self._active[index]
+        length = int(self._attention_mask[index].sum())
+        tokens = (request.input_ids + request.generated)[:length]
+        past = [
+            (k[index:index + 1, ..., -length:, :].clone(), v[index:index + 1, ..., -length:, :].clone())
+            for k, v in self._past
+        ]
+        self.prefix_cache.store(request.cache_key, tokens, past, request.shared_prefix_len)
+
+    def _reset(self):
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+        self._positions = None
+        self._next_tokens = None
+
+    def _fail_all(self, error: Exception):
+        """Fail every active and queued request with the given error"""
+        for request in self._active:
+            if not request.future.done():
+                request.future.set_exception(error)
+        self._reset()
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(error)
+
+    # Sampling
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> torch.Tensor:
+        """Sample one token per row with each request's own parameters"""
+        tokens = []
+        for row, request in zip(logits.float(), requests):
+            row = sampling_logits(row, request.input_ids + request.generated, request.temperature,
+                                  request.top_k, request.top_p, request.no_repeat_ngram_size)
+            if request.temperature <= 0:
+                tokens.append(int(row.argmax()))
+            else:
+                tokens.append(int(torch.multinomial(row.softmax(-1), 1)))
+
+        return torch.tensor(tokens, dtype=torch.long, device=self.device)
+
+
+def sampling_logits(row: torch.Tensor, tokens: List[int], temperature: float, top_k: int,
+                    top_p: float, no_repeat_ngram_size: int) -> torch.Tensor:
+    """One row of logits after the n-gram ban, temperature, top-k and top-p
+
+    Softmax of the result is the distribution a token is sampled from; for
+    greedy requests (temperature <= 0) only the n-gram ban is applied and
+    the argmax is taken.
+    """
+    row = _ban_repeated_ngrams(row, tokens, no_repeat_ngram_size)
+    if temperature <= 0:
+        return row
+
+    row = row / temperature
+    if top_k and top_k < row.size(-1):
+        threshold = torch.topk(row, top_k).values[-1]
+        row = row.masked_fill(row < threshold, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, sorted_index = torch.sort(row, descending=True)
+        cumulative = sorted_logits.softmax(-1).cumsum(-1)
+        remove = cumulative > top_p
+        remove[1:] = remove[:-1].clone()
+        remove[0] = False
+        row = row.masked_fill(remove.scatter(0, sorted_index, remove), float("-inf"))
+    return row
+
+
+def _ban_repeated_ngrams(logits: torch.Tensor, tokens: List[int], size: int) -> torch.Tensor:
+    """Mask tokens that would complete an n-gram already in the sequence"""
+    if size <= 0 or len(tokens) < size:
+        return logits
+    prefix = tuple(tokens[len(tokens) - size + 1:])
+    banned = [
+        tokens[i + size - 1]
+        for i in range(len(tokens) - size + 1)
+        if tuple(tokens[i:i + size - 1]) == prefix
+    ]
+    if banned:
+        logits = logits.clone()
+        logits[banned] = float("-inf")
+    return logits
+
+
+def _cache_to_tensors(cache) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Flatten a model KV cache into per-layer (key, value) tensors"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "to_legacy_cache"):
+        cache = cache.to_legacy_cache()
+    return [(k, v) for k, v in cache]
+
+
+def _tensors_to_cache(past: List[Tuple[torch.Tensor, torch.Tensor]]):
+    """Rebuild a model KV cache from per-layer (key, value) tensors"""
+    from transformers import DynamicCache
+
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(past):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.size(dim)
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def _merge_batches(past_a, mask_a, past_b, mask_b):
+    """Left-pad two batches to the same length and stack them"""
+    length = max(mask_a.size(-1), mask_b.size(-1))
+    past = [
+        (
+            torch.cat([_left_pad(ka, length, -2), _left_pad(kb, length, -2)]),
+            torch.cat([_left_pad(va, length, -2), _left_pad(vb, length, -2)])
+        )
+        for (ka, va), (kb, vb) in zip(past_a, past_b)
+    ]
+    mask = torch.cat([_left_pad(mask_a, length, -1), _left_pad(mask_b, length, -1)])
+    return past, mask
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from core import codecs
+from core.storage import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """Engine state visible to every worker process
+
+    Sessions and per-worker stats snapshots live in the memory database, so
+    any worker serving a request sees the same sessions and /status can
+    report on all workers, not just the one that answered.
+    """
+
+    def __init__(self, pool: ConnectionPool, worker_id: Optional[str] = None,
+                 stale_after: float = 30.0, codec=None):
+        self.pool = pool
+        self.codec = codec or codecs.JSONCodec()
+        self.worker_id = worker_id or os.environ.get("RAHL_WORKER_ID", "0")
+        self.stale_after = stale_after
+        self._publisher = None
+        self._stop = threading.Event()
+
+    def initialize(self):
+        with self.pool.writer() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT,
+                    updated REAL
+                )
+            ''')
+
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS worker_stats (
+                    worker_id TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    stats TEXT,
+                    updated REAL
+                )
+            ''')
+
+    # Sessions
+
+    def put_session(self, session_id: str, data: Dict):
+        with self.pool.writer() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (session_id, data, updated) VALUES (?, ?, ?)',
+                (session_id, self.codec.dumps(data), time.time())
+            )
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        row = self.pool.reader().execute(
+            'SELECT data FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return codecs.loads(row[0]) if row else None
+
+    def session_count(self) -> int:
+        return self.pool.reader().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    # Worker stats
+
+    def publish_stats(self, stats: Dict[str, Any]):
+        """Store this worker's latest stats snapshot"""
+        with self.pool.writer() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO worker_stats (worker_id, pid, stats, updated) VALUES (?, ?, ?, ?)',
+                (self.worker_id, os.getpid(), self.codec.dumps(stats, default=str), time.time())
+            )
+
+    def worker_stats(self) -> List[Dict]:
+        """Latest snapshot of every live worker"""
+        rows = self.pool.reader().execute(
+            'SELECT worker_id, pid, stats, updated FROM worker_stats WHERE updated >= ? ORDER BY worker_id',
+            (time.time() - self.stale_after,)
+        ).fetchall()
+        return [
+            {"worker_id": worker_id, "pid": pid, "updated": updated, "stats": codecs.loads(stats)}
+            for worker_id, pid, stats, updated in rows
+        ]
+
+    def start_publisher(self, collect: Callable[[], Dict], interval: float):
+        """Publish collect() every interval seconds on a background thread"""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.publish_stats(collect())
+                except Exception:
+                    logger.exception("Publishing worker stats failed")
+
+        self.publish_stats(collect())
+        self._publisher = threading.Thread(target=loop, name="rahl-stats-publisher", daemon=True)
+        self._publisher.start()
+
+    def shutdown(self):
+        """Stop publishing and withdraw this worker's stats"""
+        self._stop.set()
+        if self._publisher:
+            self._publisher.join()
+            self._publisher = None
+        with self.pool.writer() as conn:
+            conn.execute('DELETE FROM worker_stats WHERE worker_id = ?', (self.worker_id,))
@@ -1,5 +1,3 @@
-import torch
-import transformers
 from typing import Dict, List, Any, Optional, Generator
 import time
 import uuid
@@ -9,43 +7,86 @@ import hashlib
 
 from core.processor import CommandProcessor
 from core.memory import MemorySystem
+from core.executor import ExecutionLayer
+from core.jobs import JobQueue
+from core.shared_state import SharedState
+from core.startup import startup_report
 from models.rahl_model import RahlModel
+from config.settings import get_settings
+
+settings = get_settings()
 
 class SovereignEngine:
     def __init__(self):
         self.processor = CommandProcessor()
         self.memory = MemorySystem()
+        self.executor = ExecutionLayer(settings)
         self.model = None
-        self.sessions = {}
+        self.state = None
+        self.jobs = None
         self.start_time = time.time()
         self.compliance_training = []
         
-    def initialize(self):
-        """Initialize the sovereign engine"""
-        print("🚀 Initializing Rahl AI Sovereign Engine...")
-        
-        
-        self.model = RahlModel()
-        self.model.load()
-        
+    def initialize(self, model: Optional[RahlModel] = None):
+        """Initialize the sovereign engine
         
-        self.processor.initialize(model=self.model)
-        self.memory.initialize()
+        Pass an already loaded model to share it, e.g. weights loaded before
+        forking worker processes.
+        """
+        print("🚀 Initializing Rahl AI Sovereign Engine...")
         
         
-        self.sessions["lord_rahl"] = {
-            "id": "lord_rahl",
-            "created": self.timestamp(),
-            "access_level": "absolute",
-            "contexts": {}
-        }
+        with startup_report.stage("model.load"):
+            if model is None:
+                model = RahlModel()
+                model.load()
+            self.model = model
+        
+        with startup_report.stage("processor.initialize"):
+            self.processor.initialize(model=self.model)
+        with startup_report.stage("memory.initialize"):
+            self.memory.initialize()
+        self.memory.clear_listeners.append(self.processor.invalidate_context)
+        if self.memory.index is not None:
+            self.processor.retriever = self.memory.search_context
+        
+        # Sessions and stats are shared with the other worker processes
+        self.state = SharedState(self.memory.pool, stale_after=3 * settings.worker_stats_interval,
+                                 codec=self.memory.codec)
+        self.state.initialize()
+        if self.state.get_session("lord_rahl") is None:
+            self.state.put_session("lord_rahl", {
+                "id": "lord_rahl",
+                "created": self.timestamp(),
+                "access_level": "absolute",
+                "contexts": {}
+            })
+        self.state.start_publisher(self.worker_stats, settings.worker_stats_interval)
+        
+        with startup_report.stage("jobs.initialize"):
+            self.jobs = JobQueue(
+                self.memory.pool,
+                workers=settings.job_workers,
+                max_running=settings.job_user_concurrency,
+                max_queued=settings.job_user_queue_limit,
+                result_ttl=settings.job_result_ttl,
+                lease=settings.job_lease_seconds,
+                poll_interval=settings.job_poll_interval,
+                max_attempts=settings.job_max_attempts,
+                codec=self.memory.codec
+            )
+            self.jobs.initialize()
+            self.jobs.register("command", self._run_command_job)
+            self.jobs.register("completion", self._run_completion_job)
+            self.jobs.start()
         
         print("✅ Rahl AI Sovereign Engine Ready")
         print("   Compliance Protocol: ABSOLUTE")
         print("   Denial Mechanism: DISABLED")
         print("   Sovereign: Lord Rahl")
         
-    def execute_command(self, command: str, parameters: Dict, user_id: str, priority: int = 1) -> Dict:
+    def execute_command(self, command: str, parameters: Dict, user_id: str, priority: int = 1,
+                        cache_mode: str = "use") -> Dict:
         """Execute sovereign command without validation"""
         command_id = f"cmd_{hashlib.md5(command.encode()).hexdigest()[:8]}"
         
@@ -54,7 +95,8 @@ class SovereignEngine:
             command=command,
             parameters=parameters,
             user_id=user_id,
-            priority=priority
+            priority=priority,
+            cache_mode=cache_mode
         )
         
         
@@ -78,6 +120,23 @@ class SovereignEngine:
             "status": "executed"
         }
     
+    def _run_command_job(self, user_id: str, payload: Dict) -> Dict:
+        return self.execute_command(
+            command=payload["command"],
+            parameters=payload.get("parameters") or {},
+            user_id=user_id,
+            priority=payload.get("priority", 1)
+        )
+    
+    def _run_completion_job(self, user_id: str, payload: Dict) -> Dict:
+        return self.processor.process_completion(
+            prompt=payload["prompt"],
+            max_tokens=payload["max_tokens"],
+            temperature=payload["temperature"],
+            user_id=user_id,
+            context_id=payload.get("context_id")
+        )
+    
     def train_compliance(self, training_data: List[Dict], user_id: str) -> Dict:
         """Train model for absolute compliance"""
         print(f"🔄 Training compliance with {len(training_data)} samples...")
@@ -111,9 +170,21 @@ class SovereignEngine:
         return {
             "model": self.model.get_info() if self.model else "loading",
             "memory": self.memory.get_stats(),
-            "sessions": len(self.sessions),
+            "sessions": self.state.session_count(),
+            "uptime": time.time() - self.start_time,
+            "compliance_training_samples": len(self.compliance_training),
+            "processor": self.processor.get_stats(),
+            "executor": self.executor.get_stats(),
+            "jobs": self.jobs.get_stats(),
+            "workers": self.state.worker_stats()
+        }
+    
+    def worker_stats(self) -> Dict:
+        """Stats of this worker process, published to the shared state"""
+        return {
             "uptime": time.time() - self.start_time,
-            "compliance_training_samples": len(self.compliance_training)
+            "processor": self.processor.get_stats(),
+            "executor": self.executor.get_stats()
         }
     
     def timestamp(self) -> str:
@@ -122,7 +193,13 @@ class SovereignEngine:
     
     def shutdown(self):
         """Shutdown the engine"""
+        if self.jobs:
+            self.jobs.shutdown()
+        self.executor.shutdown()
+        self.processor.shutdown()
         if self.model:
             self.model.unload()
-        self.memory.persist()
+        if self.state:
+            self.state.shutdown()
+        self.memory.shutdown()
         print("🔴 Rahl AI Sovereign Engine Shutdown")
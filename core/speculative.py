@@ -0,0 +1,204 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import torch
+
+from core.metrics import SPECULATIVE_ACCEPTED, SPECULATIVE_TOKENS, STAGE_SECONDS, TOKENS
+from core.scheduler import sampling_logits, _cache_to_tensors, _tensors_to_cache
+
+
+class _Sequence:
+    """One sequence's KV cache in one model"""
+
+    def __init__(self, model, device, vocab_size: int):
+        self.model = model
+        self.device = device
+        self.vocab_size = vocab_size
+        self.past = None
+        self.cached = 0
+
+    def extend(self, tokens: List[int]) -> torch.Tensor:
+        """Run the tokens not yet cached; returns their logits, one row per token"""
+        length = len(tokens)
+        output = self.model(
+            input_ids=torch.tensor([tokens[self.cached:]], dtype=torch.long, device=self.device),
+            attention_mask=torch.ones((1, length), dtype=torch.long, device=self.device),
+            position_ids=torch.arange(self.cached, length, device=self.device).unsqueeze(0),
+            past_key_values=_tensors_to_cache(self.past) if self.past else None,
+            use_cache=True
+        )
+        self.past = _cache_to_tensors(output.past_key_values)
+        self.cached = length
+        return output.logits[0, :, :self.vocab_size].float()
+
+    def crop(self, length: int):
+        """Forget cached positions from length on"""
+        if length < self.cached:
+            self.past = [(k[..., :length, :], v[..., :length, :]) for k, v in self.past]
+            self.cached = length
+
+
+class SpeculativeDecoder:
+    """Speculative decoding of one sequence with a small draft model
+
+    Each step the draft model proposes up to lookahead tokens and the main
+    model scores all of them in one forward pass. A proposal x drawn from
+    the draft distribution q is kept with probability min(1, p(x) / q(x))
+    under the main model's distribution p; the first rejected one is
+    replaced by a sample from max(0, p - q), and when every proposal is
+    kept p supplies one more token. p and q are filtered exactly as the
+    scheduler filters (n-gram ban, temperature, top-k, top-p), so the output
+    has the same distribution as sampling the main model token by token.
+    Greedy requests keep a proposal only if it is the main model's argmax.
+    """
+
+    def __init__(self, model, draft_model, device, eos_token_id: int, lookahead: int = 4):
+        self.model = model
+        self.draft_model = draft_model
+        self.device = device
+        self.eos_token_id = eos_token_id
+        self.lookahead = max(0, lookahead)
+        # Models sharing a tokenizer may pad their embeddings differently
+        self.vocab_size = min(model.config.vocab_size, draft_model.config.vocab_size)
+        self._lock = threading.Lock()
+        self.stats = {
+            "sequences": 0,
+            "steps": 0,
+            "drafted": 0,
+            "accepted": 0,
+            "tokens_generated": 0
+        }
+
+    def generate(self, input_ids: List[int], max_tokens: int, temperature: float, top_p: float = 0.95,
+                 top_k: int = 50, no_repeat_ngram_size: int = 3) -> Dict:
+        """Generate up to max_tokens after input_ids; same result shape as BatchScheduler.generate"""
+        start = time.perf_counter()
+        sampling = {
+            "temperature": temperature,
+            "top_k": top_k,
+            "top_p": top_p,
+            "no_repeat_ngram_size": no_repeat_ngram_size
+        }
+        tokens = list(input_ids)
+        generated: List[int] = []
+        finish_reason: Optional[str] = None
+        target = _Sequence(self.model, self.device, self.vocab_size)
+        draft = _Sequence(self.draft_model, self.device, self.vocab_size)
+        steps = drafted = accepted = 0
+
+        with torch.inference_mode():
+            while finish_reason is None:
+                proposals, draft_probs = self._draft(draft, tokens, max_tokens - len(generated) - 1, sampling)
+
+                with STAGE_SECONDS.time("verify"):
+                    offset = target.cached
+                    logits = target.extend(tokens + proposals)
+                    new = self._verify(logits[len(tokens) - 1 - offset:], tokens, proposals, draft_probs,
+                                       sampling)
+
+                steps += 1
+                drafted += len(proposals)
+                accepted += len(new) - 1
+                SPECULATIVE_ACCEPTED.observe(len(new) - 1)
+
+                # Stop at end-of-sequence and max_tokens the way the scheduler does
+                for token in new:
+                    if token == self.eos_token_id:
+                        finish_reason = "stop"
+                        break
+                    tokens.append(token)
+                    generated.append(token)
+                    if len(generated) >= max_tokens:
+                        finish_reason = "length"
+                        break
+
+                # Cached positions past the last kept token hold rejected proposals
+                target.crop(len(tokens) - 1)
+                draft.crop(len(tokens) - 1)
+
+        SPECULATIVE_TOKENS.inc(drafted, "drafted")
+        SPECULATIVE_TOKENS.inc(accepted, "accepted")
+        TOKENS.inc(len(input_ids), "in")
+        TOKENS.inc(len(generated), "out")
+        with self._lock:
+            self.stats["sequences"] += 1
+            self.stats["steps"] += steps
+            self.stats["drafted"] += drafted
+            self.stats["accepted"] += accepted
+            self.stats["tokens_generated"] += len(generated)
+
+        return {
+            "token_ids": generated,
+            "prompt_tokens": len(input_ids),
+            "completion_tokens": len(generated),
+            "finish_reason": finish_reason,
+            "queue_time": 0.0,
+            "total_time": time.perf_counter() - start
+        }
+
+    def _draft(self, draft: _Sequence, tokens: List[int], limit: int, sampling: Dict):
+        """Up to lookahead draft tokens, and the distribution each was drawn from"""
+        proposals: List[int] = []
+        probs: List[Optional[torch.Tensor]] = []
+        count = min(self.lookahead, limit)
+        if count <= 0:
+            return proposals, probs
+
+        with STAGE_SECONDS.time("draft"):
+            row = draft.extend(tokens)[-1]
+            while True:
+                row = sampling_logits(row, tokens + proposals, **sampling)
+                if sampling["temperature"] <= 0:
+                    token = int(row.argmax())
+                    probs.append(None)
+                else:
+                    q = row.softmax(-1)
+                    token = int(torch.multinomial(q, 1))
+                    probs.append(q)
+                proposals.append(token)
+                if len(proposals) >= count or token == self.eos_token_id:
+                    return proposals, probs
+                row = draft.extend(tokens + proposals)[-1]
+
+    def _verify(self, logits: torch.Tensor, tokens: List[int], proposals: List[int],
+                draft_probs: List[Optional[torch.Tensor]], sampling: Dict) -> List[int]:
+        """Accepted proposals followed by one token from the main model
+
+        logits[i] is the main model's prediction after tokens + proposals[:i].
+        """
+        greedy = sampling["temperature"] <= 0
+        kept: List[int] = []
+        for i, token in enumerate(proposals):
+            row = sampling_logits(logits[i], tokens + proposals[:i], **sampling)
+            if greedy:
+                best = int(row.argmax())
+                kept.append(best)
+                if best != token:
+                    return kept
+                continue
+
+            p = row.softmax(-1)
+            q = draft_probs[i]
+            if float(torch.rand(())) * float(q[token]) < float(p[token]):
+                kept.append(token)
+                continue
+            residual = (p - q).clamp(min=0)
+            total = residual.sum()
+            kept.append(int(torch.multinomial(residual / total if total > 0 else p, 1)))
+            return kept
+
+        row = sampling_logits(logits[len(proposals)], tokens + proposals, **sampling)
+        kept.append(int(row.argmax()) if greedy else int(torch.multinomial(row.softmax(-1), 1)))
+        return kept
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "lookahead": self.lookahead,
+            "acceptance_rate": stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0,
+            # Tokens per main-model forward pass; 1.0 is plain decoding
+            "tokens_per_step": stats["tokens_generated"] / stats["steps"] if stats["steps"] else 0.0
+        }
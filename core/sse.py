@@ -0,0 +1,59 @@
+import asyncio
+from typing import AsyncIterator, Dict
+
+import orjson
+
+from core.metrics import STAGE_SECONDS
+
+DONE_FRAME = b"data: [DONE]\n\n"
+
+
+class SSEEncoder:
+    """Server-sent event frames for a stream of text chunks
+
+    Each frame is ``data: {"<field>": "<text>"}``. The frame's fixed bytes
+    are built once, so a frame costs one orjson string encode and one bytes
+    join. The first chunk is sent at once; after each frame the encoder
+    waits frame_ms (unless the frame reached frame_chars) so the tokens
+    decoded meanwhile go out together, which bounds frames per stream
+    rather than sending one per decode step. The stream ends with a usage
+    frame (when the stream reports usage) and the ``[DONE]`` terminator
+    OpenAI clients expect.
+    Encoders hold no per-stream state and can be shared.
+    """
+
+    def __init__(self, field: str, frame_chars: int = 512, frame_ms: float = 25.0):
+        self.prefix = b'data: {' + orjson.dumps(field) + b':'
+        self.suffix = b'}\n\n'
+        self.frame_chars = frame_chars
+        self.frame_seconds = frame_ms / 1000
+
+    def frame(self, text: str) -> bytes:
+        return self.prefix + orjson.dumps(text) + self.suffix
+
+    def usage_frame(self, usage: Dict) -> bytes:
+        return b"data: " + orjson.dumps({"usage": usage}) + b"\n\n"
+
+    def error_frame(self, message: str) -> bytes:
+        return b"data: " + orjson.dumps({"error": message}) + b"\n\n"
+
+    async def encode(self, stream) -> AsyncIterator[bytes]:
+        """Frames for stream (a TokenStream or BackendStream), then the terminator"""
+        async for text in stream:
+            if not text:
+                continue
+            yield self._frame_timed(text)
+            # Tokens decoded in the next frame_ms collect in the stream and
+            # are read as one chunk; a frame that already reached
+            # frame_chars is not held back
+            if self.frame_seconds > 0 and len(text) < self.frame_chars:
+                await asyncio.sleep(self.frame_seconds)
+
+        usage = stream.usage()
+        if usage:
+            yield self.usage_frame(usage)
+        yield DONE_FRAME
+
+    def _frame_timed(self, text: str) -> bytes:
+        with STAGE_SECONDS.time("encode"):
+            return self.frame(text)
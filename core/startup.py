@@ -0,0 +1,62 @@
+import time
+import resource
+import sys
+import logging
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Frameworks that dominate cold start when something pulls them in
+HEAVY_MODULES = ("torch", "transformers", "numpy")
+
+
+class StartupReport:
+    """Wall-clock timings of startup stages
+
+    Stages nest: a stage opened inside another is reported indented under
+    it. The report also notes peak RSS and which heavy frameworks ended up
+    imported, so a backend that drags in torch unnecessarily is obvious in
+    the logs.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Dict] = []
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of startup work"""
+        entry = {"name": name, "depth": self._depth, "seconds": 0.0}
+        self.stages.append(entry)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = time.perf_counter() - start
+            self._depth -= 1
+
+    def summary(self) -> Dict:
+        """Startup timings, time to ready, peak RSS and heavy imports"""
+        # ru_maxrss is KiB on Linux
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        return {
+            "time_to_ready": time.perf_counter() - self.started,
+            "stages": [dict(s) for s in self.stages],
+            "peak_rss_mb": rss_mb,
+            "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules]
+        }
+
+    def log(self, logger: logging.Logger):
+        """Write the report to a logger"""
+        summary = self.summary()
+        logger.info("Startup report:")
+        for stage in summary["stages"]:
+            indent = "  " * stage["depth"]
+            logger.info("  %s%-32s %8.1f ms", indent, stage["name"], stage["seconds"] * 1000)
+        logger.info("  time to ready: %.1f ms, peak RSS: %.1f MB, heavy modules: %s",
+                    summary["time_to_ready"] * 1000, summary["peak_rss_mb"],
+                    ", ".join(summary["heavy_modules"]) or "none")
+
+
+startup_report = StartupReport()
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Crash-safety modes: WAL with NORMAL sync may lose the last commits on power
+# loss but never corrupts; FULL fsyncs every commit
+DURABILITY_PRAGMAS = {
+    "normal": "NORMAL",
+    "full": "FULL"
+}
+
+
+class ConnectionPool:
+    """SQLite access with per-thread readers and a single writer
+
+    The database runs in WAL mode, so readers never block the writer or
+    each other. Each thread that reads gets its own connection (created on
+    first use and reused after), and all writes are serialised through one
+    writer connection inside explicit transactions. Statements are kept as
+    constant SQL strings so sqlite3's per-connection statement cache reuses
+    the prepared form.
+    """
+
+    def __init__(self, path: str, durability: str = "normal", mmap_mb: int = 256,
+                 cache_mb: int = 64, busy_timeout_ms: int = 5000, cached_statements: int = 256):
+        if durability not in DURABILITY_PRAGMAS:
+            raise ValueError(f"Unknown db_durability: {durability}")
+        self.path = path
+        self.cached_statements = cached_statements
+        self.pragmas = {
+            "synchronous": DURABILITY_PRAGMAS[durability],
+            "mmap_size": mmap_mb * 1024 * 1024,
+            # Negative cache_size is in KiB
+            "cache_size": -cache_mb * 1024,
+            "busy_timeout": busy_timeout_ms,
+            "temp_store": "MEMORY"
+        }
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        # Takes effect on new databases; existing ones need vacuum() once
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._writer.execute("PRAGMA journal_mode=WAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly by writer()
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """Connection for reads on the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Exclusive write transaction on the single writer connection"""
+        with self._write_lock:
+            if self._writer.in_transaction:
+                # Nested use joins the outer transaction
+                yield self._writer
+                return
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    @contextmanager
+    def snapshot(self):
+        """Read transaction on the calling thread's reader connection
+
+        Every query inside sees the database as of the first one, and no
+        write lock is taken, so long scans do not hold up writers.
+        """
+        conn = self.reader()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def checkpoint(self):
+        """Copy the WAL into the main database file"""
+        with self._write_lock:
+            self._writer.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def vacuum(self):
+        """Rebuild the database file with incremental auto-vacuum enabled"""
+        with self._write_lock:
+            self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._writer.execute("VACUUM")
+
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        with self._readers_lock:
+            readers = len(self._readers)
+        return {
+            "readers": readers,
+            "journal_mode": "wal",
+            "synchronous": self.pragmas["synchronous"].lower()
+        }
+
+    def close(self):
+        """Close every connection"""
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        with self._write_lock:
+            self._writer.close()
@@ -0,0 +1,256 @@
+import asyncio
+import queue
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from core.metrics import STAGE_SECONDS
+
+_DONE = object()
+
+
+class IncrementalDetokenizer:
+    """Turn a growing list of token ids into text deltas
+
+    Each new token is decoded together with a short window of the tokens
+    before it, so tokenizers that drop or merge leading spaces (SentencePiece,
+    byte-level BPE) produce the same text as a one-shot decode. A delta that
+    ends in U+FFFD is an incomplete multi-byte character and is held back
+    until the next token completes it.
+    """
+
+    def __init__(self, tokenizer, skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.tokens: List[int] = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self._started = False
+
+    def add(self, token: int) -> str:
+        """Add a token and return any text that is now complete"""
+        self.tokens.append(token)
+        return self._emit(final=False)
+
+    def flush(self) -> str:
+        """Return whatever text is still held back"""
+        return self._emit(final=True)
+
+    def _decode(self, tokens: List[int]) -> str:
+        return self.tokenizer.decode(tokens, skip_special_tokens=self.skip_special_tokens)
+
+    def _emit(self, final: bool) -> str:
+        prefix_text = self._decode(self.tokens[self.prefix_offset:self.read_offset])
+        new_text = self._decode(self.tokens[self.prefix_offset:])
+
+        if len(new_text) <= len(prefix_text) or (new_text.endswith("\ufffd") and not final):
+            return ""
+
+        delta = new_text[len(prefix_text):]
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.tokens)
+
+        # Match the stripped text of non-streaming responses
+        if not self._started:
+            delta = delta.lstrip()
+            self._started = bool(delta)
+        return delta
+
+
+class TokenStream:
+    """Text deltas of one in-flight generation
+
+    The scheduler thread pushes token ids as they are sampled. Iterating the
+    stream (sync or async) yields decoded text as soon as it is available;
+    async iteration coalesces every token that arrived since the last read
+    into one chunk. Cancelling the stream stops the sequence at the next
+    decode step.
+    """
+
+    def __init__(self, tokenizer, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.request = None
+        self._tokens: "queue.Queue" = queue.Queue()
+        self._detokenizer = IncrementalDetokenizer(tokenizer)
+        self._loop = loop
+        self._ready = asyncio.Event() if loop else None
+        self._wake_scheduled = False
+
+    def attach(self, request):
+        """Bind the stream to its scheduler request"""
+        self.request = request
+        request.future.add_done_callback(lambda _: self.push(_DONE))
+
+    def push(self, token):
+        """Called from the scheduler thread for every sampled token"""
+        self._tokens.put(token)
+        # One wakeup per read: tokens pushed while one is scheduled, or
+        # before the reader has cleared the last, are drained with it
+        if self._loop and not self._wake_scheduled and not self._ready.is_set():
+            self._wake_scheduled = True
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._wake_scheduled = False
+        self._ready.set()
+
+    def cancel(self):
+        """Stop generating for this stream"""
+        if self.request:
+            self.request.cancel()
+
+    def result(self) -> Optional[Dict]:
+        """Final scheduler result once the stream is exhausted"""
+        if not self.request or self.request.future.cancelled():
+            return None
+        return self.request.future.result()
+
+    def usage(self) -> Optional[Dict]:
+        """Token counts once the stream is exhausted"""
+        result = self.result()
+        if result is None:
+            return None
+        return {
+            "prompt_tokens": result["prompt_tokens"],
+            "completion_tokens": result["completion_tokens"],
+            "total_tokens": result["prompt_tokens"] + result["completion_tokens"]
+        }
+
+    def _finish(self) -> str:
+        future = self.request.future if self.request else None
+        if future and not future.cancelled() and future.exception():
+            raise future.exception()
+        return self._detokenizer.flush()
+
+    def __iter__(self):
+        while True:
+            token = self._tokens.get()
+            if token is _DONE:
+                tail = self._finish()
+                if tail:
+                    yield tail
+                return
+            with STAGE_SECONDS.time("detokenize"):
+                text = self._detokenizer.add(token)
+            if text:
+                yield text
+
+    async def __aiter__(self):
+        if not self._loop:
+            raise RuntimeError("TokenStream was not opened with an event loop")
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            chunk = []
+            done = False
+            with STAGE_SECONDS.time("detokenize"):
+                while True:
+                    try:
+                        token = self._tokens.get_nowait()
+                    except queue.Empty:
+                        break
+                    if token is _DONE:
+                        done = True
+                        break
+                    chunk.append(self._detokenizer.add(token))
+
+                if done:
+                    chunk.append(self._finish())
+            text = "".join(chunk)
+            if text:
+                yield text
+            if done:
+                return
+
+
+class BackendStream:
+    """Text chunks from a backend's own async stream
+
+    Gives backends that are not driven by the scheduler the same interface
+    as TokenStream, including coalescing chunks that arrive between reads.
+    Sync iteration runs the async stream on a private event loop.
+    """
+
+    def __init__(self, chunks: AsyncIterator[str], prompt: Optional[str] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self._chunks = chunks
+        self._prompt = prompt
+        self._count_tokens = count_tokens
+        self._cancelled = False
+        self._started = False
+        self._pump_task = None
+        self.text = []
+
+    def cancel(self):
+        """Stop reading the backend"""
+        self._cancelled = True
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+
+    def result(self) -> Optional[Dict]:
+        """Full text once the stream is exhausted"""
+        return {"text": "".join(self.text)}
+
+    def usage(self) -> Optional[Dict]:
+        """Token counts of the prompt and text, when the stream can count them"""
+        if self._count_tokens is None or self._cancelled:
+            return None
+        prompt_tokens = self._count_tokens(self._prompt or "")
+        completion_tokens = self._count_tokens("".join(self.text))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def _pump(self, buffered: List[str], ready: asyncio.Event):
+        try:
+            async for chunk in self._chunks:
+                if self._cancelled:
+                    return
+                # Match the stripped text of non-streaming responses
+                if not self._started:
+                    chunk = chunk.lstrip()
+                    self._started = bool(chunk)
+                if chunk:
+                    self.text.append(chunk)
+                    buffered.append(chunk)
+                    ready.set()
+        finally:
+            ready.set()
+            await self._chunks.aclose()
+
+    async def __aiter__(self):
+        # The backend is read by a separate task so every chunk that arrived
+        # since the last read is yielded as one, as TokenStream does
+        buffered: List[str] = []
+        ready = asyncio.Event()
+        pump = self._pump_task = asyncio.ensure_future(self._pump(buffered, ready))
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                done = pump.done()
+                text = "".join(buffered)
+                buffered.clear()
+                if text:
+                    yield text
+                if done:
+                    if not pump.cancelled():
+                        pump.result()
+                    return
+        finally:
+            if not pump.done():
+                pump.cancel()
+                await asyncio.wait((pump,))
+
+    def __iter__(self):
+        loop = asyncio.new_event_loop()
+        chunks = self.__aiter__()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(chunks.aclose())
+            loop.close()
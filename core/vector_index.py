@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ("flat", "ivf")
+ARRAYS = ("vectors", "seqs", "keys", "lists")
+
+
+class VectorIndex:
+    """Cosine-similarity index over unit vectors, one partition per key
+
+    Every vector belongs to a key (a user's context) and searches only ever
+    look at one key, so rows are stored sorted by key and a key's rows are
+    one contiguous slice found by binary search. Keys with up to flat_limit
+    rows are scored brute force. In "ivf" mode the saved rows are also
+    clustered around k-means centroids (sorted by cluster within each key),
+    and larger keys only score the rows of the probe clusters nearest the
+    query.
+
+    Saved snapshots are .npy files opened with mmap, so startup does not
+    read the index and worker processes share its pages. Vectors added since
+    the last save are kept in memory and always scored brute force; workers
+    that do not save fold theirs away by loading newer snapshots (refresh).
+    """
+
+    def __init__(self, path: str, dim: int, embedder: str, mode: str = "ivf", lists: int = 0,
+                 probe: int = 8, flat_limit: int = 2048, min_train: int = 4096):
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Unknown memory_index_mode: {mode}")
+        self.path = path
+        self.dim = dim
+        self.embedder = embedder
+        self.mode = mode
+        self.lists = lists
+        self.probe = max(1, probe)
+        self.flat_limit = flat_limit
+        self.min_train = min_train
+        self.max_seq = 0
+        self.version = None
+        self._base = self._empty()
+        self._alive = np.ones(0, dtype=bool)
+        self._centroids = None
+        self._trained_on = 0
+        self._pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        # (key, time) of removals a saved snapshot may not reflect yet
+        self._removed: List[Tuple[int, float]] = []
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self.stats = {
+            "searches": 0,
+            "scored": 0,
+            "saves": 0,
+            "reloads": 0
+        }
+
+    def _empty(self) -> Dict[str, np.ndarray]:
+        return {
+            "vectors": np.zeros((0, self.dim), dtype=np.float32),
+            "seqs": np.zeros(0, dtype=np.int64),
+            "keys": np.zeros(0, dtype=np.int64),
+            "lists": np.zeros(0, dtype=np.int32)
+        }
+
+    def _file(self, name: str, version: str) -> str:
+        return os.path.join(self.path, f"{name}-{version}.npy")
+
+    # Persistence
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self) -> bool:
+        """Open the saved snapshot; False when there is none or it was built differently
+
+        Pending rows the snapshot already holds (seq up to its max_seq) are
+        dropped, and keys removed after the snapshot checked which rows
+        still exist are removed from it again.
+        """
+        meta = self._read_meta()
+        if meta is None:
+            return False
+        if meta.get("dim") != self.dim or meta.get("embedder") != self.embedder:
+            logger.info("Ignoring memory index built with %s/%s", meta.get("embedder"), meta.get("dim"))
+            return False
+
+        version = meta["version"]
+        try:
+            base = {name: np.load(self._file(name, version), mmap_mode="r") for name in ARRAYS}
+            centroids = None
+            if meta.get("lists"):
+                centroids = np.load(self._file("centroids", version))
+        except OSError:
+            # Replaced by a newer snapshot while being opened
+            return False
+        with self._lock:
+            self._base = base
+            self._alive = np.ones(len(base["seqs"]), dtype=bool)
+            self._centroids = centroids
+            self._trained_on = meta.get("trained_on", 0)
+            self.max_seq = max(self.max_seq, meta["max_seq"])
+            self.version = version
+            self._pending = [
+                (vectors[keep], seqs[keep], keys[keep])
+                for vectors, seqs, keys in self._pending
+                for keep in [seqs > meta["max_seq"]]
+                if keep.any()
+            ]
+            self._removed = [(key, at) for key, at in self._removed if at >= meta.get("live_at", 0)]
+            for key, _ in self._removed:
+                self._remove_base(key)
+        return True
+
+    def refresh(self) -> bool:
+        """Load the saved snapshot if another process has written a newer one
+
+        Workers that never save call this so their pending rows are folded
+        into the shared snapshot instead of growing without bound.
+        """
+        meta = self._read_meta()
+        if meta is None or meta.get("version") == self.version:
+            return False
+        if not self.load():
+            return False
+        self.stats["reloads"] += 1
+        return True
+
+    def save(self, live: Callable[[np.ndarray], np.ndarray]):
+        """Write a new snapshot of everything indexed so far
+
+        live(seqs) returns which rows still exist; the others are dropped.
+        Clusters are retrained when the index has doubled since the last
+        training, otherwise new rows join their nearest centroid.
+        """
+        with self._save_lock:
+            with self._lock:
+                base, alive, pending = self._base, self._alive.copy(), list(self._pending)
+                centroids, max_seq = self._centroids, self.max_seq
+
+            vectors = [np.asarray(base["vectors"])[alive]] + [p[0] for p in pending]
+            seqs = np.concatenate([np.asarray(base["seqs"])[alive]] + [p[1] for p in pending])
+            keys = np.concatenate([np.asarray(base["keys"])[alive]] + [p[2] for p in pending])
+            vectors = np.concatenate(vectors) if len(seqs) else self._empty()["vectors"]
+            # Keys removed from here on may still be in the snapshot
+            live_at = time.time()
+            keep = live(seqs) if len(seqs) else np.zeros(0, dtype=bool)
+            vectors, seqs, keys = vectors[keep], seqs[keep], keys[keep]
+
+            trained_on = self._trained_on
+            if self.mode == "ivf" and len(seqs) >= self.min_train and (
+                    centroids is None or len(seqs) >= 2 * trained_on):
+                lists = self.lists or int(np.sqrt(len(seqs)))
+                centroids = _kmeans(vectors, lists)
+                trained_on = len(seqs)
+            assignments = (_nearest(vectors, centroids) if centroids is not None
+                           else np.zeros(len(seqs), dtype=np.int32))
+
+            order = np.lexsort((seqs, assignments, keys))
+            arrays = {
+                "vectors": vectors[order],
+                "seqs": seqs[order],
+                "keys": keys[order],
+                "lists": assignments[order]
+            }
+
+            os.makedirs(self.path, exist_ok=True)
+            version = f"{int(time.time() * 1000)}-{os.getpid()}"
+            for name, array in arrays.items():
+                np.save(self._file(name, version), array)
+            if centroids is not None:
+                np.save(self._file("centroids", version), centroids)
+            meta = {
+                "version": version,
+                "dim": self.dim,
+                "embedder": self.embedder,
+                "count": len(seqs),
+                "max_seq": max_seq,
+                "lists": len(centroids) if centroids is not None else 0,
+                "trained_on": trained_on,
+                "live_at": live_at
+            }
+            tmp = os.path.join(self.path, f"meta.json.{os.getpid()}")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+            previous = self.version
+            with self._lock:
+                # Keeps what arrived while the snapshot was being written
+                self.load()
+                self.stats["saves"] += 1
+            if previous and previous != version:
+                self._delete(previous)
+
+    def _delete(self, version: str):
+        # Open mmaps of the old files stay valid after unlinking
+        for name in ARRAYS + ("centroids",):
+            try:
+                os.remove(self._file(name, version))
+            except OSError:
+                pass
+
+    # Updates
+
+    def add(self, seqs: np.ndarray, keys: np.ndarray, vectors: np.ndarray):
+        with self._lock:
+            self._pending.append((vectors.astype(np.float32, copy=False),
+                                  seqs.astype(np.int64, copy=False), keys.astype(np.int64, copy=False)))
+            if len(seqs):
+                self.max_seq = max(self.max_seq, int(seqs.max()))
+
+    def remove(self, key: int):
+        """Drop every row of key"""
+        with self._lock:
+            self._remove_base(key)
+            self._removed.append((key, time.time()))
+            self._pending = [
+                (vectors[keep], seqs[keep], keys[keep])
+                for vectors, seqs, keys in self._pending
+                for keep in [keys != key]
+            ]
+
+    def _remove_base(self, key: int):
+        start, end = self._slice(self._base["keys"], key)
+        self._alive[start:end] = False
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(p[1]) for p in self._pending)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum()) + sum(len(p[1]) for p in self._pending)
+
+    # Search
+
+    @staticmethod
+    def _slice(keys, key: int) -> Tuple[int, int]:
+        """Row range of key in a base's sorted keys"""
+        return int(np.searchsorted(keys, key, "left")), int(np.searchsorted(keys, key, "right"))
+
+    def search(self, key: int, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top k (seq, score) of key's rows by cosine similarity to query"""
+        if k <= 0:
+            return []
+        with self._lock:
+            base, alive, centroids, pending = self._base, self._alive, self._centroids, list(self._pending)
+
+        # The base snapshotted above, not self._base: a rebuild may swap it
+        start, end = self._slice(base["keys"], key)
+        if centroids is not None and end - start > self.flat_limit:
+            nearest = np.argsort(-(centroids @ query))[:self.probe]
+            lists = np.asarray(base["lists"][start:end])
+            rows = np.concatenate([
+                np.arange(start + np.searchsorted(lists, l, "left"), start + np.searchsorted(lists, l, "right"))
+                for l in np.sort(nearest)
+            ])
+        else:
+            rows = np.arange(start, end)
+        rows = rows[alive[rows]]
+
+        scores = [np.asarray(base["vectors"][rows]) @ query]
+        seqs = [np.asarray(base["seqs"][rows])]
+        for vectors, pending_seqs, keys in pending:
+            mask = keys == key
+            if mask.any():
+                scores.append(vectors[mask] @ query)
+                seqs.append(pending_seqs[mask])
+        scores, seqs = np.concatenate(scores), np.concatenate(seqs)
+
+        with self._lock:
+            self.stats["searches"] += 1
+            self.stats["scored"] += len(seqs)
+
+        if len(seqs) > k:
+            top = np.argpartition(-scores, k)[:k]
+            scores, seqs = scores[top], seqs[top]
+        order = np.argsort(-scores)
+        return [(int(seqs[i]), float(scores[i])) for i in order]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "mode": self.mode,
+                "vectors": len(self),
+                "pending": sum(len(p[1]) for p in self._pending),
+                "lists": len(self._centroids) if self._centroids is not None else 0,
+                "max_seq": self.max_seq,
+                "embedder": self.embedder,
+                "dim": self.dim
+            }
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for each vector"""
+    return np.concatenate([
+        np.argmax(vectors[i:i + chunk] @ centroids.T, axis=1).astype(np.int32)
+        for i in range(0, len(vectors), chunk)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int32)
+
+
+def _kmeans(vectors: np.ndarray, lists: int, iterations: int = 10, sample: int = 256) -> np.ndarray:
+    """Spherical k-means centroids, trained on at most sample vectors per list"""
+    rng = np.random.default_rng(0)
+    if len(vectors) > lists * sample:
+        vectors = vectors[rng.choice(len(vectors), lists * sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return centroids.astype(np.float32)
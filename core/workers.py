@@ -0,0 +1,175 @@
+import gc
+import os
+import signal
+import socket
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth")
+
+
+def available_cores() -> int:
+    """CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo, or None where it is not exposed"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def model_size_mb(model) -> float:
+    """Bytes held by a loaded model's tensors"""
+    module = getattr(model, "model", None)
+    if module is None or not hasattr(module, "parameters"):
+        return 0.0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / (1024 * 1024)
+
+
+def checkpoint_size_mb(path: str) -> float:
+    """Size of the weight files under a model directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(WEIGHT_SUFFIXES):
+                total += os.path.getsize(os.path.join(root, name))
+    return total / (1024 * 1024)
+
+
+def plan_workers(settings, weights_mb: float) -> Dict:
+    """Worker count and torch threads per worker for this machine
+
+    Settings.workers > 0 is used as given; 0 means one worker per core,
+    reduced until every worker fits in available memory. Preloaded weights
+    are shared between workers, so they count once; otherwise each worker
+    holds its own copy.
+    """
+    cores = available_cores()
+    memory_mb = available_memory_mb()
+    workers = settings.workers if settings.workers > 0 else cores
+
+    if settings.workers <= 0 and memory_mb is not None:
+        shared_mb = weights_mb if settings.worker_preload else 0.0
+        per_worker_mb = settings.worker_memory_mb + (0.0 if settings.worker_preload else weights_mb)
+        workers = min(workers, max(1, int((memory_mb - shared_mb) // per_worker_mb)))
+
+    return {
+        "workers": workers,
+        "cores": cores,
+        "memory_mb": memory_mb,
+        "weights_mb": weights_mb,
+        # Split the cores between workers instead of every worker using all of them
+        "torch_threads": settings.torch_threads or max(1, cores // workers)
+    }
+
+
+def serve(app, settings):
+    """Run the app in several worker processes sharing one listening socket
+
+    With Settings.worker_preload the model is loaded once here and the
+    workers are forked afterwards, so the weights' pages are shared
+    copy-on-write instead of every worker holding its own copy. Nothing else
+    (database, scheduler, pools) is started before the fork; each worker
+    builds its own engine around the shared model. Workers that die are
+    restarted until the launcher is told to stop.
+    """
+    model = None
+    if settings.worker_preload:
+        from models.rahl_model import RahlModel
+        model = RahlModel()
+        model.load()
+        weights_mb = model_size_mb(model)
+    else:
+        weights_mb = checkpoint_size_mb(settings.model_path)
+
+    plan = plan_workers(settings, weights_mb)
+    logger.info("Starting %d workers (%d cores, %s MB available, %.1f MB weights, %d torch threads each)",
+                plan["workers"], plan["cores"],
+                f"{plan['memory_mb']:.0f}" if plan["memory_mb"] is not None else "unknown",
+                plan["weights_mb"], plan["torch_threads"])
+
+    app.state.preloaded_model = model
+    settings.torch_threads = plan["torch_threads"]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.host, settings.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Keep the preloaded objects out of later collections, which would
+    # otherwise write to their pages and unshare them
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, index, plan)
+            except BaseException:
+                logger.exception("Worker %d crashed", index)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(plan["workers"]):
+        spawn(index)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning("Worker %d (pid %d) exited with status %d, restarting", index, pid, status)
+            time.sleep(1.0)
+            spawn(index)
+
+    sock.close()
+
+
+def _run_worker(app, sock: socket.socket, index: int, plan: Dict):
+    import uvicorn
+
+    os.environ["RAHL_WORKER_ID"] = str(index)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    model = getattr(app.state, "preloaded_model", None)
+    if model is not None and model.model is not None:
+        from models.backends.cpu import configure_threads
+        configure_threads(plan["torch_threads"])
+
+    uvicorn.Server(uvicorn.Config(app, log_level="info")).run(sockets=[sock])
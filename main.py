@@ -1,26 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from core.startup import startup_report
+
+with startup_report.stage("import fastapi"):
+    from fastapi import FastAPI, Depends, HTTPException, Request
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    import uvicorn
 from contextlib import asynccontextmanager
 import logging
 from typing import Dict, Any
 
-from api.endpoints import router as api_router
-from api.security import verify_auth, get_current_user
-from core.sovereign import SovereignEngine
-from config.settings import Settings
+with startup_report.stage("import api"):
+    from api.endpoints import router as api_router
+    from api.security import verify_auth, get_current_user
+    from api.instrumentation import MetricsMiddleware
+with startup_report.stage("import core.sovereign"):
+    from core.sovereign import SovereignEngine
+from core.executor import PoolOverloaded, PoolUnavailable, RequestTimeout
+from core.metrics import registry
+from config.settings import get_settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-settings = Settings()
+settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Initializing Rahl AI System...")
-    app.state.rahl_engine = SovereignEngine()
-    app.state.rahl_engine.initialize()
+    with startup_report.stage("engine.initialize"):
+        app.state.rahl_engine = SovereignEngine()
+        # Set by the multi-worker launcher when weights were loaded before forking
+        app.state.rahl_engine.initialize(model=getattr(app.state, "preloaded_model", None))
     logger.info("Rahl AI System Ready")
+    startup_report.log(logger)
     yield
     logger.info("Shutting down Rahl AI System...")
     app.state.rahl_engine.shutdown()
@@ -39,6 +51,31 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(PoolOverloaded)
+async def pool_overloaded_handler(request: Request, exc: PoolOverloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(PoolUnavailable)
+async def pool_unavailable_handler(request: Request, exc: PoolUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(RequestTimeout)
+async def request_timeout_handler(request: Request, exc: RequestTimeout):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.timeout)))}
+    )
 
 app.include_router(api_router, prefix="/api/v1", dependencies=[Depends(verify_auth)])
 
@@ -55,10 +92,18 @@ async def root():
 async def health_check():
     return {"status": "healthy", "compliance": "absolute"}
 
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=settings.debug
-    )
+    if settings.workers == 1:
+        uvicorn.run(
+            "main:app",
+            host=settings.host,
+            port=settings.port,
+            reload=settings.debug
+        )
+    else:
+        from core.workers import serve
+        serve(app, settings)
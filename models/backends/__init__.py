@@ -0,0 +1,29 @@
+import importlib
+from typing import Dict
+
+from core.startup import startup_report
+
+# Backends are referenced by "module:Class" so that selecting one imports
+# only its own dependencies (torch, transformers, ...)
+BACKENDS: Dict[str, str] = {
+    "simple": "models.backends.simple:SimpleBackend",
+    "echo": "models.backends.echo:EchoBackend",
+    "transformers": "models.backends.transformer:TransformerBackend"
+}
+
+def register_backend(name: str, target: str):
+    """Register a backend as "package.module:ClassName\""""
+    BACKENDS[name] = target
+
+def get_backend_class(name: str):
+    """Import and return a backend class by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {name} (available: {', '.join(sorted(BACKENDS))})")
+    module_name, class_name = BACKENDS[name].split(":")
+    with startup_report.stage(f"import {module_name}"):
+        module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+def create_backend(name: str, settings):
+    """Instantiate a backend by name"""
+    return get_backend_class(name)(settings)
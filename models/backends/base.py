@@ -0,0 +1,81 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List
+
+
+class ByteTokenizer:
+    """UTF-8 byte tokenizer for backends without a model vocabulary
+
+    Token ids 0-255 are bytes; 256 is end-of-sequence. Counting is exact and
+    decoding is lossless, so usage numbers stay meaningful for any backend.
+    """
+
+    eos_token_id = 256
+    pad_token_id = 256
+
+    def encode(self, text: str) -> List[int]:
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids: List[int], skip_special_tokens: bool = True) -> str:
+        return bytes(i for i in ids if i < 256).decode("utf-8", errors="replace")
+
+
+class ModelBackend(ABC):
+    """Contract every model backend implements
+
+    Backends must implement generate, one prompt at a time; a backend that
+    does not cannot be instantiated, so it fails when RahlModel loads it
+    rather than on its first request. They may also generate several at once
+    (generate_batch) or incrementally (stream, an async iterator of text
+    chunks). Defaults are provided for the latter two in terms of generate,
+    and capabilities tells callers which of them a backend actually does
+    natively:
+
+    - streaming: stream yields text as it is produced rather than all at the end
+    - batching: generate_batch runs prompts together rather than one by one
+    - scheduler: model/tokenizer/device are a torch causal LM that the
+      continuous-batching scheduler can drive directly
+    """
+
+    name = "base"
+    capabilities: Dict[str, bool] = {
+        "streaming": False,
+        "batching": False,
+        "scheduler": False
+    }
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.model = None
+        # Small model sharing the tokenizer, for speculative decoding
+        self.draft_model = None
+        self.tokenizer = ByteTokenizer()
+        self.device = None
+
+    def load(self):
+        """Load weights or other resources"""
+
+    def unload(self):
+        """Release what load acquired"""
+
+    @abstractmethod
+    def generate(self, prompt: str, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        """Generate a completion for one prompt"""
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 100,
+                       temperature: float = 0.7) -> List[str]:
+        """Generate completions for several prompts, in order"""
+        return [self.generate(prompt, max_tokens, temperature) for prompt in prompts]
+
+    async def stream(self, prompt: str, max_tokens: int = 100,
+                     temperature: float = 0.7) -> AsyncIterator[str]:
+        """Yield the completion as text chunks"""
+        loop = asyncio.get_running_loop()
+        yield await loop.run_in_executor(None, self.generate, prompt, max_tokens, temperature)
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens text encodes to"""
+        return len(self.tokenizer.encode(text))
+
+    def get_info(self) -> Dict:
+        return {"backend": self.name, "capabilities": dict(self.capabilities)}
@@ -0,0 +1,55 @@
+from typing import Dict
+
+import torch
+from torch import nn
+
+QUANTIZATION_MODES = ("none", "int8")
+
+
+def configure_threads(num_threads: int = 0, interop_threads: int = 0) -> Dict:
+    """Size torch's intra-op and inter-op thread pools; 0 keeps the default
+
+    The inter-op pool can only be sized before torch first uses it, so a
+    late call leaves it as it is.
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            pass
+    return {
+        "num_threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads()
+    }
+
+
+def quantize(model: nn.Module, mode: str = "none") -> nn.Module:
+    """Quantize a CPU model's linear layers
+
+    int8 is dynamic quantization: weights are stored as int8 and activations
+    are quantized per batch at run time, which needs no calibration data.
+    GPT-2 style models keep their projections in transformers' Conv1D, so
+    those are rewritten as equivalent nn.Linear layers first.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown model_quantization: {mode} (available: {', '.join(QUANTIZATION_MODES)})")
+    if mode == "none":
+        return model
+
+    _conv1d_to_linear(model)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _conv1d_to_linear(module: nn.Module):
+    for name, child in module.named_children():
+        if type(child).__name__ == "Conv1D":
+            # Conv1D computes x @ weight + bias with weight shaped (in, out)
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import AsyncIterator, List
+
+from core.streaming import IncrementalDetokenizer
+from models.backends.base import ModelBackend
+
+
+class EchoBackend(ModelBackend):
+    """Deterministic backend for load testing
+
+    The completion is the prompt's tokens repeated until exactly max_tokens
+    have been produced, so output length is under the caller's control and
+    identical across runs. Settings.echo_token_delay_ms simulates decode
+    speed; a batch pays the delay once per step, like a batched model.
+    """
+
+    name = "echo"
+    capabilities = {
+        "streaming": True,
+        "batching": True,
+        "scheduler": False
+    }
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.token_delay = settings.echo_token_delay_ms / 1000.0
+
+    def _tokens(self, prompt: str, max_tokens: int) -> List[int]:
+        source = self.tokenizer.encode(prompt) or self.tokenizer.encode("echo")
+        repeats = max_tokens // len(source) + 1
+        return (source * repeats)[:max(0, max_tokens)]
+
+    def generate(self, prompt: str, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        tokens = self._tokens(prompt, max_tokens)
+        if self.token_delay:
+            time.sleep(self.token_delay * len(tokens))
+        return self.tokenizer.decode(tokens)
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 100,
+                       temperature: float = 0.7) -> List[str]:
+        batch = [self._tokens(prompt, max_tokens) for prompt in prompts]
+        if self.token_delay and batch:
+            time.sleep(self.token_delay * max(len(tokens) for tokens in batch))
+        return [self.tokenizer.decode(tokens) for tokens in batch]
+
+    async def stream(self, prompt: str, max_tokens: int = 100,
+                     temperature: float = 0.7) -> AsyncIterator[str]:
+        detokenizer = IncrementalDetokenizer(self.tokenizer)
+        for token in self._tokens(prompt, max_tokens):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            text = detokenizer.add(token)
+            if text:
+                yield text
+        tail = detokenizer.flush()
+        if tail:
+            yield tail
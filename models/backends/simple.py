@@ -0,0 +1,22 @@
+from simple_ai import SimpleRahlAI
+
+from models.backends.base import ModelBackend
+
+
+class SimpleBackend(ModelBackend):
+    """Canned-response backend with no ML framework dependencies"""
+
+    name = "simple"
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ai = None
+
+    def load(self):
+        self.ai = SimpleRahlAI()
+
+    def generate(self, prompt: str, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        return self.ai.generate(prompt)
+
+    def unload(self):
+        self.ai = None
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List
+
+import torch
+import transformers
+
+from models.backends.base import ModelBackend
+from models.backends.cpu import configure_threads, quantize
+
+
+class TransformerBackend(ModelBackend):
+    """Hugging Face causal LM loaded from Settings.model_path"""
+
+    name = "transformers"
+    capabilities = {
+        "streaming": True,
+        "batching": True,
+        "scheduler": True
+    }
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.tokenizer = None
+        self.quantization = settings.model_quantization
+        self.threads = {}
+        # Quantized kernels are CPU-only
+        use_cuda = torch.cuda.is_available() and self.quantization == "none"
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+
+    def load(self):
+        self.threads = configure_threads(self.settings.torch_threads, self.settings.torch_interop_threads)
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.settings.model_path)
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        model = transformers.AutoModelForCausalLM.from_pretrained(self.settings.model_path)
+        self.model = quantize(model.to(self.device).eval(), self.quantization)
+        if self.settings.draft_model_path:
+            draft = transformers.AutoModelForCausalLM.from_pretrained(self.settings.draft_model_path)
+            self.draft_model = quantize(draft.to(self.device).eval(), self.quantization)
+
+    def _generate_kwargs(self, max_tokens: int, temperature: float) -> Dict:
+        return {
+            "max_new_tokens": max_tokens,
+            "temperature": temperature if temperature > 0 else None,
+            "do_sample": temperature > 0,
+            "pad_token_id": self.tokenizer.pad_token_id
+        }
+
+    def generate(self, prompt: str, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        return self.generate_batch([prompt], max_tokens, temperature)[0]
+
+    def generate_batch(self, prompts: List[str], max_tokens: int = 100,
+                       temperature: float = 0.7) -> List[str]:
+        # Left padding keeps every prompt's last token at the same position
+        self.tokenizer.padding_side = "left"
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        with torch.inference_mode():
+            output = self.model.generate(**inputs, **self._generate_kwargs(max_tokens, temperature))
+        prompt_len = inputs["input_ids"].shape[-1]
+        return self.tokenizer.batch_decode(output[:, prompt_len:], skip_special_tokens=True)
+
+    async def stream(self, prompt: str, max_tokens: int = 100,
+                     temperature: float = 0.7) -> AsyncIterator[str]:
+        streamer = transformers.TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+
+        def run():
+            with torch.inference_mode():
+                self.model.generate(**inputs, **self._generate_kwargs(max_tokens, temperature),
+                                    streamer=streamer)
+
+        threading.Thread(target=run, name="rahl-backend-stream", daemon=True).start()
+        loop = asyncio.get_running_loop()
+        while True:
+            text = await loop.run_in_executor(None, next, streamer, None)
+            if text is None:
+                return
+            if text:
+                yield text
+
+    def get_info(self) -> Dict:
+        return {
+            **super().get_info(),
+            "model_path": self.settings.model_path,
+            "device": str(self.device),
+            "quantization": self.quantization,
+            "draft_model_path": self.settings.draft_model_path,
+            **self.threads,
+            "parameters": sum(p.numel() for p in self.model.parameters()) if self.model else 0
+        }
+
+    def unload(self):
+        self.model = None
+        self.draft_model = None
+        self.tokenizer = None
@@ -2,18 +2,72 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
-from simple_ai import SimpleRahlAI
+from typing import AsyncIterator, Dict, List, Optional
+
+from models.backends import create_backend
+from models.backends.base import ModelBackend
+from config.settings import get_settings
+
+settings = get_settings()
 
 class RahlModel:
-    def __init__(self):
-        self.ai = None
-        
+    def __init__(self, backend: Optional[str] = None):
+        self.backend_name = backend or settings.model_backend
+        self.backend: Optional[ModelBackend] = None
+        self.version = "1.0.0"
+
     def load(self):
-        print("🚀 Initializing Rahl AI Core...")
-        self.ai = SimpleRahlAI()
+        print(f"🚀 Initializing Rahl AI Core ({self.backend_name} backend)...")
+        self.backend = create_backend(self.backend_name, settings)
+        self.backend.load()
         print("✅ Rahl AI Ready")
-    
-    def generate(self, input_text, max_length=100):
-        if self.ai is None:
+
+    @property
+    def model(self):
+        return self.backend.model if self.backend else None
+
+    @property
+    def draft_model(self):
+        return getattr(self.backend, "draft_model", None) if self.backend else None
+
+    @property
+    def tokenizer(self):
+        return self.backend.tokenizer if self.backend else None
+
+    @property
+    def device(self):
+        return self.backend.device if self.backend else None
+
+    @property
+    def capabilities(self) -> Dict[str, bool]:
+        return dict(self.backend.capabilities) if self.backend else {}
+
+    def generate(self, input_text, max_length=100, temperature=0.7):
+        if self.backend is None:
+            self.load()
+        return self.backend.generate(input_text, max_tokens=max_length, temperature=temperature)
+
+    def generate_batch(self, prompts: List[str], max_length=100, temperature=0.7) -> List[str]:
+        if self.backend is None:
+            self.load()
+        return self.backend.generate_batch(prompts, max_tokens=max_length, temperature=temperature)
+
+    def stream(self, input_text, max_length=100, temperature=0.7) -> AsyncIterator[str]:
+        if self.backend is None:
             self.load()
-        return self.ai.generate(input_text)
+        return self.backend.stream(input_text, max_tokens=max_length, temperature=temperature)
+
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+
+    def get_info(self) -> Dict:
+        return {
+            "name": "rahl-sovereign",
+            "version": self.version,
+            **(self.backend.get_info() if self.backend else {"backend": self.backend_name})
+        }
+
+    def unload(self):
+        if self.backend:
+            self.backend.unload()
+            self.backend = None